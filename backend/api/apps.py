@@ -0,0 +1,32 @@
+import threading
+
+from django.apps import AppConfig
+from django.conf import settings
+
+
+class ApiConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'api'
+
+    def ready(self):
+        # Optionally load models in the background so the server starts
+        # accepting connections immediately; /api/ready/ reports progress
+        if settings.WARMUP_ON_STARTUP:
+            from .services import model_registry
+
+            # Set before the thread starts so the first probe already sees it
+            model_registry.set_warmup_state('warming')
+            threading.Thread(target=self._warm_up, name='warmup', daemon=True).start()
+
+    @staticmethod
+    def _warm_up():
+        from .services import model_registry
+
+        try:
+            from . import views
+
+            views.warm_up()
+        except Exception as e:
+            print(f"Error warming up models: {e}")
+            # Also covers failures before warm_up ran (e.g. importing views)
+            model_registry.set_warmup_state('failed')
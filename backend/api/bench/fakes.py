@@ -0,0 +1,347 @@
+"""
+Local stand-ins for Gemini, Google Translate, the embedding model and image
+scraping, used to benchmark the API on a machine without network access.
+
+For text processing the fakes replace the SDK clients underneath the
+services (not the services themselves), so caching, batching, the upstream
+governor and the timing spans all run as they do in production. Each fake
+sleeps for a latency drawn from its configured distribution and fails at its
+configured rates.
+
+The image job is the exception: FakeImages replaces the whole job, so the
+browser pool, downloads, the image store, photo ranking and the description
+cache are not exercised, and image-path timings are synthetic (only the
+configured scrape and rank latencies).
+"""
+import asyncio
+import copy
+import hashlib
+import json
+import random
+import threading
+import time
+import types
+
+import numpy as np
+
+from ..services import clients, embedding_backends
+from ..services.upstream import UpstreamGovernor, get_governor
+
+# Latencies in milliseconds. 'throttle_rate' fails calls with a 429 and
+# 'error_rate' with a 503, both of which the upstream governor retries.
+DEFAULT_PROFILE = {
+    'gemini': {
+        'latency': {'distribution': 'lognormal', 'median_ms': 600, 'sigma': 0.4},
+        'error_rate': 0.0,
+        'throttle_rate': 0.0,
+    },
+    'translate': {
+        'latency': {'distribution': 'lognormal', 'median_ms': 120, 'sigma': 0.3},
+        'error_rate': 0.0,
+    },
+    'embedding': {
+        # Per batch, plus per text in the batch
+        'latency': {'distribution': 'fixed', 'median_ms': 15},
+        'per_text_ms': 4,
+    },
+    'scrape': {
+        'latency': {'distribution': 'lognormal', 'median_ms': 3000, 'sigma': 0.3},
+        'error_rate': 0.0,
+    },
+    'rank': {
+        'latency': {'distribution': 'lognormal', 'median_ms': 1500, 'sigma': 0.3},
+        'error_rate': 0.0,
+    },
+}
+
+
+def load_profile(overrides=None):
+    """
+    Return DEFAULT_PROFILE with the given overrides merged in, one level
+    deep per upstream (e.g. {'gemini': {'error_rate': 0.05}}).
+    """
+    profile = copy.deepcopy(DEFAULT_PROFILE)
+    for upstream, settings in (overrides or {}).items():
+        if upstream not in profile:
+            raise ValueError(f"Unknown upstream '{upstream}', expected one of {', '.join(profile)}")
+        profile[upstream].update(settings)
+    return profile
+
+
+class Latency:
+    """
+    Latency distribution: 'fixed', 'uniform' (median_ms +/- spread_ms) or
+    'lognormal' (median_ms with shape sigma, giving a realistic long tail).
+    """
+
+    def __init__(self, distribution='fixed', median_ms=0, sigma=0.5, spread_ms=0):
+        self.distribution = distribution
+        self.median = median_ms / 1000
+        self.sigma = sigma
+        self.spread = spread_ms / 1000
+        self._random = random.Random()
+        self._lock = threading.Lock()
+
+    def sample(self) -> float:
+        """
+        Returns:
+            float: Seconds
+        """
+        with self._lock:
+            if self.distribution == 'fixed':
+                return self.median
+            if self.distribution == 'uniform':
+                return max(0.0, self._random.uniform(self.median - self.spread, self.median + self.spread))
+            if self.distribution == 'lognormal':
+                return self._random.lognormvariate(np.log(max(self.median, 1e-6)), self.sigma)
+        raise ValueError(f"Unknown latency distribution '{self.distribution}'")
+
+
+class FakeUpstreamError(Exception):
+    """
+    Error raised by the fakes, carrying an HTTP status like the SDK errors.
+    """
+
+    def __init__(self, message, code):
+        super().__init__(message)
+        self.code = code
+
+
+class _Upstream:
+    def __init__(self, name, config):
+        self.name = name
+        self.latency = Latency(**config.get('latency', {}))
+        self.error_rate = config.get('error_rate', 0.0)
+        self.throttle_rate = config.get('throttle_rate', 0.0)
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def outcome(self):
+        """
+        Count a call and pick its latency and error (or None).
+        """
+        with self._lock:
+            self.calls += 1
+        roll = random.random()
+        if roll < self.throttle_rate:
+            error = FakeUpstreamError(f"{self.name}: quota exceeded", 429)
+        elif roll < self.throttle_rate + self.error_rate:
+            error = FakeUpstreamError(f"{self.name}: service unavailable", 503)
+        else:
+            error = None
+        return self.latency.sample(), error
+
+    def call(self, result):
+        delay, error = self.outcome()
+        time.sleep(delay)
+        if error is not None:
+            raise error
+        return result
+
+    async def acall(self, result):
+        delay, error = self.outcome()
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        return result
+
+
+class FakeGeminiModel:
+    """
+    Stands in for google.generativeai.GenerativeModel. Answers similarity
+    prompts with a score, schema-constrained prompts with the combined JSON
+    object and anything else with a short text.
+    """
+
+    def __init__(self, config):
+        self.upstream = _Upstream('gemini', config)
+
+    def _response(self, prompt, generation_config=None):
+        if generation_config and 'response_schema' in generation_config:
+            fields = generation_config['response_schema']['properties']
+            text = json.dumps({field: f"Simplified ({field}) text." for field in fields})
+        elif 'semantic similarity' in prompt:
+            text = f"{random.uniform(0.6, 0.95):.2f}"
+        else:
+            text = "A plain language version of the message."
+        return types.SimpleNamespace(text=text)
+
+    def generate_content(self, prompt, generation_config=None, stream=False):
+        response = self.upstream.call(self._response(prompt, generation_config))
+        if stream:
+            return iter([types.SimpleNamespace(text=word + " ") for word in response.text.split()])
+        return response
+
+    async def generate_content_async(self, prompt, generation_config=None):
+        return await self.upstream.acall(self._response(prompt, generation_config))
+
+
+class FakeTranslateClient:
+    """
+    Stands in for google.cloud.translate_v2.Client.
+    """
+
+    def __init__(self, config):
+        self.upstream = _Upstream('translate', config)
+
+    def translate(self, values, target_language='en'):
+        return self.upstream.call([
+            {'translatedText': f"[{target_language}] {value}"} for value in values
+        ])
+
+
+class FakeEmbeddingBackend:
+    """
+    Embedding backend returning deterministic vectors derived from a hash
+    of each text. Registered as the 'fake' backend while fakes are installed.
+    """
+
+    name = 'fake'
+    DIMENSIONS = 768
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+        self.model = None
+        self.configure(DEFAULT_PROFILE['embedding'])
+
+    def configure(self, config):
+        self.latency = Latency(**config.get('latency', {}))
+        self.per_text = config.get('per_text_ms', 0) / 1000
+
+    # Every vector shares this direction, so unrelated texts still score
+    # around 0.6 like real paraphrases do (inside the 'balanced' band)
+    SHARED = np.random.default_rng(0).standard_normal(DIMENSIONS)
+
+    def encode(self, texts) -> np.ndarray:
+        time.sleep(self.latency.sample() + self.per_text * len(texts))
+        vectors = [
+            self.SHARED + 0.8 * np.random.default_rng(
+                int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:16], 16)
+            ).standard_normal(self.DIMENSIONS)
+            for text in texts
+        ]
+        return np.asarray(vectors, dtype=np.float32)
+
+
+class FakeImages:
+    """
+    Stands in for the whole image job (api.views.scrape_images): scraping
+    and ranking each take their configured latency, without running
+    PhotoExtractor, BrowserPool, ImageStore or PhotoRanker. Replacing the
+    job function itself means jobs still queued when the fakes are removed
+    stay fake.
+    """
+
+    def __init__(self, scrape_config, rank_config):
+        self.scrape_upstream = _Upstream('scrape', scrape_config)
+        self.rank_upstream = _Upstream('rank', rank_config)
+
+    def scrape(self, search_query="Doctor", timeout_duration=10):
+        manifest_id = hashlib.sha256(search_query.encode("utf-8")).hexdigest()[:16]
+        return self.scrape_upstream.call({
+            'manifest_id': manifest_id,
+            'images': [{'path': f"image_{manifest_id}_{index}.jpg"} for index in range(4)],
+        })
+
+    def rank(self, original_prompt, manifest_id):
+        return self.rank_upstream.call([
+            {'path': f"image_{manifest_id}_{index}.jpg", 'similarity': 0.9 - index / 10}
+            for index in range(4)
+        ])
+
+    def scrape_images(self, original_text, simple_idea=None):
+        search_query = simple_idea or original_text[:40]
+        scraped = self.scrape(search_query)
+        return {
+            'search_query': search_query,
+            'manifest_id': scraped['manifest_id'],
+            'images': self.rank(original_text, scraped['manifest_id']),
+        }
+
+
+class InstalledFakes:
+    """
+    Fakes swapped into the shared clients and the view's service
+    singletons by install_fakes().
+    Call restore() to put the real clients back.
+    """
+
+    def __init__(self, views, profile, disable_caches=True, rate_limits=False):
+        self.views = views
+        self.profile = profile
+        self._patches = []
+
+        self.gemini = FakeGeminiModel(profile['gemini'])
+        self.translate = FakeTranslateClient(profile['translate'])
+        self.images = FakeImages(profile['scrape'], profile['rank'])
+
+        self._patch(clients, 'get_gemini_model', lambda model_name: self.gemini)
+        self._patch(clients, 'get_translate_client', lambda: self.translate)
+        self._patch(views, 'scrape_images', self.images.scrape_images)
+
+        if not rate_limits:
+            # Same adaptive concurrency and retries, but no quota, so the
+            # run measures this code rather than the configured RPM
+            shared = get_governor()
+            governor = UpstreamGovernor(
+                initial_concurrency=shared.initial_concurrency,
+                min_concurrency=shared.min_concurrency,
+                max_concurrency=shared.max_concurrency,
+                max_attempts=shared.max_attempts,
+                backoff_base=shared.backoff_base,
+                backoff_max=shared.backoff_max,
+            )
+            for service in (views.simplify_message, views.text_similarity, views.photo_ranker):
+                self._patch(service, 'governor', governor)
+
+        embedding_backends.BACKENDS[FakeEmbeddingBackend.name] = FakeEmbeddingBackend
+        self._patch(views.text_similarity, 'backend_name', FakeEmbeddingBackend.name)
+        views.text_similarity.backend.configure(profile['embedding'])
+
+        if disable_caches:
+            for cache in (views.simplify_message.response_cache, views.translate_message.response_cache,
+                          views.segment_cache):
+                self._patch(cache, 'enabled', False)
+
+    def _patch(self, target, attribute, value):
+        missing = object()
+        self._patches.append((target, attribute, target.__dict__.get(attribute, missing), missing))
+        setattr(target, attribute, value)
+
+    def calls(self) -> dict:
+        """
+        Number of calls each fake upstream received.
+        """
+        return {
+            'gemini': self.gemini.upstream.calls,
+            'translate': self.translate.upstream.calls,
+            'scrape': self.images.scrape_upstream.calls,
+            'rank': self.images.rank_upstream.calls,
+        }
+
+    def restore(self):
+        for target, attribute, original, missing in reversed(self._patches):
+            if original is missing:
+                delattr(target, attribute)
+            else:
+                setattr(target, attribute, original)
+        self._patches = []
+        embedding_backends.BACKENDS.pop(FakeEmbeddingBackend.name, None)
+
+
+def install_fakes(views, profile=None, disable_caches=True, rate_limits=False):
+    """
+    Replace every upstream client used by the views with a local fake.
+
+    Args:
+        views (module): api.views, whose service singletons are patched
+        profile (dict, optional): Latency and error settings, see
+            DEFAULT_PROFILE and load_profile
+        disable_caches (bool): Turn the response caches off so every request
+            reaches the fakes
+        rate_limits (bool): Keep the configured per-model RPM limits
+
+    Returns:
+        InstalledFakes: Handle with call counts and restore()
+    """
+    return InstalledFakes(views, profile or load_profile(), disable_caches, rate_limits)
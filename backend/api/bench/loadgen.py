@@ -0,0 +1,265 @@
+"""
+In-process load generator for the API endpoints.
+
+Requests go through Django's full request handling (middleware included) via
+the test clients, without a network in between. Each concurrency level sends
+a fixed number of requests and reports latency percentiles and throughput;
+results can be saved as a JSON baseline and compared with a later run.
+"""
+import asyncio
+import itertools
+import json
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+SAMPLE_TEXTS = [
+    "Patient has hypertension and may require antihypertensive therapy to reduce the risk of myocardial infarction.",
+    "We will schedule an MRI to evaluate potential meniscal degeneration in your knee joint.",
+    "The imaging shows a localized malignant neoplasm in the left lung lobe, requiring biopsy for confirmation.",
+    "The patient has a mild case of pneumonia and is being treated with antibiotics.",
+    "Take one tablet by mouth twice daily with food for ten days.",
+    "Your HbA1c is elevated, indicating poorly controlled type 2 diabetes mellitus.",
+]
+
+ENDPOINTS = {
+    'process': '/api/process/',
+    'async': '/api/process/async/',
+    'stream': '/api/process/stream/',
+    'batch': '/api/process/batch/',
+}
+
+MODES = ('all', 'single', 'client')
+
+BASELINE_VERSION = 1
+
+
+def build_body(endpoint, mode, index, unique=True):
+    """
+    Request body for the index-th request. With unique, every request gets
+    its own text so neither the caches nor request coalescing kick in.
+    """
+    text = SAMPLE_TEXTS[index % len(SAMPLE_TEXTS)]
+    if unique:
+        text = f"{text} (request {index})"
+    body = {
+        'language': 'es',
+        'process_all_levels': mode == 'all',
+        'is_client_mode': mode == 'client',
+        'level': 'easy',
+    }
+    if endpoint == 'batch':
+        body['messages'] = [
+            f"{sentence} (request {index})" if unique else sentence for sentence in SAMPLE_TEXTS
+        ]
+    else:
+        body['text'] = text
+    return body
+
+
+def summarize(latencies, errors, elapsed):
+    """
+    Returns:
+        dict: Request count, error rate, throughput and latency percentiles
+    """
+    count = len(latencies)
+    stats = {
+        'requests': count,
+        'errors': errors,
+        'error_rate': errors / count if count else 0.0,
+        'rps': count / elapsed if elapsed else 0.0,
+        'elapsed_seconds': elapsed,
+    }
+    if latencies:
+        milliseconds = np.asarray(latencies) * 1000
+        stats.update(
+            p50_ms=float(np.percentile(milliseconds, 50)),
+            p95_ms=float(np.percentile(milliseconds, 95)),
+            p99_ms=float(np.percentile(milliseconds, 99)),
+            mean_ms=float(milliseconds.mean()),
+            max_ms=float(milliseconds.max()),
+        )
+    return stats
+
+
+def _has_error(value):
+    """
+    Whether a response body, or anything nested in it (per-level
+    translations, batch results, segments), reports an error.
+    """
+    if isinstance(value, dict):
+        if value.get('status') == 'error' or value.get('event') == 'error':
+            return True
+        value = list(value.values())
+    if isinstance(value, list):
+        return any(_has_error(item) for item in value)
+    return False
+
+
+def _failed(status_code, content):
+    if status_code >= 400:
+        return True
+    try:
+        return _has_error(json.loads(content))
+    except ValueError:
+        # Streamed NDJSON, one event per line
+        return any(_has_error(json.loads(line)) for line in content.splitlines() if line.strip())
+
+
+def run_level_threads(endpoint, mode, concurrency, requests, unique=True):
+    """
+    Send requests from concurrency threads, each with its own test client.
+    """
+    from django.test import Client
+
+    path = ENDPOINTS[endpoint]
+    indexes = itertools.count()
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def worker():
+        client = Client()
+        while True:
+            index = next(indexes)
+            if index >= requests:
+                return
+            body = json.dumps(build_body(endpoint, mode, index, unique))
+            started = time.perf_counter()
+            try:
+                response = client.post(path, body, content_type='application/json')
+                content = (
+                    b"".join(response.streaming_content) if response.streaming else response.content
+                )
+                failed = _failed(response.status_code, content)
+            except Exception as e:
+                print(f"Error sending benchmark request: {e}")
+                failed = True
+            duration = time.perf_counter() - started
+            with lock:
+                latencies.append(duration)
+                errors[0] += failed
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, errors[0], time.perf_counter() - started)
+
+
+def run_level_async(endpoint, mode, concurrency, requests, unique=True):
+    """
+    Send requests from concurrency tasks on one event loop, which is how an
+    ASGI worker serves the async endpoint.
+    """
+    from django.test import AsyncClient
+
+    path = ENDPOINTS[endpoint]
+
+    async def main():
+        client = AsyncClient()
+        indexes = itertools.count()
+        latencies = []
+        errors = 0
+
+        async def worker():
+            nonlocal errors
+            while True:
+                index = next(indexes)
+                if index >= requests:
+                    return
+                body = json.dumps(build_body(endpoint, mode, index, unique))
+                started = time.perf_counter()
+                try:
+                    response = await client.post(path, body, content_type='application/json')
+                    failed = _failed(response.status_code, response.content)
+                except Exception as e:
+                    print(f"Error sending benchmark request: {e}")
+                    failed = True
+                latencies.append(time.perf_counter() - started)
+                errors += failed
+
+        started = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        return summarize(latencies, errors, time.perf_counter() - started)
+
+    return asyncio.run(main())
+
+
+def run_benchmark(endpoint='process', mode='all', concurrency_levels=(1, 4, 16), requests=50, unique=True):
+    """
+    Run every concurrency level in turn, after one unrecorded warm-up request.
+
+    Returns:
+        list: summarize() output of each level, with its 'concurrency'
+    """
+    if endpoint not in ENDPOINTS:
+        raise ValueError(f"Unknown endpoint '{endpoint}', expected one of {', '.join(ENDPOINTS)}")
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode '{mode}', expected one of {', '.join(MODES)}")
+    run_level = run_level_async if endpoint == 'async' else run_level_threads
+
+    run_level(endpoint, mode, 1, 1, unique=False)
+    results = []
+    for concurrency in concurrency_levels:
+        stats = run_level(endpoint, mode, concurrency, requests, unique)
+        results.append({'concurrency': concurrency, **stats})
+    return results
+
+
+def make_baseline(results, endpoint, mode, requests, profile, upstream_calls=None):
+    return {
+        'version': BASELINE_VERSION,
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'endpoint': endpoint,
+        'mode': mode,
+        'requests_per_level': requests,
+        'profile': profile,
+        'upstream_calls': upstream_calls or {},
+        'results': results,
+    }
+
+
+def compare(current, baseline, max_regression=0.15):
+    """
+    Compare a run with a baseline, level by level.
+
+    Args:
+        current (dict): Baseline-shaped result of this run
+        baseline (dict): Earlier baseline
+        max_regression (float): Allowed relative p95 increase or RPS drop
+
+    Returns:
+        tuple: (rows, regressions) where rows holds the per-level deltas
+            and regressions describes every level over the limit
+    """
+    if baseline.get('version') != BASELINE_VERSION:
+        raise ValueError(f"Baseline version {baseline.get('version')} is not {BASELINE_VERSION}")
+    if (baseline['endpoint'], baseline['mode']) != (current['endpoint'], current['mode']):
+        raise ValueError(
+            f"Baseline measured {baseline['endpoint']}/{baseline['mode']}, "
+            f"this run {current['endpoint']}/{current['mode']}"
+        )
+    previous = {level['concurrency']: level for level in baseline['results']}
+    rows = []
+    regressions = []
+    for level in current['results']:
+        before = previous.get(level['concurrency'])
+        if before is None or 'p95_ms' not in before or 'p95_ms' not in level:
+            continue
+        p95_change = level['p95_ms'] / before['p95_ms'] - 1 if before['p95_ms'] else 0.0
+        rps_change = level['rps'] / before['rps'] - 1 if before['rps'] else 0.0
+        rows.append({
+            'concurrency': level['concurrency'],
+            'p95_change': p95_change,
+            'rps_change': rps_change,
+        })
+        if p95_change > max_regression:
+            regressions.append(f"concurrency {level['concurrency']}: p95 up {p95_change:.1%}")
+        if rps_change < -max_regression:
+            regressions.append(f"concurrency {level['concurrency']}: requests/sec down {-rps_change:.1%}")
+    return rows, regressions
@@ -0,0 +1,113 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.bench import loadgen
+from api.bench.fakes import install_fakes, load_profile
+
+
+def scale_latencies(profile, factor):
+    """
+    Multiply every latency of a fake profile by factor.
+    """
+    for upstream in profile.values():
+        latency = upstream.get('latency', {})
+        for key in ('median_ms', 'spread_ms'):
+            if key in latency:
+                latency[key] *= factor
+        if 'per_text_ms' in upstream:
+            upstream['per_text_ms'] *= factor
+    return profile
+
+
+class Command(BaseCommand):
+    help = "Load-test an API endpoint against local upstream fakes and report latency percentiles"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--endpoint', default='process', choices=sorted(loadgen.ENDPOINTS))
+        parser.add_argument('--mode', default='all', choices=loadgen.MODES)
+        parser.add_argument('--concurrency', default='1,4,16',
+                            help="Comma separated concurrency levels")
+        parser.add_argument('--requests', type=int, default=50, help="Requests per concurrency level")
+        parser.add_argument('--profile', help="JSON file overriding the fake latency and error settings")
+        parser.add_argument('--latency-scale', type=float, default=1.0,
+                            help="Multiply every fake latency, e.g. 0.1 for a quick run")
+        parser.add_argument('--keep-caches', action='store_true',
+                            help="Leave the response caches on (requests still use distinct texts)")
+        parser.add_argument('--keep-rate-limits', action='store_true',
+                            help="Apply the UPSTREAM_GOVERNOR requests-per-minute quotas to the fakes")
+        parser.add_argument('--output', help="Write the results to this JSON baseline file")
+        parser.add_argument('--baseline', help="Compare with this JSON baseline file")
+        parser.add_argument('--max-regression', type=float, default=0.15,
+                            help="Fail when p95 rises or requests/sec falls by more than this fraction")
+
+    def handle(self, *args, **options):
+        from api import views
+
+        try:
+            concurrency_levels = [int(level) for level in options['concurrency'].split(',')]
+        except ValueError:
+            raise CommandError("--concurrency must be a comma separated list of integers")
+
+        overrides = {}
+        if options['profile']:
+            with open(options['profile']) as f:
+                overrides = json.load(f)
+        try:
+            profile = scale_latencies(load_profile(overrides), options['latency_scale'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        fakes = install_fakes(
+            views,
+            profile,
+            disable_caches=not options['keep_caches'],
+            rate_limits=options['keep_rate_limits'],
+        )
+        try:
+            results = loadgen.run_benchmark(
+                endpoint=options['endpoint'],
+                mode=options['mode'],
+                concurrency_levels=concurrency_levels,
+                requests=options['requests'],
+            )
+            upstream_calls = fakes.calls()
+        finally:
+            fakes.restore()
+
+        run = loadgen.make_baseline(
+            results, options['endpoint'], options['mode'], options['requests'], profile, upstream_calls
+        )
+
+        self.stdout.write(f"{options['endpoint']} ({options['mode']}), {options['requests']} requests per level")
+        self.stdout.write(f"  {'concurrency':>11} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+        for level in results:
+            self.stdout.write(
+                f"  {level['concurrency']:>11} {level['rps']:>8.2f} {level.get('p50_ms', 0):>9.1f} "
+                f"{level.get('p95_ms', 0):>9.1f} {level.get('p99_ms', 0):>9.1f} {level['errors']:>7}"
+            )
+        self.stdout.write(f"  upstream calls: {', '.join(f'{name} {count}' for name, count in upstream_calls.items())}")
+        self.stdout.write("  (image jobs are faked as a whole, so scrape and rank figures are synthetic)")
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(run, f, indent=2)
+            self.stdout.write(f"Saved baseline to {options['output']}")
+
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+            try:
+                rows, regressions = loadgen.compare(run, baseline, options['max_regression'])
+            except ValueError as e:
+                raise CommandError(str(e))
+            self.stdout.write(f"Compared with {options['baseline']} ({baseline['created_at']})")
+            if baseline.get('profile') != run['profile']:
+                self.stdout.write("  Warning: the baseline used a different fake profile")
+            for row in rows:
+                self.stdout.write(
+                    f"  concurrency {row['concurrency']:>4}: p95 {row['p95_change']:+.1%}, "
+                    f"requests/sec {row['rps_change']:+.1%}"
+                )
+            if regressions:
+                raise CommandError("Performance regressed: " + "; ".join(regressions))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from api.services.embedding_backends import BACKENDS, parity_report
+
+SAMPLE_TEXTS = [
+    "Patient has hypertension and may require antihypertensive therapy to reduce the risk of myocardial infarction.",
+    "You have high blood pressure, and we may need to give you medicine to lower it and help prevent a heart attack.",
+    "We will schedule an MRI to evaluate potential meniscal degeneration in your knee joint.",
+    "We will schedule a special scan to check if the cushion in your knee is wearing down.",
+    "The imaging shows a localized malignant neoplasm in the left lung lobe, requiring biopsy for confirmation.",
+    "The scan found a small area of cancer in your left lung. We need to do a test called a biopsy to be sure.",
+    "The patient has a mild case of pneumonia and is being treated with antibiotics.",
+    "Take one tablet by mouth twice daily with food for ten days.",
+]
+
+
+class Command(BaseCommand):
+    help = "Report cosine drift of an embedding backend against the fp32 model"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backend', default='int8', choices=sorted(BACKENDS))
+        parser.add_argument('--model', default='all-mpnet-base-v2')
+        parser.add_argument('--texts-file', help="File with one text per line (defaults to built-in samples)")
+
+    def handle(self, *args, **options):
+        texts = SAMPLE_TEXTS
+        if options['texts_file']:
+            with open(options['texts_file']) as f:
+                texts = [line.strip() for line in f if line.strip()]
+
+        report = parity_report(options['backend'], options['model'], texts)
+
+        self.stdout.write(f"Backend {report['backend']} vs torch fp32 on {report['texts']} texts ({report['model']})")
+        self.stdout.write(f"  embedding cosine   mean {report['mean_cosine']:.5f}  min {report['min_cosine']:.5f}")
+        self.stdout.write(f"  similarity drift   mean {report['mean_score_drift']:.5f}  max {report['max_score_drift']:.5f}")
+        self.stdout.write(f"  encode time        fp32 {report['reference_seconds']:.3f}s  {report['backend']} {report['candidate_seconds']:.3f}s")
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Load all models and SDK clients and print the startup-time report"
+
+    def handle(self, *args, **options):
+        from api import views
+
+        report = views.warm_up()
+
+        self.stdout.write(f"Loaded models: {', '.join(report['loaded_models'])}")
+        for timing in report['timings']:
+            self.stdout.write(f"  {timing['component']:<50} {timing['seconds']:>8.3f}s")
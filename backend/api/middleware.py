@@ -0,0 +1,155 @@
+import json
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.urls import reverse
+from django.utils.decorators import sync_and_async_middleware
+
+from .services import metrics, profiling
+
+logger = logging.getLogger('api.timing')
+
+
+@sync_and_async_middleware
+def timing_middleware(get_response):
+    """
+    Collect the timing spans of each request, report them in the
+    Server-Timing header and log them as one JSON line on the 'api.timing'
+    logger. Streaming responses only report what ran before the first byte.
+    """
+
+    def finish(request, response, spans, started):
+        total = time.perf_counter() - started
+        match = getattr(request, 'resolver_match', None)
+        view = match.url_name if match and match.url_name else 'unmatched'
+        status = response.status_code if response is not None else 500
+        metrics.REQUEST_SECONDS.observe(total, view=view, status=status)
+        if response is not None:
+            response['Server-Timing'] = metrics.server_timing(spans, total)
+        logger.info(json.dumps({
+            'event': 'request_timing',
+            'method': request.method,
+            'path': request.path,
+            'view': view,
+            'status': status,
+            'duration_ms': round(total * 1000, 1),
+            'stages': [
+                {'stage': stage, 'duration_ms': round(duration * 1000, 1), 'count': count}
+                for stage, duration, count in metrics.summarize_spans(spans)
+            ],
+        }))
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            spans, token = metrics.start_request()
+            metrics.REQUESTS_IN_FLIGHT.inc()
+            started = time.perf_counter()
+            response = None
+            try:
+                response = await get_response(request)
+                return response
+            finally:
+                metrics.REQUESTS_IN_FLIGHT.dec()
+                finish(request, response, spans, started)
+                metrics.end_request(token)
+    else:
+        def middleware(request):
+            spans, token = metrics.start_request()
+            metrics.REQUESTS_IN_FLIGHT.inc()
+            started = time.perf_counter()
+            response = None
+            try:
+                response = get_response(request)
+                return response
+            finally:
+                metrics.REQUESTS_IN_FLIGHT.dec()
+                finish(request, response, spans, started)
+                metrics.end_request(token)
+
+    return middleware
+
+
+@sync_and_async_middleware
+def profiling_middleware(get_response):
+    """
+    Profile requests that carry the profiling token or are sampled (see
+    api/services/profiling.py), and return the stored profile's ID in the
+    X-Profile-Id header. Every other request passes straight through.
+
+    Streaming responses from sync views are profiled until their body has
+    been sent. On async views the profile of the event loop thread also
+    includes whatever other requests ran on the loop meanwhile.
+
+    Under ASGI, sync views run in a thread-sensitive sync_to_async thread
+    rather than on the event loop, so that thread is profiled too: the
+    request's thread-sensitive calls all land on the same thread, which is
+    attached to the capture before the view runs and detached after.
+    """
+    profiler = profiling.get_profiler()
+
+    def trigger(request):
+        reason = profiler.trigger(request)
+        # Fetching profiles sends the token too, but is not worth profiling
+        if reason is not None and request.path.startswith(reverse('profile_list')):
+            return None
+        return reason
+
+    def details(request, response):
+        match = getattr(request, 'resolver_match', None)
+        return {
+            'method': request.method,
+            'path': request.path,
+            'view': match.url_name if match and match.url_name else 'unmatched',
+            'status': response.status_code if response is not None else 500,
+        }
+
+    def profile_stream(request, response, capture, token):
+        content = response.streaming_content
+
+        def stream():
+            try:
+                yield from content
+            finally:
+                profiler.end(capture, token, details(request, response))
+
+        response.streaming_content = stream()
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            reason = trigger(request)
+            if reason is None:
+                return await get_response(request)
+            capture, token = profiler.begin(reason)
+            view_profile = await sync_to_async(capture.attach, thread_sensitive=True)()
+            response = None
+            try:
+                response = await get_response(request)
+            finally:
+                await sync_to_async(capture.detach, thread_sensitive=True)(view_profile)
+                profile_id = profiler.end(capture, token, details(request, response))
+            if profile_id is not None:
+                response['X-Profile-Id'] = profile_id
+            return response
+    else:
+        def middleware(request):
+            reason = trigger(request)
+            if reason is None:
+                return get_response(request)
+            capture, token = profiler.begin(reason)
+            response = None
+            try:
+                response = get_response(request)
+            except BaseException:
+                profiler.end(capture, token, details(request, response))
+                raise
+            if response.streaming and not response.is_async:
+                profile_stream(request, response, capture, token)
+                response['X-Profile-Id'] = capture.id
+                return response
+            profile_id = profiler.end(capture, token, details(request, response))
+            if profile_id is not None:
+                response['X-Profile-Id'] = profile_id
+            return response
+
+    return middleware
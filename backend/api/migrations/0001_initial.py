@@ -0,0 +1,26 @@
+# Generated by Django 5.1.7 on 2026-10-18 17:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('namespace', models.CharField(db_index=True, max_length=64)),
+                ('value', models.TextField()),
+                ('size', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField()),
+                ('last_accessed', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.7 on 2026-10-18 17:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageDescription',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('phash', models.CharField(max_length=16, unique=True)),
+                ('description', models.TextField()),
+                ('embedding', models.BinaryField(null=True)),
+                ('embedding_model', models.CharField(blank=True, max_length=128)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
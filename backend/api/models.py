@@ -0,0 +1,34 @@
+from django.db import models
+
+
+class CacheEntry(models.Model):
+    """
+    Durable tier of the response cache (see services/response_cache.py).
+    Values are stored JSON encoded and looked up by a content-addressed key.
+    """
+    key = models.CharField(max_length=64, unique=True)
+    namespace = models.CharField(max_length=64, db_index=True)
+    value = models.TextField()
+    size = models.PositiveIntegerField()
+    created_at = models.DateTimeField()
+    last_accessed = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.namespace}:{self.key}"
+
+
+class ImageDescription(models.Model):
+    """
+    AI description of an image, keyed by the image's perceptual hash so
+    re-encoded or resized copies of the same picture share one entry
+    (see services/image_descriptions.py).
+    """
+    phash = models.CharField(max_length=16, unique=True)
+    description = models.TextField()
+    # float32 embedding of the description and the backend:model it came from
+    embedding = models.BinaryField(null=True)
+    embedding_model = models.CharField(max_length=128, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.phash}: {self.description[:50]}"
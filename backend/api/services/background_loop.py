@@ -0,0 +1,53 @@
+import asyncio
+import atexit
+import threading
+
+
+class BackgroundLoop:
+    """
+    An asyncio event loop running forever in a daemon thread.
+
+    Async clients (Playwright, aiohttp sessions, the async Gemini client) are
+    bound to the loop that created them, so long-lived ones are created and
+    used on this loop, and synchronous code hands coroutines to it with run().
+    """
+
+    def __init__(self, name='background-loop'):
+        self.name = name
+        self._loop = None
+        self._lock = threading.Lock()
+        self._shutdown_hooks = []
+
+    @property
+    def loop(self):
+        if self._loop is None:
+            with self._lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    threading.Thread(target=loop.run_forever, name=self.name, daemon=True).start()
+                    self._loop = loop
+                    atexit.register(self.shutdown)
+        return self._loop
+
+    def run(self, coro, timeout=None):
+        """
+        Run a coroutine on the loop and wait for its result.
+        """
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        return future.result(timeout)
+
+    def on_shutdown(self, hook):
+        """
+        Register a coroutine function awaited on the loop at process exit.
+        """
+        self._shutdown_hooks.append(hook)
+
+    def shutdown(self):
+        if self._loop is None or not self._loop.is_running():
+            return
+        for hook in self._shutdown_hooks:
+            try:
+                self.run(hook(), timeout=10)
+            except Exception as e:
+                print(f"Error shutting down {self.name}: {e}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
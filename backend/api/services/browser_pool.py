@@ -0,0 +1,170 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+from . import metrics, model_registry
+from .background_loop import BackgroundLoop
+
+
+class BrowserPool:
+    """
+    Long-lived headless Chromium shared by all scraping jobs.
+
+    Playwright objects are bound to the event loop that created them, so the
+    pool lives on a BackgroundLoop and callers hand coroutines to it with
+    run(). Pages are opened in isolated
+    browser contexts drawn from a bounded pool; a context is recycled after
+    max_context_uses pages, after max_context_age seconds, or as soon as a
+    page opened in it fails. The browser is relaunched if it disconnects.
+    """
+
+    def __init__(self, max_contexts=4, max_pages=4, max_context_uses=50, max_context_age=600, headless=True,
+                 background_loop=None):
+        self.max_contexts = max_contexts
+        self.max_pages = max_pages
+        self.max_context_uses = max_context_uses
+        self.max_context_age = max_context_age
+        self.headless = headless
+
+        self.background_loop = background_loop or BackgroundLoop('browser-pool')
+        self.background_loop.on_shutdown(self.close)
+        self._playwright = None
+        self._browser = None
+        self._browser_lock = None
+        self._idle_contexts = None
+        # Notified whenever a context is returned or closed, so a page
+        # waiting for one can take it or open a new context in its slot
+        self._contexts_changed = None
+        self._page_slots = None
+        self._open_contexts = 0
+
+    def run(self, coro, timeout=None):
+        """
+        Run a coroutine on the pool's event loop and wait for its result.
+        """
+        return self.background_loop.run(coro, timeout)
+
+    async def start(self):
+        """
+        Launch the browser if it is not running. Must run on the pool loop.
+        """
+        if self._browser_lock is None:
+            self._browser_lock = asyncio.Lock()
+            self._idle_contexts = asyncio.Queue()
+            self._contexts_changed = asyncio.Condition()
+            self._page_slots = asyncio.Semaphore(self.max_pages)
+
+        async with self._browser_lock:
+            if self._browser is not None and self._browser.is_connected():
+                return self._browser
+
+            if self._browser is not None:
+                print("Browser disconnected, relaunching")
+                await self._discard_contexts()
+
+            if self._playwright is None:
+                async_api = model_registry.import_module('playwright.async_api')
+                self._playwright = await async_api.async_playwright().start()
+            self._browser = await self._playwright.chromium.launch(headless=self.headless)
+            return self._browser
+
+    @asynccontextmanager
+    async def page(self):
+        """
+        Open a page in a pooled context, limited to max_pages at a time.
+        """
+        await self.start()
+        async with self._page_slots:
+            entry = await self._acquire_context()
+            page = None
+            try:
+                page = await entry['context'].new_page()
+                yield page
+            except Exception:
+                entry['healthy'] = False
+                raise
+            finally:
+                if page is not None:
+                    try:
+                        await page.close()
+                    except Exception:
+                        entry['healthy'] = False
+                await self._release_context(entry)
+
+    @metrics.timed('browser_pool.acquire_context')
+    async def _acquire_context(self):
+        while True:
+            entry = None
+            async with self._contexts_changed:
+                # Wait until a context is idle or a slot is free to open one
+                # (a closed context frees its slot, see _close_context)
+                while self._idle_contexts.empty() and self._open_contexts >= self.max_contexts:
+                    await self._contexts_changed.wait()
+                if not self._idle_contexts.empty():
+                    entry = self._idle_contexts.get_nowait()
+                else:
+                    self._open_contexts += 1
+
+            if entry is None:
+                try:
+                    context = await self._browser.new_context()
+                except Exception:
+                    self._open_contexts -= 1
+                    await self._notify_contexts_changed()
+                    raise
+                entry = {
+                    'context': context,
+                    'browser': self._browser,
+                    'created_at': time.monotonic(),
+                    'uses': 0,
+                    'healthy': True,
+                }
+
+            if self._is_reusable(entry):
+                entry['uses'] += 1
+                return entry
+            await self._close_context(entry)
+
+    async def _release_context(self, entry):
+        if self._is_reusable(entry) and entry['uses'] < self.max_context_uses:
+            self._idle_contexts.put_nowait(entry)
+            await self._notify_contexts_changed()
+        else:
+            await self._close_context(entry)
+
+    async def _notify_contexts_changed(self):
+        async with self._contexts_changed:
+            self._contexts_changed.notify()
+
+    def _is_reusable(self, entry):
+        return (
+            entry['healthy']
+            and entry['browser'] is self._browser
+            and self._browser.is_connected()
+            and time.monotonic() - entry['created_at'] < self.max_context_age
+        )
+
+    async def _close_context(self, entry):
+        self._open_contexts -= 1
+        await self._notify_contexts_changed()
+        try:
+            await entry['context'].close()
+        except Exception as e:
+            print(f"Error closing browser context: {e}")
+
+    async def _discard_contexts(self):
+        while not self._idle_contexts.empty():
+            await self._close_context(self._idle_contexts.get_nowait())
+
+    async def close(self):
+        """
+        Close every context, the browser and Playwright.
+        """
+        if self._idle_contexts is not None:
+            await self._discard_contexts()
+        if self._browser is not None:
+            await self._browser.close()
+            self._browser = None
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
@@ -0,0 +1,103 @@
+"""
+Process-wide Gemini and Google Translate clients.
+
+Every client is created once, on first use or by warm_up, and shared by all
+services and threads, so requests no longer re-read .env, reconfigure the
+SDK or open fresh connections:
+
+- google.generativeai talks gRPC over one long-lived HTTP/2 channel that
+  multiplexes concurrent calls.
+- google.genai.Client keeps its own pooled httpx client (and an aiohttp
+  session per event loop for .aio calls).
+- The Translate client gets an authorized requests session whose
+  connection pool is sized for the worker pools (requests keeps only 10
+  connections per host by default, so busier pools kept re-handshaking).
+
+Clients are registered in the model registry, so their creation time shows
+up in the startup report.
+"""
+import os
+import threading
+
+from django.conf import settings
+from dotenv import load_dotenv
+from . import model_registry
+
+_env_loaded = False
+_env_lock = threading.Lock()
+
+
+def load_environment():
+    """
+    Load .env into the environment, once per process.
+    """
+    global _env_loaded
+    with _env_lock:
+        if not _env_loaded:
+            load_dotenv()
+            _env_loaded = True
+
+
+def get_generativeai():
+    """
+    Return the google.generativeai module, configured with the API key.
+    """
+    def configure():
+        generativeai = model_registry.import_module('google.generativeai')
+        load_environment()
+        generativeai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+        return generativeai
+
+    return model_registry.get_or_load('client:generativeai', configure)
+
+
+def get_gemini_model(model_name):
+    """
+    Return the shared GenerativeModel for model_name.
+    """
+    return model_registry.get_or_load(
+        f"client:gemini_model:{model_name}",
+        lambda: get_generativeai().GenerativeModel(model_name),
+    )
+
+
+def get_genai_client():
+    """
+    Return the shared google.genai client.
+    """
+    def create():
+        genai = model_registry.import_module('google.genai')
+        load_environment()
+        return genai.Client()
+
+    return model_registry.get_or_load('client:genai', create)
+
+
+def get_translate_client():
+    """
+    Return the shared Translate client, authorized with the service account
+    in settings.GOOGLE_APPLICATION_CREDENTIALS or, failing that, with the
+    application default credentials.
+    """
+    def create():
+        translate = model_registry.import_module('google.cloud.translate_v2')
+        requests_transport = model_registry.import_module('google.auth.transport.requests')
+        adapters = model_registry.import_module('requests.adapters')
+
+        credentials_path = settings.GOOGLE_APPLICATION_CREDENTIALS
+        if os.path.exists(credentials_path):
+            service_account = model_registry.import_module('google.oauth2.service_account')
+            credentials = service_account.Credentials.from_service_account_file(
+                credentials_path, scopes=translate.Client.SCOPE
+            )
+        else:
+            google_auth = model_registry.import_module('google.auth')
+            credentials, _ = google_auth.default(scopes=translate.Client.SCOPE)
+
+        session = requests_transport.AuthorizedSession(credentials)
+        pool_size = settings.UPSTREAM_HTTP_POOL_SIZE
+        session.mount('https://', adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size))
+        return translate.Client(credentials=credentials, _http=session)
+
+    return model_registry.get_or_load('client:translate', create)
+
@@ -0,0 +1,136 @@
+"""
+Embedding backends used by TextSimilarity.
+
+'torch' is the fp32 SentenceTransformer forward pass. 'int8' applies PyTorch
+dynamic int8 quantization to the model's Linear layers, and 'onnx' runs the
+model through ONNX Runtime (requires sentence-transformers[onnx]). The backend
+is selected with the EMBEDDING_BACKEND setting.
+"""
+import time
+
+import numpy as np
+from django.conf import settings
+from . import model_registry
+
+
+class TorchEmbeddingBackend:
+    name = 'torch'
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+        self.model = self.load()
+
+    def load(self):
+        # The fp32 model is shared with anything else asking the registry for it
+        return model_registry.get_sentence_transformer(self.model_name)
+
+    def encode(self, texts) -> np.ndarray:
+        """
+        Encode texts in a single batch.
+
+        Returns:
+            np.ndarray: Matrix of shape (len(texts), embedding_dim)
+        """
+        return np.asarray(self.model.encode(list(texts), convert_to_numpy=True), dtype=np.float32)
+
+
+class Int8EmbeddingBackend(TorchEmbeddingBackend):
+    name = 'int8'
+
+    def load(self):
+        torch = model_registry.import_module('torch')
+        sentence_transformers = model_registry.import_module('sentence_transformers')
+
+        model = sentence_transformers.SentenceTransformer(self.model_name, device='cpu')
+        # Quantize weights of every Linear layer to int8, activations are
+        # quantized on the fly. Done in place so the fp32 weights are freed.
+        torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        return model
+
+
+class OnnxEmbeddingBackend(TorchEmbeddingBackend):
+    name = 'onnx'
+
+    def load(self):
+        sentence_transformers = model_registry.import_module('sentence_transformers')
+        model_kwargs = {}
+        if settings.EMBEDDING_ONNX_FILE:
+            model_kwargs['file_name'] = settings.EMBEDDING_ONNX_FILE
+        return sentence_transformers.SentenceTransformer(
+            self.model_name, device='cpu', backend='onnx', model_kwargs=model_kwargs
+        )
+
+
+BACKENDS = {
+    backend.name: backend
+    for backend in (TorchEmbeddingBackend, Int8EmbeddingBackend, OnnxEmbeddingBackend)
+}
+
+
+def get_embedding_backend(name, model_name):
+    """
+    Return the shared backend instance for (name, model_name).
+
+    Args:
+        name (str): One of BACKENDS
+        model_name (str): SentenceTransformer model name
+
+    Returns:
+        TorchEmbeddingBackend: The loaded backend
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{name}', expected one of {sorted(BACKENDS)}")
+    return model_registry.get_or_load(
+        f"embedding_backend:{name}:{model_name}",
+        lambda: BACKENDS[name](model_name),
+    )
+
+
+def parity_report(name, model_name, texts):
+    """
+    Compare a backend against the fp32 torch backend on the given texts.
+
+    Reports the cosine between each text's fp32 and candidate embedding, and
+    the drift of the pairwise similarity scores TextSimilarity would return
+    (every text compared with every other text).
+
+    Returns:
+        dict: Drift statistics and encode timings for both backends
+    """
+    reference = get_embedding_backend('torch', model_name)
+    candidate = get_embedding_backend(name, model_name)
+
+    started = time.perf_counter()
+    reference_embeddings = reference.encode(texts)
+    reference_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    candidate_embeddings = candidate.encode(texts)
+    candidate_seconds = time.perf_counter() - started
+
+    def normalize(matrix):
+        return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+    reference_embeddings = normalize(reference_embeddings)
+    candidate_embeddings = normalize(candidate_embeddings)
+
+    # Cosine between the two embeddings of the same text
+    self_cosines = np.sum(reference_embeddings * candidate_embeddings, axis=1)
+
+    # Difference in the text-to-text similarity matrix
+    score_drift = np.abs(
+        reference_embeddings @ reference_embeddings.T
+        - candidate_embeddings @ candidate_embeddings.T
+    )
+
+    return {
+        'backend': name,
+        'model': model_name,
+        'texts': len(texts),
+        'mean_cosine': float(self_cosines.mean()),
+        'min_cosine': float(self_cosines.min()),
+        'mean_score_drift': float(score_drift.mean()),
+        'max_score_drift': float(score_drift.max()),
+        'reference_seconds': reference_seconds,
+        'candidate_seconds': candidate_seconds,
+    }
@@ -0,0 +1,131 @@
+import threading
+
+import numpy as np
+from PIL import Image
+
+from . import metrics
+
+
+def perceptual_hash(image_path, hash_size=8):
+    """
+    Compute a 64-bit difference hash (dHash) of an image. The image is
+    reduced to a tiny grayscale thumbnail and each bit records whether a
+    pixel is brighter than its right neighbour, so re-encoded or resized
+    copies of a picture hash to the same or nearly the same value.
+
+    Returns:
+        int: The hash as an unsigned 64-bit integer
+    """
+    with Image.open(image_path) as img:
+        thumbnail = img.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS)
+    pixels = np.asarray(thumbnail, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int("".join("1" if bit else "0" for bit in bits), 2)
+
+
+class ImageDescriptionCache:
+    """
+    Persistent cache of AI image descriptions keyed by perceptual hash.
+
+    Entries live in the ImageDescription table and are mirrored in memory.
+    A lookup matches the closest stored hash within max_distance bits, so
+    near-duplicates of a known image skip the vision call. Uses the ORM, so
+    call it from a worker thread rather than an event loop.
+    """
+
+    def __init__(self, max_distance=6):
+        self.max_distance = max_distance
+        self._lock = threading.Lock()
+        self._hashes = None
+        self._entries = []
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self):
+        from ..models import ImageDescription
+
+        with self._lock:
+            if self._hashes is not None:
+                return
+            entries = []
+            try:
+                for row in ImageDescription.objects.all().iterator():
+                    entries.append(self._entry(row))
+            except Exception as e:
+                print(f"Error loading image descriptions: {e}")
+            self._entries = entries
+            self._hashes = np.array([entry['phash'] for entry in entries], dtype=np.uint64)
+
+    @staticmethod
+    def _entry(row):
+        return {
+            'phash': int(row.phash, 16),
+            'description': row.description,
+            'embedding': np.frombuffer(bytes(row.embedding), dtype=np.float32) if row.embedding else None,
+            'embedding_model': row.embedding_model,
+        }
+
+    @metrics.timed('image_descriptions.lookup')
+    def lookup(self, phash):
+        """
+        Return the entry whose hash is nearest to phash, or None if none is
+        within max_distance bits.
+
+        Returns:
+            dict: 'description', 'embedding' and 'embedding_model', or None
+        """
+        self._load()
+        with self._lock:
+            if len(self._hashes) == 0:
+                self.misses += 1
+                return None
+            differing = np.bitwise_xor(self._hashes, np.uint64(phash))
+            distances = np.unpackbits(differing.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+            best = int(np.argmin(distances))
+            if distances[best] > self.max_distance:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return self._entries[best]
+
+    @metrics.timed('image_descriptions.store')
+    def store(self, phash, description, embedding=None, embedding_model=''):
+        """
+        Save a description (and optionally its embedding) for an image hash.
+        """
+        from ..models import ImageDescription
+
+        self._load()
+        embedding = None if embedding is None else np.asarray(embedding, dtype=np.float32)
+        try:
+            row, _ = ImageDescription.objects.update_or_create(
+                phash=f"{phash:016x}",
+                defaults={
+                    'description': description,
+                    'embedding': embedding.tobytes() if embedding is not None else None,
+                    'embedding_model': embedding_model if embedding is not None else '',
+                },
+            )
+        except Exception as e:
+            print(f"Error saving image description: {e}")
+            return
+
+        entry = self._entry(row)
+        with self._lock:
+            for idx, existing in enumerate(self._entries):
+                if existing['phash'] == phash:
+                    self._entries[idx] = entry
+                    break
+            else:
+                self._entries.append(entry)
+                self._hashes = np.append(self._hashes, np.uint64(phash))
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
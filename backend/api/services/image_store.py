@@ -0,0 +1,174 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+from . import metrics
+
+
+class ImageStore:
+    """
+    Content-addressed store for scraped images.
+
+    Every image is saved once as image_<sha256>.jpg in the images folder, no
+    matter how many requests download it, and each scrape gets its own
+    manifest listing its images. Nothing is wiped per request; instead a
+    background sweeper drops expired manifests and evicts the least recently
+    used images once the folder grows past max_bytes.
+    """
+
+    PREFIX = "image_"
+    # Images touched this recently are never evicted, which covers the window
+    # between storing an image and writing the manifest that references it
+    MIN_EVICTION_AGE = 10 * 60
+
+    def __init__(self, images_folder, metadata_folder, max_bytes, manifest_ttl, sweep_interval):
+        self.images_folder = images_folder
+        self.metadata_folder = metadata_folder
+        self.manifest_folder = os.path.join(metadata_folder, "manifests")
+        self.staging_folder = os.path.join(images_folder, "staging")
+        self.max_bytes = max_bytes
+        self.manifest_ttl = manifest_ttl
+        self.sweep_interval = sweep_interval
+        self._sweeper = None
+        self._sweeper_lock = threading.Lock()
+
+    def new_manifest_id(self):
+        return uuid.uuid4().hex
+
+    def staging_dir(self, manifest_id):
+        """
+        Return a private folder where a scrape can download its files
+        before they are added to the store.
+        """
+        path = os.path.join(self.staging_folder, manifest_id)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def discard_staging(self, manifest_id):
+        shutil.rmtree(os.path.join(self.staging_folder, manifest_id), ignore_errors=True)
+
+    @metrics.timed('image_store.add_file')
+    def add_file(self, path):
+        """
+        Move a downloaded JPG into the store under its content hash. If the
+        same image is already stored the new copy is dropped.
+
+        Returns:
+            str: Path of the stored image
+        """
+        self.start_sweeper()
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(64 * 1024), b""):
+                digest.update(chunk)
+
+        stored_path = os.path.join(self.images_folder, f"{self.PREFIX}{digest.hexdigest()}.jpg")
+        if os.path.exists(stored_path):
+            os.remove(path)
+            # Mark as recently used for eviction
+            os.utime(stored_path)
+        else:
+            os.replace(path, stored_path)
+        return stored_path
+
+    def manifest_path(self, manifest_id):
+        return os.path.join(self.manifest_folder, f"{manifest_id}.json")
+
+    def write_manifest(self, manifest_id, manifest):
+        """
+        Atomically write the manifest for one scrape. Clients get a scrape's
+        images from its image job (/api/images/<job_id>/), never from a
+        shared file, so concurrent scrapes cannot overwrite each other's.
+        """
+        os.makedirs(self.manifest_folder, exist_ok=True)
+        self._write_json(self.manifest_path(manifest_id), manifest)
+
+    def read_manifest(self, manifest_id):
+        """
+        Return a manifest, or None if it does not exist or has expired.
+        """
+        path = self.manifest_path(manifest_id)
+        try:
+            # The sweeper removes expired manifests only every sweep_interval
+            if time.time() - os.path.getmtime(path) > self.manifest_ttl:
+                return None
+            with open(path) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _write_json(self, path, data):
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(data, f, indent=4)
+        os.replace(temp_path, path)
+
+    def start_sweeper(self):
+        if self._sweeper is None:
+            with self._sweeper_lock:
+                if self._sweeper is None:
+                    self._sweeper = threading.Thread(target=self._sweep_forever, name='image-store-sweeper', daemon=True)
+                    self._sweeper.start()
+
+    def _sweep_forever(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Error sweeping image store: {e}")
+
+    @metrics.timed('image_store.sweep')
+    def sweep(self):
+        """
+        Remove expired manifests, then evict least recently used images until
+        the store fits in max_bytes. Images referenced by a live manifest are
+        only evicted once no unreferenced image is left to evict.
+
+        Returns:
+            int: Number of images evicted
+        """
+        now = time.time()
+        referenced = set()
+        if os.path.isdir(self.manifest_folder):
+            for name in os.listdir(self.manifest_folder):
+                path = os.path.join(self.manifest_folder, name)
+                try:
+                    if now - os.path.getmtime(path) > self.manifest_ttl:
+                        os.remove(path)
+                        continue
+                    with open(path) as f:
+                        for image in json.load(f).get("images", []):
+                            referenced.add(os.path.basename(image["image_file"]))
+                except (OSError, ValueError, KeyError) as e:
+                    print(f"Error reading manifest {name}: {e}")
+
+        images = []
+        total = 0
+        for name in os.listdir(self.images_folder):
+            if not (name.startswith(self.PREFIX) and name.endswith(".jpg")):
+                continue
+            stat = os.stat(os.path.join(self.images_folder, name))
+            images.append((name in referenced, stat.st_mtime, stat.st_size, name))
+            total += stat.st_size
+
+        evicted = 0
+        # Unreferenced images first, oldest first within each group
+        for is_referenced, mtime, size, name in sorted(images):
+            if total <= self.max_bytes:
+                break
+            if now - mtime < self.MIN_EVICTION_AGE:
+                continue
+            try:
+                os.remove(os.path.join(self.images_folder, name))
+                total -= size
+                evicted += 1
+            except FileNotFoundError:
+                pass
+        if evicted:
+            print(f"Evicted {evicted} images from the image store")
+        return evicted
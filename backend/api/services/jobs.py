@@ -0,0 +1,145 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from . import metrics
+
+
+class QueueFull(Exception):
+    """
+    A job was rejected because max_pending jobs are already waiting.
+    """
+
+
+class JobManager:
+    """
+    Runs work submitted from request handlers on a local worker pool and
+    keeps each job's status and result so clients can poll for them.
+
+    At most max_pending jobs wait for a worker; beyond that submit raises
+    QueueFull instead of letting the backlog grow without bound. Jobs
+    submitted with a job_key share the job of an earlier submission with the
+    same key unless it failed or expired. Finished jobs are forgotten after
+    retention_seconds by a background pruner, whether or not new jobs come in.
+    """
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    ERROR = 'error'
+
+    def __init__(self, max_workers=2, retention_seconds=3600, name='jobs', max_pending=100, prune_interval=60):
+        self.name = name
+        self.retention_seconds = retention_seconds
+        self.max_pending = max_pending
+        self.prune_interval = prune_interval
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._jobs = {}
+        # Job ID of each job_key, for deduplication
+        self._keys = {}
+        self._lock = threading.Lock()
+        self._pruner = None
+        self._pruner_lock = threading.Lock()
+        self.deduplicated = 0
+        self.rejected = 0
+
+    def submit(self, fn, *args, job_key=None, **kwargs):
+        """
+        Queue fn(*args, **kwargs) on the worker pool.
+
+        Args:
+            job_key (hashable, optional): Identity of the work; a pending,
+                running or finished job with the same key is reused
+
+        Returns:
+            str: ID used to look the job up with get()
+
+        Raises:
+            QueueFull: If max_pending jobs are already waiting
+        """
+        self.start_pruner()
+        with self._lock:
+            if job_key is not None:
+                job = self._jobs.get(self._keys.get(job_key))
+                if job is not None and job['status'] != self.ERROR:
+                    self.deduplicated += 1
+                    return job['job_id']
+            pending = sum(1 for job in self._jobs.values() if job['status'] == self.PENDING)
+            if pending >= self.max_pending:
+                self.rejected += 1
+                raise QueueFull(f"{self.name}: {pending} jobs are already waiting")
+            job_id = uuid.uuid4().hex
+            self._jobs[job_id] = {
+                'job_id': job_id,
+                'status': self.PENDING,
+                'result': None,
+                'error': None,
+                'created_at': time.time(),
+                'finished_at': None,
+            }
+            if job_key is not None:
+                self._keys[job_key] = job_id
+        self._executor.submit(self._run, job_id, fn, args, kwargs)
+        return job_id
+
+    def get(self, job_id):
+        """
+        Return a snapshot of the job, or None if it is unknown or expired.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def stats(self) -> dict:
+        with self._lock:
+            statuses = [job['status'] for job in self._jobs.values()]
+            return {
+                'pending': statuses.count(self.PENDING),
+                'running': statuses.count(self.RUNNING),
+                'max_pending': self.max_pending,
+                'deduplicated': self.deduplicated,
+                'rejected': self.rejected,
+            }
+
+    def _run(self, job_id, fn, args, kwargs):
+        self._update(job_id, status=self.RUNNING)
+        try:
+            with metrics.span(f"jobs.{self.name}"):
+                result = fn(*args, **kwargs)
+        except Exception as e:
+            print(f"Error running job {job_id}: {e}")
+            self._update(job_id, status=self.ERROR, error=str(e), finished_at=time.time())
+        else:
+            self._update(job_id, status=self.DONE, result=result, finished_at=time.time())
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields)
+
+    def start_pruner(self):
+        if self._pruner is None:
+            with self._pruner_lock:
+                if self._pruner is None:
+                    self._pruner = threading.Thread(target=self._prune_forever, name=f'{self.name}-pruner', daemon=True)
+                    self._pruner.start()
+
+    def _prune_forever(self):
+        while True:
+            time.sleep(self.prune_interval)
+            try:
+                self._prune()
+            except Exception as e:
+                print(f"Error pruning {self.name} jobs: {e}")
+
+    def _prune(self):
+        expired_before = time.time() - self.retention_seconds
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if job['finished_at'] is not None and job['finished_at'] < expired_before
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+            self._keys = {key: job_id for key, job_id in self._keys.items() if job_id in self._jobs}
@@ -0,0 +1,269 @@
+"""
+Per-stage timing spans and process-wide metrics.
+
+Services wrap their stages in span() (or decorate them with timed()). Every
+span feeds the stage latency histogram, error counter and in-flight gauge,
+and is also recorded on the current request so the timing middleware can
+report it in the Server-Timing header and the request's timing log line.
+
+Metrics are rendered in the Prometheus text format by render(). Values
+other services already keep (cache hit rates, upstream counters, ...) are
+read at scrape time from collectors registered with register_collector().
+"""
+import asyncio
+import contextvars
+import functools
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from . import profiling
+
+# Seconds; upper bounds of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Spans recorded for the request being handled, None outside of requests
+_request_spans = contextvars.ContextVar('request_spans', default=None)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = [*zip(labelnames, values), *extra]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield from self._render_value(key, value)
+
+    def _render_value(self, key, value):
+        yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total, observations = self._values.get(key, ((0,) * len(self.buckets), 0.0, 0))
+            # Buckets are cumulative
+            counts = tuple(
+                count + 1 if value <= bound else count
+                for count, bound in zip(counts, self.buckets)
+            )
+            self._values[key] = (counts, total + value, observations + 1)
+
+    def _render_value(self, key, value):
+        counts, total, observations = value
+        for count, bound in zip(counts, self.buckets):
+            yield f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', _format_value(bound))])} {count}"
+        yield f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', '+Inf')])} {observations}"
+        yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}"
+        yield f"{self.name}_count{_format_labels(self.labelnames, key)} {observations}"
+
+
+_metrics = []
+_collectors = []
+
+STAGE_SECONDS = Histogram(
+    'api_stage_duration_seconds', 'Time spent in each service stage.', ('stage',)
+)
+STAGE_ERRORS = Counter(
+    'api_stage_errors_total', 'Service stages that raised an error.', ('stage',)
+)
+STAGE_IN_FLIGHT = Gauge(
+    'api_stage_in_flight', 'Service stages currently running.', ('stage',)
+)
+REQUEST_SECONDS = Histogram(
+    'api_request_duration_seconds', 'Time to produce a response, per view.', ('view', 'status')
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    'api_requests_in_flight', 'Requests currently being handled.'
+)
+
+
+@contextmanager
+def span(stage):
+    """
+    Time the wrapped block as one run of stage. Works in threads and in
+    coroutines (the time then includes the awaits inside the block).
+    """
+    STAGE_IN_FLIGHT.inc(stage=stage)
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        duration = time.perf_counter() - started
+        STAGE_IN_FLIGHT.dec(stage=stage)
+        STAGE_SECONDS.observe(duration, stage=stage)
+        spans = _request_spans.get()
+        if spans is not None:
+            spans.append((stage, started, duration))
+
+
+def timed(stage):
+    """
+    Decorator form of span for functions and coroutine functions.
+    """
+    def decorator(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                with span(stage):
+                    return await fn(*args, **kwargs)
+        else:
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with span(stage):
+                    return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def submit(executor, fn, *args, **kwargs):
+    """
+    executor.submit that runs fn in a copy of the caller's context, so
+    spans recorded on the worker thread count towards the caller's request
+    (and, when the request is profiled, fn is profiled with it).
+    """
+    return executor.submit(contextvars.copy_context().run, profiling.wrap(fn), *args, **kwargs)
+
+
+def run_in_executor(loop, executor, fn, *args):
+    """
+    loop.run_in_executor counterpart of submit.
+    """
+    return loop.run_in_executor(executor, functools.partial(contextvars.copy_context().run, profiling.wrap(fn), *args))
+
+
+def start_request():
+    """
+    Start collecting spans for the current request.
+
+    Returns:
+        tuple: (spans list, token to pass to end_request)
+    """
+    spans = []
+    return spans, _request_spans.set(spans)
+
+
+def end_request(token):
+    _request_spans.reset(token)
+
+
+def summarize_spans(spans):
+    """
+    Group spans by stage.
+
+    Returns:
+        list: (stage, total seconds, count) in order of first start
+    """
+    grouped = {}
+    for stage, started, duration in sorted(spans, key=lambda recorded: recorded[1]):
+        total, count = grouped.get(stage, (0.0, 0))
+        grouped[stage] = (total + duration, count + 1)
+    return [(stage, total, count) for stage, (total, count) in grouped.items()]
+
+
+def server_timing(spans, total):
+    """
+    Build a Server-Timing header value from the request's spans. Stages
+    that ran several times report their summed duration and run count.
+    """
+    entries = []
+    for stage, duration, count in summarize_spans(spans):
+        name = re.sub(r'[^A-Za-z0-9_.-]', '_', stage)
+        entry = f"{name};dur={duration * 1000:.1f}"
+        if count > 1:
+            entry += f';desc="x{count}"'
+        entries.append(entry)
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+
+def register_collector(collector):
+    """
+    Register a callable returning (name, kind, documentation, samples)
+    tuples read at scrape time, samples being (labels dict, value) pairs.
+    """
+    _collectors.append(collector)
+
+
+def render():
+    """
+    Return every metric in the Prometheus text exposition format.
+    """
+    lines = []
+    for metric in list(_metrics):
+        lines.extend(metric.render())
+    for collector in list(_collectors):
+        try:
+            families = list(collector())
+        except Exception as e:
+            print(f"Error collecting metrics: {e}")
+            continue
+        for name, kind, documentation, samples in families:
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(labels.keys(), labels.values())} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,132 @@
+"""
+Process-wide registry for heavy models and SDK imports.
+
+Every model is loaded at most once per process, no matter how many service
+objects ask for it, and the time spent importing and loading each component
+is recorded so it can be reported by the warmup command and the readiness
+endpoint.
+"""
+import importlib
+import threading
+import time
+from contextlib import contextmanager
+
+_models = {}
+_load_locks = {}
+_registry_lock = threading.Lock()
+_timings = {}
+
+# Progress of warm_up: 'idle' (not started, models load on first use),
+# 'warming', 'done' or 'failed'
+WARMUP_STATES = ('idle', 'warming', 'done', 'failed')
+_warmup_state = 'idle'
+
+
+def record_timing(component, seconds):
+    with _registry_lock:
+        _timings[component] = seconds
+
+
+@contextmanager
+def timed(component):
+    """
+    Record how long the wrapped block takes under the given component name.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_timing(component, time.perf_counter() - started)
+
+
+def import_module(module_name):
+    """
+    Import a module on first use, recording the import cost.
+
+    Args:
+        module_name (str): Dotted module path, e.g. 'google.generativeai'
+
+    Returns:
+        module: The imported module
+    """
+    component = f"import:{module_name}"
+    with _registry_lock:
+        already_timed = component in _timings
+    if already_timed:
+        return importlib.import_module(module_name)
+    with timed(component):
+        return importlib.import_module(module_name)
+
+
+def get_or_load(name, loader):
+    """
+    Return the model registered under name, loading it with loader the first
+    time it is requested. Concurrent callers wait for the single load.
+
+    Args:
+        name (str): Registry key
+        loader (callable): Called with no arguments to build the model
+
+    Returns:
+        The loaded model
+    """
+    model = _models.get(name)
+    if model is not None:
+        return model
+
+    with _registry_lock:
+        lock = _load_locks.setdefault(name, threading.Lock())
+    with lock:
+        model = _models.get(name)
+        if model is None:
+            with timed(f"load:{name}"):
+                model = loader()
+            _models[name] = model
+    return model
+
+
+def get_sentence_transformer(model_name='all-mpnet-base-v2'):
+    """
+    Return the shared SentenceTransformer for model_name.
+    """
+    def load():
+        sentence_transformers = import_module('sentence_transformers')
+        return sentence_transformers.SentenceTransformer(model_name)
+
+    return get_or_load(f"sentence_transformer:{model_name}", load)
+
+
+def is_loaded(name):
+    return name in _models
+
+
+def set_warmup_state(state):
+    global _warmup_state
+    if state not in WARMUP_STATES:
+        raise ValueError(f"Unknown warm-up state '{state}'")
+    with _registry_lock:
+        _warmup_state = state
+
+
+def warmup_state():
+    with _registry_lock:
+        return _warmup_state
+
+
+def startup_report():
+    """
+    Return the recorded import and load times, slowest first.
+
+    Returns:
+        dict: Loaded model names and per-component timings in seconds
+    """
+    with _registry_lock:
+        timings = sorted(_timings.items(), key=lambda item: item[1], reverse=True)
+    return {
+        'warmup': warmup_state(),
+        'loaded_models': sorted(_models),
+        'timings': [
+            {'component': component, 'seconds': round(seconds, 4)}
+            for component, seconds in timings
+        ],
+    }
@@ -1,15 +1,40 @@
 import asyncio
-import json
+import contextlib
 import os
-import certifi
+import random
 import ssl
 
 from aiohttp import ClientSession, ClientTimeout, TCPConnector
 from urllib.parse import urlparse, urlencode
-from playwright.async_api import async_playwright
 from PIL import Image as PILImage
+from . import metrics
+from .browser_pool import BrowserPool
+
+# Image hosts frequently serve broken certificate chains, so downloads skip
+# certificate verification. The context is built once and shared.
+_download_ssl_context = ssl.create_default_context()
+_download_ssl_context.check_hostname = False
+_download_ssl_context.verify_mode = ssl.CERT_NONE
 
 class PhotoExtractor:
+    # Number of images returned per search
+    MAX_IMAGES = 4
+    # Extra preview tiles collected so failed downloads can be replaced
+    MAX_CANDIDATES = 6
+    # Downloads in flight across all searches, and per image host
+    MAX_CONCURRENT_DOWNLOADS = 8
+    MAX_DOWNLOADS_PER_HOST = 2
+    # Downloads larger than this are abandoned
+    MAX_IMAGE_BYTES = 10 * 1024 * 1024
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, image_store, browser_pool=None):
+        self.image_store = image_store
+        self.browser_pool = browser_pool or BrowserPool()
+        self.browser_pool.background_loop.on_shutdown(self.close)
+        self._session = None
+        self._download_slots = None
+
     # Function to extract the domain from a URL
     def extract_domain(self, url):
         """
@@ -27,68 +52,238 @@ class PhotoExtractor:
             domain = domain[4:]
         return domain
 
+    def get_session(self):
+        """
+        Return the HTTP session shared by every download. Its connector keeps
+        connections (and their TLS sessions) alive between attempts and
+        requests, and caps connections per host. Must be called on the
+        browser pool's event loop.
+        """
+        if self._session is None or self._session.closed:
+            self._session = ClientSession(
+                connector=TCPConnector(
+                    ssl=_download_ssl_context,
+                    limit=self.MAX_CONCURRENT_DOWNLOADS,
+                    limit_per_host=self.MAX_DOWNLOADS_PER_HOST,
+                )
+            )
+            self._download_slots = asyncio.Semaphore(self.MAX_CONCURRENT_DOWNLOADS)
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    @staticmethod
+    def convert_to_jpg(temp_path, file_path):
+        """
+        Convert a downloaded image to JPG and remove the temporary file.
+
+        Returns:
+            str: Path of the JPG file
+        """
+        try:
+            with PILImage.open(temp_path) as img:
+                # Convert to RGB mode (removes alpha channel if present)
+                if img.mode in ('RGBA', 'P'):
+                    img = img.convert('RGB')
+
+                # Always save as JPG
+                jpg_path = os.path.splitext(file_path)[0] + '.jpg'
+                img.save(jpg_path, 'JPEG', quality=95)
+        finally:
+            # Remove temporary file
+            os.remove(temp_path)
+        return jpg_path
+
     # Function to download an image with retry logic
-    async def download_image(self, session, img_url, file_path, retries=3):
+    @metrics.timed('photos.download_image')
+    async def download_image(self, session, img_url, file_path, retries=3, timeout_duration=10):
         """
-        Download an image and convert it to JPG if necessary
+        Download an image and convert it to JPG if necessary. The body is
+        streamed to disk and retries back off exponentially with full jitter.
         """
         attempt = 0
         while attempt < retries:
             try:
-                # Create SSL context that ignores certificate verification
-                ssl_context = ssl.create_default_context()
-                ssl_context.check_hostname = False
-                ssl_context.verify_mode = ssl.CERT_NONE
-                
-                async with session.get(img_url, ssl=ssl_context) as response:
-                    if response.status == 200:
-                        # Write the original image first
-                        temp_path = file_path + ".temp"
-                        with open(temp_path, "wb") as f:
-                            f.write(await response.read())
-                        
-                        # Convert to JPG if needed
-                        with PILImage.open(temp_path) as img:
-                            # Convert to RGB mode (removes alpha channel if present)
-                            if img.mode in ('RGBA', 'P'):
-                                img = img.convert('RGB')
-                            
-                            # Always save as JPG
-                            jpg_path = os.path.splitext(file_path)[0] + '.jpg'
-                            img.save(jpg_path, 'JPEG', quality=95)
-                            
-                        # Remove temporary file
-                        os.remove(temp_path)
-                        print(f"Downloaded and converted image to: {jpg_path}")
-                        return jpg_path
-                    else:
-                        print(f"Failed to download image from {img_url}. Status: {response.status}")
+                async with self._download_slots:
+                    async with session.get(img_url, timeout=ClientTimeout(total=timeout_duration)) as response:
+                        if response.status == 200:
+                            # Stream the original image to disk first
+                            temp_path = file_path + ".temp"
+                            try:
+                                received = await self._stream_to_file(response, temp_path)
+                            except BaseException:
+                                # Also covers cancellation once enough images are in
+                                if os.path.exists(temp_path):
+                                    os.remove(temp_path)
+                                raise
+                            if received is None:
+                                os.remove(temp_path)
+                                print(f"Image from {img_url} exceeds {self.MAX_IMAGE_BYTES} bytes, skipping")
+                                return None
+
+                            # Convert to JPG off the event loop
+                            loop = asyncio.get_running_loop()
+                            conversion = loop.run_in_executor(None, self.convert_to_jpg, temp_path, file_path)
+                            try:
+                                jpg_path = await asyncio.shield(conversion)
+                            except asyncio.CancelledError:
+                                # Let the conversion finish, then drop its output
+                                with contextlib.suppress(Exception):
+                                    os.remove(await conversion)
+                                raise
+                            print(f"Downloaded and converted image to: {jpg_path}")
+                            return jpg_path
+                        else:
+                            print(f"Failed to download image from {img_url}. Status: {response.status}")
             except Exception as e:
                 print(f"Error downloading/converting image from {img_url}: {e}")
             attempt += 1
             if attempt < retries:
                 print(f"Retrying download for {img_url} (attempt {attempt + 1}/{retries})")
-                await asyncio.sleep(2**attempt)
+                await asyncio.sleep(random.uniform(0, 0.5 * 2**attempt))
         print(f"Failed to download image from {img_url} after {retries} attempts.")
         return None
 
+    async def _stream_to_file(self, response, path):
+        """
+        Write the response body to path chunk by chunk.
+
+        Returns:
+            int: Bytes written, or None if the body exceeded MAX_IMAGE_BYTES
+        """
+        received = 0
+        with open(path, "wb") as f:
+            async for chunk in response.content.iter_chunked(self.CHUNK_SIZE):
+                received += len(chunk)
+                if received > self.MAX_IMAGE_BYTES:
+                    return None
+                f.write(chunk)
+        return received
+
+    @metrics.timed('photos.collect_candidates')
+    async def collect_candidates(self, page):
+        """
+        Open result tiles one by one and read the full-size image URL, source
+        and description from the preview panel. Nothing is downloaded here.
+
+        Returns:
+            list: Candidate dicts in result order
+        """
+        # Find all image elements on the page
+        image_elements = await page.query_selector_all('div[data-attrid="images universal"]')
+        print(f"Found {len(image_elements)} image elements on the page.")
+
+        candidates = []
+        for idx, image_element in enumerate(image_elements):
+            if len(candidates) >= self.MAX_CANDIDATES:
+                break
+            try:
+                print(f"Processing image {idx + 1}...")
+                await image_element.click()
+                await page.wait_for_selector("img.sFlh5c.FyHeAf.iPVvYb[jsaction]")
+
+                img_tag = await page.query_selector("img.sFlh5c.FyHeAf.iPVvYb[jsaction]")
+                if not img_tag:
+                    print(f"Failed to find image tag for element {idx + 1}")
+                    continue
+
+                source_url = await page.query_selector('(//div[@jsname="figiqf"]/a[@class="YsLeY"])[2]')
+                source_url = await source_url.get_attribute("href") if source_url else "N/A"
+
+                candidates.append({
+                    "index": idx + 1,
+                    "img_url": await img_tag.get_attribute("src"),
+                    "image_description": await img_tag.get_attribute("alt"),
+                    "source_url": source_url,
+                })
+            except Exception as e:
+                print(f"Error processing image {idx + 1}: {e}")
+                continue
+        return candidates
+
+    async def download_candidates(self, candidates, download_folder, timeout_duration=10):
+        """
+        Download all candidates concurrently into download_folder and keep
+        the first MAX_IMAGES downloads to succeed, listed in result order.
+        Kept images are moved into the image store.
+
+        Returns:
+            list: Image metadata dicts
+        """
+        session = self.get_session()
+        tasks = [
+            asyncio.ensure_future(self.download_image(
+                session,
+                candidate["img_url"],
+                os.path.join(download_folder, f"image_{candidate['index']}"),
+                timeout_duration=timeout_duration,
+            ))
+            for candidate in candidates
+        ]
+
+        # Keep the first MAX_IMAGES downloads to succeed instead of waiting on
+        # slow or retrying stragglers
+        completed = set()
+        for finished in asyncio.as_completed(tasks):
+            if await finished:
+                completed = {idx for idx, task in enumerate(tasks) if task.done() and task.result()}
+                if len(completed) >= self.MAX_IMAGES:
+                    break
+
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        image_data_list = []
+        for idx, (candidate, task) in enumerate(zip(candidates, tasks)):
+            path = None if task.cancelled() else task.result()
+            if not path:
+                continue
+            # Hard limit of 4 images, preferring downloads that finished first
+            if idx not in completed or len(image_data_list) >= self.MAX_IMAGES:
+                os.remove(path)
+                continue
+            stored_path = self.image_store.add_file(path)
+            if any(image["image_file"] == stored_path for image in image_data_list):
+                # Same picture served from another source
+                continue
+            image_data_list.append({
+                "image_description": candidate["image_description"],
+                "source_url": candidate["source_url"],
+                "source_name": self.extract_domain(candidate["source_url"]),
+                "image_file": stored_path,
+            })
+        return image_data_list
+
+    def scrape(self, search_query="Doctor", timeout_duration=10):
+        """
+        Blocking wrapper around scrape_google_images for worker threads.
+        The coroutine runs on the browser pool's event loop.
+        """
+        return self.browser_pool.run(
+            self.scrape_google_images(search_query=search_query, timeout_duration=timeout_duration)
+        )
+
     # Main function to scrape Google Images
+    @metrics.timed('photos.scrape_google_images')
     async def scrape_google_images(self, search_query="Doctor", timeout_duration=10):
         """
         Scrape exactly 4 images from Google Images for a given search query.
-        Runs in headless mode without showing browser window.
+        Candidate URLs are collected in a page from the shared headless
+        browser pool, then downloaded concurrently. Must run on the pool's
+        event loop (see scrape).
 
         Args:
             search_query (str, optional): The search term to use for Google Images. Defaults to "Doctor".
             timeout_duration (int, optional): The timeout duration for the image download session. Defaults to 10 seconds.
 
         Returns:
-            None
+            dict: Manifest ID and metadata of the downloaded images
         """
-        async with async_playwright() as p:
-            browser = await p.chromium.launch(headless=True)
-            page = await browser.new_page()
-
+        async with self.browser_pool.page() as page:
             query_params = urlencode({"q": search_query, "tbm": "isch"})
             search_url = f"https://www.google.com/search?{query_params}"
 
@@ -98,91 +293,27 @@ class PhotoExtractor:
             # Remove scroll_to_bottom call and just wait for the initial images to load
             await page.wait_for_selector('div[data-id="mosaic"]')
 
-            # Set up directories for image storage
-            download_folder = "../assets/images"
-            metadata_folder = "../assets/metadata"
-            json_file_path = os.path.join(metadata_folder, "google_images_data.json")
-
-            # Clean out existing directories
-            if os.path.exists(download_folder):
-                print(f"Cleaning previous image_ files from directory: {download_folder}")
-                # Only remove files that start with 'image_'
-                for file in os.listdir(download_folder):
-                    if file.startswith('image_'):
-                        file_path = os.path.join(download_folder, file)
-                        os.remove(file_path)
-                        print(f"Removed: {file}")
-            else:
-                os.makedirs(download_folder)
-
-            if os.path.exists(metadata_folder):
-                print(f"Cleaning metadata directory: {metadata_folder}")
-                if not os.path.exists(metadata_folder):
-                    os.makedirs(metadata_folder)
-
-            # Initialize empty JSON file
-            with open(json_file_path, "w") as json_file:
-                json.dump([], json_file)
-
-            # Find all image elements on the page
-            image_elements = await page.query_selector_all('div[data-attrid="images universal"]')
-            print(f"Found {len(image_elements)} image elements on the page.")
-
-            ssl_context = ssl.create_default_context(cafile=certifi.where())
-            async with ClientSession(
-                timeout=ClientTimeout(total=timeout_duration),
-                connector=TCPConnector(ssl=ssl_context)
-            ) as session:
-                images_downloaded = 0
-                image_data_list = []
-
-                # Iterate through the first 4 image elements
-                for idx, image_element in enumerate(image_elements):
-                    if images_downloaded >= 4:  # Hard limit of 4 images
-                        print("Reached 4 images. Stopping download.")
-                        break
-                    try:
-                        print(f"Processing image {idx + 1}...")
-                        await image_element.click()
-                        await page.wait_for_selector("img.sFlh5c.FyHeAf.iPVvYb[jsaction]")
-
-                        img_tag = await page.query_selector("img.sFlh5c.FyHeAf.iPVvYb[jsaction]")
-                        if not img_tag:
-                            print(f"Failed to find image tag for element {idx + 1}")
-                            continue
-
-                        img_url = await img_tag.get_attribute("src")
-                        # Always use .jpg extension now
-                        file_path = os.path.join(download_folder, f"image_{idx + 1}")
-                        
-                        # download_image now returns the actual path used
-                        actual_file_path = await self.download_image(session, img_url, file_path)
-                        
-                        if not actual_file_path:
-                            continue
-
-                        source_url = await page.query_selector('(//div[@jsname="figiqf"]/a[@class="YsLeY"])[2]')
-                        source_url = await source_url.get_attribute("href") if source_url else "N/A"
-                        image_description = await img_tag.get_attribute("alt")
-                        source_name = self.extract_domain(source_url)
-
-                        image_data = {
-                            "image_description": image_description,
-                            "source_url": source_url,
-                            "source_name": source_name,
-                            "image_file": actual_file_path,
-                        }
-
-                        image_data_list.append(image_data)
-                        print(f"Image {idx + 1} metadata prepared.")
-                        images_downloaded += 1
-                    except Exception as e:
-                        print(f"Error processing image {idx + 1}: {e}")
-                        continue
-
-                # Save image metadata to JSON file
-                with open(json_file_path, "w") as json_file:
-                    json.dump(image_data_list, json_file, indent=4)
-
-            print(f"Finished downloading {images_downloaded} images.")
-            await browser.close()
\ No newline at end of file
+            candidates = await self.collect_candidates(page)
+
+        # The page is handed back to the pool before downloading. Each scrape
+        # downloads into its own staging folder so concurrent scrapes never
+        # touch each other's files.
+        manifest_id = self.image_store.new_manifest_id()
+        try:
+            download_folder = self.image_store.staging_dir(manifest_id)
+            image_data_list = await self.download_candidates(candidates, download_folder, timeout_duration)
+        finally:
+            self.image_store.discard_staging(manifest_id)
+
+        # Save image metadata to this scrape's manifest
+        self.image_store.write_manifest(manifest_id, {
+            "manifest_id": manifest_id,
+            "search_query": search_query,
+            "images": image_data_list,
+        })
+
+        print(f"Finished downloading {len(image_data_list)} images.")
+        return {
+            "manifest_id": manifest_id,
+            "images": image_data_list,
+        }
@@ -0,0 +1,341 @@
+"""
+Opt-in cProfile capture of single requests.
+
+A request is profiled when it carries the configured token in the profiling
+header, or when it is picked by the sample rate. Only profiled requests pay
+the profiler's overhead: everything else costs one header lookup and one
+random number.
+
+cProfile only follows the thread it is enabled on, so work the request hands
+to the executors through metrics.submit / metrics.run_in_executor (level
+pipelines, batch workers) is profiled on its worker thread and merged into
+the request's profile. Each finished profile is stored as a pstats file with
+a JSON sidecar describing the request.
+"""
+import contextvars
+import cProfile
+import hmac
+import io
+import json
+import os
+import pstats
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+# Capture of the request being handled, None when it is not profiled
+_capture = contextvars.ContextVar('profile_capture', default=None)
+
+PROFILE_ID_LENGTH = 32
+
+# Threads with a profiler enabled. A thread takes one profiler at a time:
+# enabling a second one would silently replace the first (e.g. two profiled
+# async requests sharing the event loop thread)
+_profiled_threads = set()
+_threads_lock = threading.Lock()
+
+
+def _claim_thread():
+    ident = threading.get_ident()
+    with _threads_lock:
+        if ident in _profiled_threads:
+            return False
+        _profiled_threads.add(ident)
+        return True
+
+
+def _release_thread():
+    with _threads_lock:
+        _profiled_threads.discard(threading.get_ident())
+
+
+class ProfileCapture:
+    """
+    Profiles collected for one request: the request thread's own profile
+    and one per executor task run on its behalf.
+    """
+
+    def __init__(self, trigger):
+        self.id = uuid.uuid4().hex
+        self.trigger = trigger
+        self.started = time.perf_counter()
+        self.profile = cProfile.Profile()
+        self._profiling = False
+        self._enabled = False
+        self._worker_profiles = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        self._profiling = _claim_thread()
+        if self._profiling:
+            self._enabled = True
+            self.profile.enable()
+
+    def stop(self):
+        if self._profiling:
+            self.profile.disable()
+            _release_thread()
+            self._profiling = False
+
+    def attach(self):
+        """
+        Start a profile of its own on the calling thread, merged into this
+        capture once passed to detach.
+
+        Returns:
+            cProfile.Profile: The started profile, None if the thread is
+                already being profiled
+        """
+        if not _claim_thread():
+            return None
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    def detach(self, profile):
+        """
+        Stop a profile started by attach, on the same thread.
+        """
+        if profile is None:
+            return
+        profile.disable()
+        _release_thread()
+        with self._lock:
+            self._worker_profiles.append(profile)
+
+    def run(self, fn, *args, **kwargs):
+        """
+        Run fn under a profile of its own, merged into this capture.
+        """
+        profile = self.attach()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.detach(profile)
+
+    def stats(self):
+        """
+        Returns:
+            pstats.Stats: Request thread and executor profiles combined,
+                None if nothing was profiled
+        """
+        with self._lock:
+            profiles = ([self.profile] if self._enabled else []) + self._worker_profiles
+        for profile in profiles:
+            profile.create_stats()
+        profiles = [profile for profile in profiles if profile.stats]
+        if not profiles:
+            return None
+        stats = pstats.Stats(profiles[0])
+        if len(profiles) > 1:
+            stats.add(*profiles[1:])
+        return stats
+
+
+def wrap(fn):
+    """
+    Return fn, made to run under the current request's profile if that
+    request is being profiled. Used where work is handed to another thread.
+    """
+    capture = _capture.get()
+    if capture is None:
+        return fn
+
+    def profiled(*args, **kwargs):
+        return capture.run(fn, *args, **kwargs)
+    return profiled
+
+
+class RequestProfiler:
+    """
+    Decides which requests to profile and stores their profiles.
+
+    Args:
+        directory (str): Where profiles are stored
+        token (str, optional): Secret that both triggers profiling (in the
+            profiling header) and authorizes downloads. Without it
+            profiles can only be sampled and cannot be downloaded.
+        sample_rate (float): Fraction of all requests profiled
+        max_profiles (int): Stored profiles kept, oldest removed first
+        header (str): Request header carrying the token
+    """
+
+    def __init__(self, directory, token=None, sample_rate=0.0, max_profiles=50, header='X-Profile-Token'):
+        self.directory = str(directory)
+        self.token = token or None
+        self.sample_rate = float(sample_rate)
+        self.max_profiles = max_profiles
+        # Request.META key of the header
+        self.meta_key = 'HTTP_' + header.upper().replace('-', '_')
+        self._lock = threading.Lock()
+        self.captured = 0
+
+    @property
+    def enabled(self):
+        return self.token is not None or self.sample_rate > 0
+
+    def authorized(self, request) -> bool:
+        """
+        Whether the request carries the profiling token.
+        """
+        supplied = request.META.get(self.meta_key)
+        if not self.token or not supplied:
+            return False
+        return hmac.compare_digest(supplied.encode('utf-8'), self.token.encode('utf-8'))
+
+    def trigger(self, request):
+        """
+        Returns:
+            str: Why the request is profiled ('header' or 'sampled'),
+                None when it is not
+        """
+        if not self.enabled:
+            return None
+        if self.authorized(request):
+            return 'header'
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return 'sampled'
+        return None
+
+    def begin(self, trigger):
+        """
+        Start profiling the current request on this thread.
+
+        Returns:
+            tuple: (capture, token to pass to end)
+        """
+        capture = ProfileCapture(trigger)
+        token = _capture.set(capture)
+        capture.start()
+        return capture, token
+
+    def end(self, capture, token, details):
+        """
+        Stop profiling and store the profile.
+
+        Args:
+            details (dict): Request description saved next to the profile
+
+        Returns:
+            str: Profile ID, None if it could not be stored
+        """
+        capture.stop()
+        try:
+            _capture.reset(token)
+        except ValueError:
+            # A streamed body finished outside the request's context
+            pass
+        duration = time.perf_counter() - capture.started
+        stats = capture.stats()
+        if stats is None:
+            return None
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            stats.dump_stats(self._path(capture.id, '.prof'))
+            with open(self._path(capture.id, '.json'), 'w') as f:
+                json.dump({
+                    'id': capture.id,
+                    'trigger': capture.trigger,
+                    'created_at': datetime.now(timezone.utc).isoformat(),
+                    'duration_ms': round(duration * 1000, 1),
+                    **details,
+                }, f)
+        except Exception as e:
+            print(f"Error storing request profile: {e}")
+            return None
+        with self._lock:
+            self.captured += 1
+        self.prune()
+        return capture.id
+
+    def _path(self, profile_id, suffix):
+        return os.path.join(self.directory, profile_id + suffix)
+
+    def _valid_id(self, profile_id):
+        return len(profile_id) == PROFILE_ID_LENGTH and all(c in '0123456789abcdef' for c in profile_id)
+
+    def list_profiles(self) -> list:
+        """
+        Returns:
+            list: Metadata of the stored profiles, newest first
+        """
+        profiles = []
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return profiles
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    profiles.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return sorted(profiles, key=lambda profile: profile['created_at'], reverse=True)
+
+    def profile_path(self, profile_id):
+        """
+        Returns:
+            str: Path of the stored pstats file, None if there is none
+        """
+        if not self._valid_id(profile_id):
+            return None
+        path = self._path(profile_id, '.prof')
+        return path if os.path.exists(path) else None
+
+    def report(self, profile_id, sort='cumulative', limit=50):
+        """
+        Returns:
+            str: pstats text report of the stored profile, None if missing
+        """
+        path = self.profile_path(profile_id)
+        if path is None:
+            return None
+        output = io.StringIO()
+        stats = pstats.Stats(path, stream=output)
+        stats.strip_dirs().sort_stats(sort).print_stats(limit)
+        return output.getvalue()
+
+    def prune(self):
+        """
+        Remove the oldest profiles beyond max_profiles.
+        """
+        for profile in self.list_profiles()[self.max_profiles:]:
+            for suffix in ('.prof', '.json'):
+                try:
+                    os.remove(self._path(profile['id'], suffix))
+                except FileNotFoundError:
+                    pass
+
+    def stats(self) -> dict:
+        return {
+            'enabled': self.enabled,
+            'sample_rate': self.sample_rate,
+            'captured': self.captured,
+        }
+
+
+_profiler = None
+_profiler_lock = threading.Lock()
+
+
+def get_profiler() -> RequestProfiler:
+    """
+    Return the process-wide profiler configured from settings.REQUEST_PROFILING.
+    """
+    global _profiler
+    with _profiler_lock:
+        if _profiler is None:
+            from django.conf import settings
+            config = settings.REQUEST_PROFILING
+            _profiler = RequestProfiler(
+                directory=config['DIRECTORY'],
+                token=config['TOKEN'],
+                sample_rate=config['SAMPLE_RATE'],
+                max_profiles=config['MAX_PROFILES'],
+                header=config['HEADER'],
+            )
+        return _profiler
@@ -1,102 +1,193 @@
-import os
-import json
+import asyncio
 from PIL import Image
 
-from google import genai
-from google.genai import types
+from . import clients, metrics, model_registry
+from .image_descriptions import ImageDescriptionCache, perceptual_hash
 from .text_similarity import TextSimilarity
-from dotenv import load_dotenv
+from .upstream import UpstreamGovernor, get_governor
 
 class PhotoRanker:
-    def __init__(self):
-        self.text_similarity = TextSimilarity()
-        # Configure Gemini API
-        load_dotenv()
-        self.client = genai.Client()
+    # Vision calls in flight at once, across all ranking runs
+    MAX_CONCURRENT_DESCRIPTIONS = 4
+    DESCRIPTION_MODEL_NAME = 'gemini-2.0-flash-exp-image-generation'
+    # Number of images kept after ranking
+    MAX_RANKED_IMAGES = 5
 
+    def __init__(self, image_store, background_loop, text_similarity=None, description_cache=None,
+                 governor=None):
+        self.image_store = image_store
+        # Ranking runs on the shared background loop, the async Gemini client
+        # is bound to it
+        self.background_loop = background_loop
+        # Share the caller's TextSimilarity so the embedding model and its
+        # cache are not duplicated
+        self.text_similarity = text_similarity or TextSimilarity()
+        self.description_cache = description_cache or ImageDescriptionCache()
+        self.governor = governor or get_governor()
+        self._description_slots = None
+
+    @property
+    def client(self):
+        # Shared google.genai client, created once per process
+        return clients.get_genai_client()
+
+    @metrics.timed('rank_photos.generate_image_description')
     async def generate_image_description(self, image_path):
         """
-        Generate a descriptive prompt from the image using Gemini 2.0 Flash experimental
+        Generate a descriptive prompt from the image using Gemini 2.0 Flash experimental.
+        Uses the async client, at most MAX_CONCURRENT_DESCRIPTIONS calls at a time.
         """
+        if self._description_slots is None:
+            self._description_slots = asyncio.Semaphore(self.MAX_CONCURRENT_DESCRIPTIONS)
+
         try:
-            # Load image
-            image = Image.open(image_path)
-            
-            # Create prompt for comprehensive image analysis
-            text_input = "Describe this medical image in concise technical language, focusing on imaging type, anatomical region, and any visible conditions. Limit your response to a single sentence"
-
-            # Generate description using Gemini 2.0 Flash
-            response = self.client.models.generate_content(
-                model="gemini-2.0-flash-exp-image-generation",
-                contents=[text_input, image],
-                config=types.GenerateContentConfig(
-                    response_modalities=['Text']
-                )
-            )
-            
-            # Extract text response
-            for part in response.candidates[0].content.parts:
-                if part.text is not None:
-                    return part.text
-            
-            return ""
+            # Load image, closed once the description is back
+            with Image.open(image_path) as image:
+                # Create prompt for comprehensive image analysis
+                text_input = "Describe this medical image in concise technical language, focusing on imaging type, anatomical region, and any visible conditions. Limit your response to a single sentence"
+
+                # Generate description using Gemini 2.0 Flash
+                types = model_registry.import_module('google.genai.types')
+                async with self._description_slots:
+                    # Images load in the background, so the clinician's
+                    # requests go first
+                    response = await self.governor.acall(
+                        self.DESCRIPTION_MODEL_NAME,
+                        self.client.aio.models.generate_content,
+                        model=self.DESCRIPTION_MODEL_NAME,
+                        contents=[text_input, image],
+                        config=types.GenerateContentConfig(
+                            response_modalities=['Text']
+                        ),
+                        priority=UpstreamGovernor.PRIORITY_BACKGROUND,
+                    )
+
+                # Extract text response
+                for part in response.candidates[0].content.parts:
+                    if part.text is not None:
+                        return part.text
+
+                return ""
         except Exception as e:
             print(f"Error generating image description: {e}")
             print(f"Error type: {type(e)}")
             print(f"Error details: {str(e)}")
             return ""
 
-    async def rank_photos(self, original_prompt):
+    async def describe_image(self, image_path):
+        """
+        Return the description of an image, served from the perceptual-hash
+        cache when the same (or a near-identical) image was described before.
+
+        Returns:
+            dict: 'description', 'phash' (None if hashing failed) and 'cached'
+        """
+        loop = asyncio.get_running_loop()
+        phash = None
+        try:
+            # Hashing and the ORM lookup are blocking, keep them off the loop
+            phash = await metrics.run_in_executor(loop, None, perceptual_hash, image_path)
+            cached = await metrics.run_in_executor(loop, None, self.description_cache.lookup, phash)
+        except Exception as e:
+            print(f"Error looking up image description cache: {e}")
+            cached = None
+
+        if cached is not None:
+            if cached['embedding'] is not None and cached['embedding_model'] == self.text_similarity.embedding_model_key:
+                self.text_similarity.cache_embedding(cached['description'], cached['embedding'])
+            return {'description': cached['description'], 'phash': phash, 'cached': True}
+
+        description = await self.generate_image_description(image_path)
+        return {'description': description, 'phash': phash, 'cached': False}
+
+    def remember_descriptions(self, described):
         """
-        Rank downloaded images and update the existing google_images_data.json
-        with only the top 5 most relevant images
+        Store new descriptions and their embeddings in the description cache.
+        The embeddings were computed while scoring, so encode() is served
+        from the embedding cache.
         """
-        images_folder = "../assets/images"
-        metadata_folder = "../assets/metadata"
-        json_file_path = os.path.join(metadata_folder, "google_images_data.json")
-        ranked_images = []
-
-        # Read existing metadata
-        with open(json_file_path, 'r') as f:
-            existing_metadata = json.load(f)
-
-        # Process and rank all images
-        for image_data in existing_metadata:
-            image_path = image_data['image_file']
-            
-            # Generate description for the image
-            image_description = await self.generate_image_description(image_path)
-            
-            # Calculate similarity score
-            similarity_score = self.text_similarity.calculate_similarity(
-                original_prompt, 
-                image_description
+        if not described:
+            return
+        embeddings = self.text_similarity.encode([item['description'] for item in described])
+        for item, embedding in zip(described, embeddings):
+            self.description_cache.store(
+                item['phash'],
+                item['description'],
+                embedding=embedding,
+                embedding_model=self.text_similarity.embedding_model_key,
             )
 
-            ranked_images.append({
+    @metrics.timed('rank_photos.rank_images')
+    async def rank_images(self, original_prompt, images):
+        """
+        Describe all images concurrently (known images come from the
+        description cache), then score every description against the
+        prompt in one batched embedding pass.
+
+        Args:
+            original_prompt (str): Text the images should illustrate
+            images (list): Image metadata dicts with an 'image_file' key
+
+        Returns:
+            list: Top MAX_RANKED_IMAGES images, best first, with
+                'ai_description' and 'similarity_score' added
+        """
+        results = await asyncio.gather(*[
+            self.describe_image(image_data['image_file'])
+            for image_data in images
+        ])
+        descriptions = [result['description'] for result in results]
+
+        # Embedding is CPU bound, keep it off the event loop
+        described = [idx for idx, description in enumerate(descriptions) if description]
+        loop = asyncio.get_running_loop()
+        scores = await metrics.run_in_executor(
+            loop,
+            None,
+            self.text_similarity.calculate_similarity_embeddings_batch,
+            original_prompt,
+            [descriptions[idx] for idx in described],
+        )
+        similarity_scores = dict(zip(described, scores))
+
+        new_descriptions = [
+            result for result in results
+            if result['description'] and not result['cached'] and result['phash'] is not None
+        ]
+        try:
+            await metrics.run_in_executor(loop, None, self.remember_descriptions, new_descriptions)
+        except Exception as e:
+            print(f"Error caching image descriptions: {e}")
+
+        ranked_images = [
+            {
                 **image_data,  # Keep all existing metadata
-                'ai_description': image_description,  # Add AI-generated description
-                'similarity_score': similarity_score
-            })
+                'ai_description': descriptions[idx],  # Add AI-generated description
+                'similarity_score': similarity_scores.get(idx, 0.0)
+            }
+            for idx, image_data in enumerate(images)
+        ]
 
-        # Sort images by similarity score and get top 5
+        # Sort images by similarity score and get the top ones
         ranked_images.sort(key=lambda x: x['similarity_score'], reverse=True)
-        top_five_images = ranked_images[:5]
-
-        # Clean up unused images that start with 'image_'
-        removed_images = ranked_images[5:]
-        for image in removed_images:
-            filename = os.path.basename(image['image_file'])
-            if filename.startswith('image_'):
-                try:
-                    image_path = os.path.join(images_folder, filename)
-                    os.remove(image_path)
-                    print(f"Removed unused image: {filename}")
-                except Exception as e:
-                    print(f"Error removing file {filename}: {e}")
-
-        # Update the original JSON file with only top 5
-        with open(json_file_path, 'w') as f:
-            json.dump(top_five_images, f, indent=4)
-
-        return top_five_images
\ No newline at end of file
+        return ranked_images[:self.MAX_RANKED_IMAGES]
+
+    async def rank_photos(self, original_prompt, manifest_id):
+        """
+        Rank the images of a scrape and rewrite its manifest with only the
+        most relevant images, best first. Images are left in the image store,
+        which may share them with other manifests.
+        """
+        manifest = self.image_store.read_manifest(manifest_id)
+        if manifest is None:
+            raise ValueError(f"Unknown image manifest {manifest_id}")
+
+        manifest['images'] = await self.rank_images(original_prompt, manifest['images'])
+        self.image_store.write_manifest(manifest_id, manifest)
+        return manifest['images']
+
+    def rank(self, original_prompt, manifest_id):
+        """
+        Blocking wrapper around rank_photos for worker threads.
+        """
+        return self.background_loop.run(self.rank_photos(original_prompt, manifest_id))
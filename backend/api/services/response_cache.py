@@ -0,0 +1,257 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Sum
+from django.utils import timezone
+
+
+def normalize_message(message):
+    """
+    Normalize a message before it is used in a cache key so that
+    templated messages differing only in whitespace share an entry.
+    """
+    return " ".join(str(message).split())
+
+
+class ResponseCache:
+    """
+    Two tier content-addressed cache.
+
+    The first tier is an in-process LRU, the second tier is the CacheEntry
+    table in the configured database so entries survive restarts and are
+    shared between workers. Both tiers honour the same TTL; the durable tier
+    is additionally capped in bytes per namespace and evicts the least
+    recently used entries when it grows past the cap.
+    """
+
+    # Run the durable size check every N writes instead of on every write
+    EVICTION_INTERVAL = 50
+
+    def __init__(self, namespace, max_entries=None, ttl_seconds=None, max_bytes=None):
+        config = settings.RESPONSE_CACHE
+        self.namespace = namespace
+        self.enabled = config['ENABLED']
+        self.max_entries = max_entries or config['MEMORY_ENTRIES']
+        self.ttl_seconds = ttl_seconds or config['TTL_SECONDS']
+        self.max_bytes = max_bytes or config['MAX_BYTES']
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.memory_hits = 0
+        self.durable_hits = 0
+        self.misses = 0
+        # Entries pushed out of the memory tier, and expired or over-budget
+        # rows deleted from the durable tier
+        self.memory_evictions = 0
+        self.durable_evictions = 0
+
+    def make_key(self, *parts):
+        """
+        Build a content-addressed key from the given parts.
+
+        Returns:
+            str: sha256 hex digest of the namespace and parts
+        """
+        payload = json.dumps([self.namespace, *parts], ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """
+        Look a key up in the memory tier, then in the durable tier.
+
+        Returns:
+            The cached value, or None on a miss
+        """
+        if not self.enabled:
+            return None
+
+        value = self._memory_get(key)
+        if value is not None:
+            return value
+
+        value = self._durable_get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.durable_hits += 1
+        self._memory_set(key, value)
+        return value
+
+    def set(self, key, value):
+        """
+        Store a JSON serializable value in both tiers.
+        """
+        if not self.enabled:
+            return
+        self._memory_set(key, value)
+        self._durable_set(key, value)
+
+    async def aget(self, key):
+        """
+        Async variant of get. Memory hits are served on the event loop, the
+        durable tier is queried in a worker thread.
+        """
+        if not self.enabled:
+            return None
+        value = self._memory_get(key)
+        if value is not None:
+            return value
+        return await sync_to_async(self.get, thread_sensitive=False)(key)
+
+    async def aset(self, key, value):
+        """
+        Async variant of set.
+        """
+        if not self.enabled:
+            return
+        await sync_to_async(self.set, thread_sensitive=False)(key, value)
+
+    def get_or_set(self, key, compute, should_cache=None):
+        """
+        Return the cached value for key, computing and storing it on a miss.
+
+        Args:
+            key (str): Key built with make_key
+            compute (callable): Called with no arguments on a miss
+            should_cache (callable, optional): Predicate deciding whether a
+                computed value may be stored (e.g. to skip error responses)
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+        value = compute()
+        if should_cache is None or should_cache(value):
+            self.set(key, value)
+        return value
+
+    def stats(self):
+        """
+        Return hit/miss counters for this cache.
+        """
+        with self._lock:
+            lookups = self.memory_hits + self.durable_hits + self.misses
+            hits = self.memory_hits + self.durable_hits
+            return {
+                'namespace': self.namespace,
+                'memory_entries': len(self._memory),
+                'memory_hits': self.memory_hits,
+                'durable_hits': self.durable_hits,
+                'misses': self.misses,
+                'memory_evictions': self.memory_evictions,
+                'durable_evictions': self.durable_evictions,
+                'hit_rate': hits / lookups if lookups else 0.0,
+            }
+
+    def clear(self):
+        """
+        Drop every entry of this namespace from both tiers.
+        """
+        from ..models import CacheEntry
+
+        with self._lock:
+            self._memory.clear()
+        CacheEntry.objects.filter(namespace=self.namespace).delete()
+
+    def _memory_get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return value
+                del self._memory[key]
+        return None
+
+    def _memory_set(self, key, value):
+        with self._lock:
+            self._memory[key] = (value, time.time() + self.ttl_seconds)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+                self.memory_evictions += 1
+
+    def _durable_get(self, key):
+        from ..models import CacheEntry
+
+        try:
+            entry = CacheEntry.objects.filter(key=key).first()
+            if entry is None:
+                return None
+            now = timezone.now()
+            if entry.created_at + timedelta(seconds=self.ttl_seconds) <= now:
+                entry.delete()
+                return None
+            CacheEntry.objects.filter(pk=entry.pk).update(last_accessed=now)
+            return json.loads(entry.value)
+        except Exception as e:
+            print(f"Error reading response cache ({self.namespace}): {e}")
+            return None
+
+    def _durable_set(self, key, value):
+        from ..models import CacheEntry
+
+        try:
+            encoded = json.dumps(value, ensure_ascii=False)
+            now = timezone.now()
+            # One INSERT ... ON CONFLICT statement, so concurrent writers of
+            # the same key neither race nor hold a lock across two queries
+            CacheEntry.objects.bulk_create(
+                [CacheEntry(
+                    key=key,
+                    namespace=self.namespace,
+                    value=encoded,
+                    size=len(encoded.encode("utf-8")),
+                    created_at=now,
+                    last_accessed=now,
+                )],
+                update_conflicts=True,
+                unique_fields=['key'],
+                update_fields=['namespace', 'value', 'size', 'created_at', 'last_accessed'],
+            )
+        except Exception as e:
+            print(f"Error writing response cache ({self.namespace}): {e}")
+            return
+
+        with self._lock:
+            self._writes += 1
+            should_evict = self._writes % self.EVICTION_INTERVAL == 0
+        if should_evict:
+            self.evict()
+
+    def evict(self):
+        """
+        Remove expired entries and, if the namespace is still over its byte
+        cap, the least recently used entries until it fits.
+        """
+        from ..models import CacheEntry
+
+        try:
+            entries = CacheEntry.objects.filter(namespace=self.namespace)
+            expired_before = timezone.now() - timedelta(seconds=self.ttl_seconds)
+            removed, _ = entries.filter(created_at__lte=expired_before).delete()
+
+            total = entries.aggregate(total=Sum('size'))['total'] or 0
+            if total > self.max_bytes:
+                stale_ids = []
+                for pk, size in entries.order_by('last_accessed').values_list('pk', 'size').iterator():
+                    if total <= self.max_bytes:
+                        break
+                    stale_ids.append(pk)
+                    total -= size
+                removed += CacheEntry.objects.filter(pk__in=stale_ids).delete()[0]
+
+            with self._lock:
+                self.durable_evictions += removed
+        except Exception as e:
+            print(f"Error evicting response cache ({self.namespace}): {e}")
@@ -0,0 +1,63 @@
+import re
+
+# Boundaries between segments for each unit. Sentences end at ., ! or ?
+# followed by whitespace, paragraphs are separated by blank lines.
+SEGMENT_BOUNDARIES = {
+    'sentence': re.compile(r'(?<=[.!?])\s+'),
+    'paragraph': re.compile(r'\n\s*\n'),
+}
+
+
+def split_segments(text, unit='sentence'):
+    """
+    Split text into segments, keeping the separator that follows each one
+    so the processed segments can be reassembled with the same layout.
+
+    Args:
+        text (str): Text to split
+        unit (str): 'sentence' or 'paragraph'
+
+    Returns:
+        list: (segment, separator) tuples; joining them gives back text
+
+    Raises:
+        ValueError: If the unit is unknown
+    """
+    if unit not in SEGMENT_BOUNDARIES:
+        raise ValueError(
+            f"Unknown segment unit '{unit}', expected one of {', '.join(SEGMENT_BOUNDARIES)}"
+        )
+    segments = []
+    position = 0
+    for boundary in SEGMENT_BOUNDARIES[unit].finditer(text):
+        segments.append((text[position:boundary.start()], boundary.group()))
+        position = boundary.end()
+    segments.append((text[position:], ''))
+    return segments
+
+
+def join_segments(texts, separators):
+    """
+    Reassemble processed segments with the separators of the original text.
+    """
+    return "".join(text + separator for text, separator in zip(texts, separators))
+
+
+def aggregate_similarity(segments, scores):
+    """
+    Combine per-segment similarity scores into one score for the whole
+    text, weighting each segment by its length so a short heading does not
+    count as much as a long paragraph.
+
+    Args:
+        segments (list): Segment texts
+        scores (list): Similarity score of each segment, None to skip it
+
+    Returns:
+        float: Weighted mean score, or None if no segment was scored
+    """
+    weighted = [(len(segment), score) for segment, score in zip(segments, scores) if score is not None]
+    total = sum(weight for weight, _ in weighted)
+    if not total:
+        return None
+    return sum(weight * score for weight, score in weighted) / total
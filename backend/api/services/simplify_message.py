@@ -1,6 +1,8 @@
-import os
-from dotenv import load_dotenv
-from google import generativeai
+import json
+from asgiref.sync import sync_to_async
+from . import clients, metrics
+from .upstream import PartialResponseError, UpstreamGovernor, get_governor
+from .response_cache import ResponseCache, normalize_message
 
 
 """
@@ -39,76 +41,315 @@ Answer:
 """
 
 class SimplifyMessage:
-    def load_env(self):
-        load_dotenv()
-        self.api_key = os.getenv("GOOGLE_API_KEY")
-        # Configure the Gemini API
-        generativeai.configure(api_key=self.api_key)
-        # Create model instances
-        self.gemini_model = generativeai.GenerativeModel('gemini-2.0-flash')
-
-    def simplify_message_easy(self, message) -> str:
+    MODEL_NAME = 'gemini-2.0-flash'
+    # Simplification is what a clinician is waiting on
+    PRIORITY = UpstreamGovernor.PRIORITY_INTERACTIVE
+
+    # Bump whenever a prompt below changes so cached responses for the
+    # old prompt are no longer served
+    PROMPT_VERSION = 1
+
+    METHODS = (
+        'simplify_message_easy',
+        'simplify_message_intermediate',
+        'simplify_message_advanced',
+        'client_to_doctor',
+        'extract_idea',
+    )
+
+    # Fields of the combined response and the per-level method each one
+    # falls back to when it is missing or invalid
+    COMBINED_FIELDS = {
+        'idea': 'extract_idea',
+        'easy': 'simplify_message_easy',
+        'intermediate': 'simplify_message_intermediate',
+        'advanced': 'simplify_message_advanced',
+    }
+
+    COMBINED_SCHEMA = {
+        'type': 'object',
+        'properties': {field: {'type': 'string'} for field in COMBINED_FIELDS},
+        'required': list(COMBINED_FIELDS),
+    }
+
+    def __init__(self, governor=None):
+        self.response_cache = ResponseCache('simplify_message')
+        self.governor = governor or get_governor()
+
+    @property
+    def gemini_model(self):
+        # Shared by every service and thread, configured once per process
+        return clients.get_gemini_model(self.MODEL_NAME)
+
+    def simplify_message_easy(self, message, on_token=None) -> str:
+        return self._generate('simplify_message_easy', message, on_token)
+
+    def simplify_message_intermediate(self, message, on_token=None) -> str:
+        return self._generate('simplify_message_intermediate', message, on_token)
+
+    def simplify_message_advanced(self, message, on_token=None) -> str:
+        return self._generate('simplify_message_advanced', message, on_token)
+
+    def client_to_doctor(self, message, on_token=None) -> str:
+        return self._generate('client_to_doctor', message, on_token)
+
+    def extract_idea(self, message, on_token=None) -> str:
+        return self._generate('extract_idea', message, on_token)
+
+    @metrics.timed('simplify_message.combined')
+    def simplify_all_levels(self, message) -> dict:
+        """
+        Produce the extracted idea and all three simplification levels with
+        a single Gemini call returning a schema-constrained JSON object.
+        Fields that are missing or invalid are filled in with the matching
+        per-level method; a field whose fallback fails too is left out, and
+        the result is then not cached.
+
+        Returns:
+            dict: 'idea', 'easy', 'intermediate' and 'advanced' texts
+        """
+        key = self._cache_key('combined', message)
+        cached = self.response_cache.get(key)
+        if cached is not None:
+            return cached
+
+        try:
+            response = self.governor.call(
+                self.MODEL_NAME,
+                self.gemini_model.generate_content,
+                self._prompt_combined(message),
+                generation_config=self._combined_generation_config(),
+                priority=self.PRIORITY,
+            )
+            result = self._parse_combined(response.text)
+        except Exception as e:
+            print(f"Error generating combined simplification: {e}")
+            result = {}
+
+        for field, method in self.COMBINED_FIELDS.items():
+            if field not in result:
+                try:
+                    result[field] = self._generate(method, message)
+                except Exception as e:
+                    print(f"Error generating '{field}' for the combined simplification: {e}")
+        return self._store_combined(key, message, result)
+
+    @metrics.timed('simplify_message.combined')
+    async def simplify_all_levels_async(self, message) -> dict:
+        """
+        Async variant of simplify_all_levels.
+        """
+        key = self._cache_key('combined', message)
+        cached = await self.response_cache.aget(key)
+        if cached is not None:
+            return cached
+
+        try:
+            response = await self.governor.acall(
+                self.MODEL_NAME,
+                self.gemini_model.generate_content_async,
+                self._prompt_combined(message),
+                generation_config=self._combined_generation_config(),
+                priority=self.PRIORITY,
+            )
+            result = self._parse_combined(response.text)
+        except Exception as e:
+            print(f"Error generating combined simplification: {e}")
+            result = {}
+
+        for field, method in self.COMBINED_FIELDS.items():
+            if field not in result:
+                try:
+                    result[field] = await self.generate_async(method, message)
+                except Exception as e:
+                    print(f"Error generating '{field}' for the combined simplification: {e}")
+        return await sync_to_async(self._store_combined, thread_sensitive=False)(key, message, result)
+
+    def _combined_generation_config(self):
+        return {
+            'response_mime_type': 'application/json',
+            'response_schema': self.COMBINED_SCHEMA,
+        }
+
+    def _parse_combined(self, text) -> dict:
+        """
+        Parse the combined JSON response, keeping only valid fields.
+
+        Returns:
+            dict: Valid fields of COMBINED_FIELDS (non-empty strings)
+        """
+        try:
+            data = json.loads(text)
+        except ValueError:
+            print("Warning: Gemini did not return valid JSON for the combined simplification.")
+            return {}
+        if not isinstance(data, dict):
+            return {}
+
+        valid = {}
+        for field in self.COMBINED_FIELDS:
+            value = data.get(field)
+            if isinstance(value, str) and value.strip():
+                valid[field] = value.strip()
+            else:
+                print(f"Warning: combined simplification has no valid '{field}', falling back.")
+        return valid
+
+    def _store_combined(self, key, message, result) -> dict:
+        # A result missing a field that failed is returned but never cached
+        if any(field not in result for field in self.COMBINED_FIELDS):
+            return result
+        self.response_cache.set(key, result)
+        # Also serve later single-level calls (e.g. extract_idea) from the cache
+        for field, method in self.COMBINED_FIELDS.items():
+            self.response_cache.set(self._cache_key(method, message), result[field])
+        return result
+
+    def _prompt_simplify_message_easy(self, message) -> str:
         instruction = "Task Background: You are a medical language simplifier. Given complex medical sentences from a healthcare provider, your task is to rewrite the content in a way that is very easy for patients to understand. Use plain language while preserving the meaning. Focus on: Removing medical jargon. Explaining terms in patient-friendly language. Using a calm and reassuring tone. Adapting to cultural sensitivity when necessary. Remember, you are only simplifying the message. Do not include thought process or rationale. Just return a simplified version of the input message and remember to be sensitive to the patients feelings when writing the simplified message.  Here is the medical text: " + message
 
         few_shot_examples = "Here are some examples of how you should simplify medical messages: The imaging shows a localized malignant neoplasm in the left lung lobe, requiring biopsy for confirmation. --- SIMPLIFIED:The scan found a small area of cancer in your left lung. We need to do a test called a biopsy to be sure."
 
         final_prompt = instruction + "\n\n" + few_shot_examples
 
-        try:
-            response = self.gemini_model.generate_content(final_prompt)
-            return response.text
-        except Exception as e:
-            return f"An error occurred: {str(e)}"
+        return final_prompt
 
-    def simplify_message_intermediate(self, message) -> str:
+    def _prompt_simplify_message_intermediate(self, message) -> str:
         instruction = "Task Background: You are a medical language simplifier. Given complex medical sentences from a healthcare provider, your task is to rewrite the content in a way that patients with moderate amounts of domain knowledge can understand. Use plain language while preserving the meaning. Focus on: Removing medical jargon. Explaining terms in patient-friendly language. Using a calm and reassuring tone. Adapting to cultural sensitivity when necessary. Remember, you are only simplifying the message. Do not include thought process or rationale. Just return a simplified version of the input message and remember to be sensitive to the patients feelings when writing the simplified message.  Here is the medical text: " + message
 
         few_shot_examples = "Here are some examples of how you should simplify medical messages: The imaging shows a localized malignant neoplasm in the left lung lobe, requiring biopsy for confirmation. --- SIMPLIFIED: You have a mild case of pneumonia, which is an infection in your lungs. We're treating it with antibiotics to help you get better."
 
         final_prompt = instruction + "\n\n" + few_shot_examples
 
-        try:
-            response = self.gemini_model.generate_content(final_prompt)
-            return response.text
-        except Exception as e:
-            return f"An error occurred: {str(e)}"
+        return final_prompt
         
-    def simplify_message_advanced(self, message) -> str:
+    def _prompt_simplify_message_advanced(self, message) -> str:
         instruction = "Task Background: You are a medical language simplifier. Given complex medical sentences from a healthcare provider, your task is to rewrite the content for recipients with advanced medical knowledge and expertise. Use appropriate technical language while preserving clinical accuracy. Focus on: Maintaining precise medical terminology, Providing sufficient technical detail, Using a professional and scientifically rigorous tone, Being culturally sensitive and appropriate. Remember, you are only simplifying the message for an advanced audience. Do not include thought process or rationale. Just return a technically accurate version of the input message that would be appropriate for someone with strong medical domain knowledge. Here is the medical text: " + message
 
         few_shot_examples = "Here are some examples of how you should simplify medical messages: The imaging shows a localized malignant neoplasm in the left lung lobe, requiring biopsy for confirmation. --- SIMPLIFIED: Patient presents with mild bacterial pneumonia characterized by lower respiratory tract infection. Treatment protocol initiated with broad-spectrum antibiotic therapy to target the causative pathogen."
 
         final_prompt = instruction + "\n\n" + few_shot_examples
 
-        try:
-            response = self.gemini_model.generate_content(final_prompt)
-            return response.text
-        except Exception as e:
-            return f"An error occurred: {str(e)}"
+        return final_prompt
         
-    def client_to_doctor(self, message) -> str:
+    def _prompt_client_to_doctor(self, message) -> str:
         instruction = "Task Background: You are a communication assistant helping patients clearly express their symptoms and concerns to healthcare providers. Given a patient's description, your task is to help articulate their thoughts more clearly while keeping their original words and meaning. Focus on: Organizing their thoughts in a clear structure, Maintaining their own descriptions and terminology, Ensuring all their concerns are expressed clearly, Preserving the timeline of their symptoms. Do not translate terms into medical language or ask for additional information. Also, do not provide any rationale or thought process - simply help structure and clarify their existing message. Here is the patient's description: " + message
 
         few_shot_examples = "Here are some examples of how you should assist in articulation of client messages: I have a headache and a cough. I have been coughing for 3 days and the headache started yesterday.. --- TRANSFORMED INTO: I'm experiencing a headache and a cough. The cough started three days ago. The headache began yesterday."
 
         final_prompt = instruction + "\n\n" + few_shot_examples
 
-        try:
-            response = self.gemini_model.generate_content(final_prompt)
-            return response.text
-        except Exception as e:
-            return f"An error occurred: {str(e)}"
+        return final_prompt
 
         
-    def extract_idea(self, message) -> str:
+    def _prompt_extract_idea(self, message) -> str:
         instruction = "Task Background: You are a medical language simplifier. Given complex medical sentences from a healthcare professional, you task is to extract the illness or condition that the patient has. I want you to return the illness or condition only, nothing else Here is the medical text: " + message
 
         few_shot_examples = "Here are some examples of how you should extract the main idea of a medical sentence: The patient has a mild case of pneumonia and is being treated with antibiotics. --- MAIN IDEA: pneumonia"
 
         final_prompt = instruction + "\n\n" + few_shot_examples
 
+        return final_prompt
+
+    def _prompt_combined(self, message) -> str:
+        instruction = "Task Background: You are a medical language simplifier. Given complex medical sentences from a healthcare provider, your task is to extract the illness or condition the patient has and to rewrite the content at three levels. Return a JSON object with these fields: " \
+            "'idea': the illness or condition only, nothing else. " \
+            "'easy': a version that is very easy for patients to understand. Use plain language while preserving the meaning, remove medical jargon, explain terms in patient-friendly language and use a calm and reassuring tone. " \
+            "'intermediate': a version that patients with moderate amounts of domain knowledge can understand, with plain language, patient-friendly explanations and a calm and reassuring tone. " \
+            "'advanced': a version for recipients with advanced medical knowledge and expertise, using precise medical terminology, sufficient technical detail and a professional, scientifically rigorous tone. " \
+            "Be culturally sensitive and sensitive to the patients feelings. Do not include thought process or rationale in any field. Here is the medical text: " + message
+
+        few_shot_examples = "Here is an example: The imaging shows a localized malignant neoplasm in the left lung lobe, requiring biopsy for confirmation. --- " + json.dumps({
+            'idea': "lung cancer",
+            'easy': "The scan found a small area of cancer in your left lung. We need to do a test called a biopsy to be sure.",
+            'intermediate': "The scan shows a small tumor in your left lung that may be cancer. We need to take a small tissue sample, called a biopsy, to confirm it.",
+            'advanced': "Imaging demonstrates a localized malignant neoplasm of the left pulmonary lobe; histopathological confirmation via biopsy is indicated.",
+        })
+
+        final_prompt = instruction + "\n\n" + few_shot_examples
+
+        return final_prompt
+
+    def _cache_key(self, method, message):
+        return self.response_cache.make_key(method, self.PROMPT_VERSION, normalize_message(message))
+
+    def _generate(self, method, message, on_token=None) -> str:
+        """
+        Run the method's prompt through Gemini, serving repeat messages from
+        the response cache. Upstream errors (after the governor's retries)
+        are raised, so a failure is never cached or mistaken for a text.
+
+        If on_token is given the response is streamed and on_token is called
+        with each chunk of text as it arrives (a cached response arrives as a
+        single chunk). The full text is still returned.
+        """
+        with metrics.span(f"simplify_message.{method}"):
+            return self._generate_text(method, message, on_token)
+
+    def _generate_text(self, method, message, on_token) -> str:
+        key = self._cache_key(method, message)
+        cached = self.response_cache.get(key)
+        if cached is not None:
+            if on_token is not None:
+                on_token(cached)
+            return cached
+
+        final_prompt = getattr(self, f"_prompt_{method}")(message)
+        if on_token is None:
+            text = self.governor.call(
+                self.MODEL_NAME, self._complete, final_prompt, priority=self.PRIORITY
+            )
+        else:
+            text = self.governor.call(
+                self.MODEL_NAME, self._stream, final_prompt, on_token, priority=self.PRIORITY
+            )
+
+        self.response_cache.set(key, text)
+        return text
+
+    def _complete(self, prompt) -> str:
+        return self.gemini_model.generate_content(prompt).text
+
+    def _stream(self, prompt, on_token) -> str:
+        chunks = []
         try:
-            response = self.gemini_model.generate_content(final_prompt)
-            return response.text
+            for chunk in self.gemini_model.generate_content(prompt, stream=True):
+                chunks.append(chunk.text)
+                on_token(chunk.text)
         except Exception as e:
-            return f"An error occurred: {str(e)}"
+            if chunks:
+                # Retrying would replay tokens the caller already received
+                raise PartialResponseError(str(e)) from e
+            raise
+        return "".join(chunks)
+
+    async def generate_async(self, method, message) -> str:
+        """
+        Async variant of the public methods, e.g.
+        await generate_async('simplify_message_easy', message). Uses the
+        Gemini async client, so it must be awaited on a long-lived event
+        loop (an ASGI worker).
+        """
+        if method not in self.METHODS:
+            raise ValueError(f"Unknown SimplifyMessage method '{method}'")
+
+        with metrics.span(f"simplify_message.{method}"):
+            return await self._generate_text_async(method, message)
+
+    async def _generate_text_async(self, method, message) -> str:
+        key = self._cache_key(method, message)
+        cached = await self.response_cache.aget(key)
+        if cached is not None:
+            return cached
+
+        final_prompt = getattr(self, f"_prompt_{method}")(message)
+        response = await self.governor.acall(
+            self.MODEL_NAME,
+            self.gemini_model.generate_content_async,
+            final_prompt,
+            priority=self.PRIORITY,
+        )
+        text = response.text
+
+        await self.response_cache.aset(key, text)
+        return text
@@ -0,0 +1,90 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent calls: the first caller for a key runs
+    the work, callers arriving while it is in flight wait for and share its
+    result (or exception). Nothing is kept once the call finishes, repeated
+    requests after that are the response cache's job.
+    """
+
+    def __init__(self, name='single-flight'):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._async_calls = {}
+        self._leaders = 0
+        self._coalesced = 0
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        Run fn(*args, **kwargs) unless an identical call is already in
+        flight, in which case wait for that call instead.
+
+        Args:
+            key: Hashable identity of the call
+
+        Returns:
+            The result of the (possibly shared) call
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+                self._leaders += 1
+            else:
+                self._coalesced += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    async def ado(self, key, fn, *args, **kwargs):
+        """
+        Async variant of do for coroutine functions. Calls are coalesced
+        per event loop.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            task = self._async_calls.get((loop, key))
+            if task is None:
+                task = loop.create_task(fn(*args, **kwargs))
+                self._async_calls[(loop, key)] = task
+                task.add_done_callback(lambda _: self._forget(loop, key))
+                self._leaders += 1
+            else:
+                self._coalesced += 1
+        # A follower disconnecting must not cancel the shared call
+        return await asyncio.shield(task)
+
+    def _forget(self, loop, key):
+        with self._lock:
+            self._async_calls.pop((loop, key), None)
+
+    def stats(self) -> dict:
+        """
+        Counters for the calls that ran and the calls that were coalesced.
+        """
+        with self._lock:
+            return {
+                'name': self.name,
+                'leaders': self._leaders,
+                'coalesced': self._coalesced,
+                'in_flight': len(self._calls) + len(self._async_calls),
+            }
@@ -1,23 +1,123 @@
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from dotenv import load_dotenv
-import os
-import google.generativeai as generativeai
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from django.conf import settings
+from . import clients, metrics, model_registry
+from .embedding_backends import get_embedding_backend
+from .upstream import UpstreamGovernor, get_governor
+import asyncio
+import hashlib
+import threading
 import math
 
 class TextSimilarity:
-    def __init__(self):
-        self.model = SentenceTransformer('all-mpnet-base-v2') 
+    # Maximum number of text embeddings kept in the in-process cache
+    EMBEDDING_CACHE_SIZE = 2048
+    # Pairs scored per chunk by calculate_similarity_pairs
+    PAIRS_CHUNK_SIZE = 512
+    # Gemini model used for LLM similarity
+    LLM_MODEL_NAME = 'gemini-2.0-flash'
+    # Scoring policies, see settings.SIMILARITY_POLICY
+    POLICIES = ('fast', 'balanced', 'full')
+    # Which path produced a score
+    PATH_EMBEDDING = 'embedding'
+    PATH_COMBINED = 'embedding+llm'
+    # Language the embedding model was trained on (all-mpnet-base-v2 is
+    # English only). Cross-language pairs score low on it whatever their
+    # meaning, so a translation's cosine is taken against the text it was
+    # translated from instead, see embedding_reference
+    EMBEDDING_LANGUAGE = 'en'
 
-    def load_env(self):
-        load_dotenv()
-        self.api_key = os.getenv("GOOGLE_API_KEY")
-        # Configure the Gemini API
-        generativeai.configure(api_key=self.api_key)
-        # Create model instances
-        self.gemini_model = generativeai.GenerativeModel('gemini-2.0-flash')
+    def __init__(self, model_name='all-mpnet-base-v2', backend=None, governor=None):
+        self.model_name = model_name
+        self.backend_name = backend or settings.EMBEDDING_BACKEND
+        self.governor = governor or get_governor()
+        # Forward passes are CPU bound, async callers run them here so the
+        # event loop stays responsive
+        self._embedding_executor = ThreadPoolExecutor(
+            max_workers=settings.EMBEDDING_WORKERS,
+            thread_name_prefix='embedding',
+        )
+        self._embedding_cache = OrderedDict()
+        self._embedding_cache_lock = threading.Lock()
+
+    @property
+    def backend(self):
+        # Loaded on first use and shared with every other TextSimilarity
+        return get_embedding_backend(self.backend_name, self.model_name)
+
+    @property
+    def model(self):
+        return self.backend.model
+
+    @property
+    def embedding_model_key(self) -> str:
+        """Identifies which model and backend produced an embedding."""
+        return f"{self.backend_name}:{self.model_name}"
+
+    def is_loaded(self) -> bool:
+        return model_registry.is_loaded(f"embedding_backend:{self.backend_name}:{self.model_name}")
+
+    @property
+    def gemini_model(self):
+        # Shared by every service and thread, configured once per process
+        return clients.get_gemini_model(self.LLM_MODEL_NAME)
 
     
+    @metrics.timed('text_similarity.encode')
+    def encode(self, texts, cache=True) -> np.ndarray:
+        """
+        Encode texts into embeddings, reusing cached embeddings and running
+        every uncached unique text through the model in a single batch.
+        
+        Args:
+            texts (list): Texts to encode
+            cache (bool): Keep the new embeddings in the cache. Bulk callers
+                turn this off so one-off texts don't evict the hot ones
+            
+        Returns:
+            np.ndarray: Matrix of shape (len(texts), embedding_dim)
+        """
+        keys = [hashlib.sha256(text.encode("utf-8")).hexdigest() for text in texts]
+        embeddings = {}
+        with self._embedding_cache_lock:
+            for key in keys:
+                if key in self._embedding_cache:
+                    self._embedding_cache.move_to_end(key)
+                    embeddings[key] = self._embedding_cache[key]
+        
+        # Unique texts that still need a forward pass
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in embeddings:
+                missing.setdefault(key, text)
+        
+        if missing:
+            encoded = self.backend.encode(list(missing.values()))
+            with self._embedding_cache_lock:
+                for key, embedding in zip(missing, encoded):
+                    embeddings[key] = embedding
+                    if not cache:
+                        continue
+                    self._embedding_cache[key] = embedding
+                    self._embedding_cache.move_to_end(key)
+                while len(self._embedding_cache) > self.EMBEDDING_CACHE_SIZE:
+                    self._embedding_cache.popitem(last=False)
+        
+        return np.stack([embeddings[key] for key in keys])
+    
+    def cache_embedding(self, text, embedding):
+        """
+        Seed the embedding cache with an embedding computed earlier (e.g.
+        loaded from the image description cache).
+        """
+        key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        with self._embedding_cache_lock:
+            self._embedding_cache[key] = np.asarray(embedding, dtype=np.float32)
+            self._embedding_cache.move_to_end(key)
+            while len(self._embedding_cache) > self.EMBEDDING_CACHE_SIZE:
+                self._embedding_cache.popitem(last=False)
+    
     def calculate_similarity_embeddings(self, text1: str, text2: str) -> float:
         """
         Calculate semantic similarity between two texts using embeddings.
@@ -29,37 +129,182 @@ class TextSimilarity:
         Returns:
             float: Similarity score (0-1) 
         """
-        # Generate embeddings for both texts
-        embedding1 = self.model.encode(text1, convert_to_tensor=True)
-        embedding2 = self.model.encode(text2, convert_to_tensor=True)
+        return self.calculate_similarity_embeddings_batch(text1, [text2])[0]
+    
+    def calculate_similarity_embeddings_batch(self, original_text: str, candidates: list) -> list:
+        """
+        Calculate embedding similarity between one text and many candidates.
+        The original is encoded once, the candidates in a single batch, and
+        all cosines are computed with one matrix-vector product.
         
-        # Move tensors to CPU before converting to numpy
-        embedding1 = embedding1.cpu().numpy()
-        embedding2 = embedding2.cpu().numpy()
+        Args:
+            original_text (str): Text every candidate is compared against
+            candidates (list): Texts to compare
+            
+        Returns:
+            list: Similarity scores in the same order as candidates
+        """
+        if not candidates:
+            return []
+        
+        embeddings = self.encode([original_text, *candidates])
+        original_embedding = embeddings[0]
+        candidate_embeddings = embeddings[1:]
         
         # Calculate cosine similarity
-        similarity = float(np.inner(embedding1, embedding2) / 
-                         (np.linalg.norm(embedding1) * np.linalg.norm(embedding2)))
+        norms = np.linalg.norm(candidate_embeddings, axis=1) * np.linalg.norm(original_embedding)
+        similarities = candidate_embeddings @ original_embedding / np.maximum(norms, 1e-12)
+        
+        return [float(similarity) for similarity in similarities]
+    
+    def calculate_similarity_pairs(self, pairs, policy='fast', chunk_size=None, llm_executor=None,
+                                   priority=UpstreamGovernor.PRIORITY_BACKGROUND, target_language=None):
+        """
+        Score many (original, translated) pairs, yielding one list of results
+        per chunk so memory stays flat however many pairs are given. In each
+        chunk the unique texts are encoded once and all cosines are computed
+        in one vectorized operation; LLM scores are only requested when the
+        policy asks for them.
+        
+        Args:
+            pairs (iterable): (original, translated) or (original,
+                translated, source) tuples, where source is the text the
+                translation was made from (see embedding_reference)
+            policy (str): 'fast' (embeddings only), 'balanced' or 'full'
+            chunk_size (int, optional): Pairs per chunk
+            llm_executor (Executor, optional): Runs the LLM calls of a chunk
+                concurrently; they run one after another without it
+            priority (int): Upstream governor priority of the LLM calls;
+                offline re-scoring must not hold up live requests
+            target_language (str, optional): Language of the translated
+                texts, see embedding_reference
             
-        return similarity
+        Yields:
+            list: Per-pair results of the chunk ('similarity_score' and
+                'similarity_path', or 'error' when the LLM call failed)
+        
+        Raises:
+            ValueError: If a cross-language pair has no source
+        """
+        policy = self.resolve_policy(policy)
+        chunk_size = chunk_size or self.PAIRS_CHUNK_SIZE
+        chunk = []
+        for pair in pairs:
+            chunk.append(pair)
+            if len(chunk) == chunk_size:
+                yield self._score_pairs_chunk(chunk, policy, llm_executor, priority, target_language)
+                chunk = []
+        if chunk:
+            yield self._score_pairs_chunk(chunk, policy, llm_executor, priority, target_language)
     
-    def calculate_similarity_llm(self, text1: str, text2: str) -> float:
+    def _score_pairs_chunk(self, pairs, policy, llm_executor, priority, target_language=None) -> list:
+        # The LLM compares original and translation, the embeddings compare
+        # the original with its same-language reference
+        pairs = [
+            (pair[0], pair[1], self.embedding_reference(pair[1], *pair[2:], target_language=target_language))
+            for pair in pairs
+        ]
+        # Encode every unique text of the chunk once
+        texts = list(dict.fromkeys(text for original, _, reference in pairs for text in (original, reference)))
+        index = {text: position for position, text in enumerate(texts)}
+        embeddings = self.encode(texts, cache=False)
+        originals = embeddings[[index[original] for original, _, _ in pairs]]
+        references = embeddings[[index[reference] for _, _, reference in pairs]]
+        
+        # Row-wise cosine of every pair at once
+        norms = np.linalg.norm(originals, axis=1) * np.linalg.norm(references, axis=1)
+        cosines = np.einsum('ij,ij->i', originals, references) / np.maximum(norms, 1e-12)
+        embedding_scores = [float(cosine) for cosine in cosines]
+        
+        escalated = [
+            position for position, score in enumerate(embedding_scores)
+            if self.needs_llm(score, policy)
+        ]
+        if llm_executor is None:
+            llm_calls = {
+                position: (lambda pair=pairs[position]: self.calculate_similarity_llm(*pair[:2], priority=priority))
+                for position in escalated
+            }
+        else:
+            futures = {
+                position: metrics.submit(
+                    llm_executor,
+                    self.calculate_similarity_llm, *pairs[position][:2], priority=priority
+                )
+                for position in escalated
+            }
+            llm_calls = {position: future.result for position, future in futures.items()}
+        
+        results = []
+        for position, embedding_score in enumerate(embedding_scores):
+            try:
+                llm_score = llm_calls[position]() if position in llm_calls else None
+                results.append(self.scored(embedding_score, llm_score))
+            except Exception as e:
+                print(f"Error scoring pair with the LLM: {e}")
+                results.append({'error': str(e), 'status': 'error'})
+        return results
+    
+    @metrics.timed('text_similarity.llm')
+    def calculate_similarity_llm(self, text1: str, text2: str,
+                                 priority=UpstreamGovernor.PRIORITY_INTERACTIVE) -> float:
         """
         Calculate semantic similarity between two texts using Gemini LLM.
         
         Args:
             text1 (str): First text to compare
             text2 (str): Second text to compare
+            priority (int): Upstream governor priority of the call
             
         Returns:
             float: Similarity score (0-1)
         """
-        # Ensure the API is configured
-        if not hasattr(self, 'gemini_model'):
-            self.load_env()
+        prompt = self._similarity_prompt(text1, text2)
+        
+        # Get response from Gemini
+        response = self.governor.call(
+            self.LLM_MODEL_NAME, self.gemini_model.generate_content, prompt, priority=priority
+        )
+        
+        return self._parse_similarity(response)
+    
+    @metrics.timed('text_similarity.llm')
+    async def calculate_similarity_llm_async(self, text1: str, text2: str) -> float:
+        """
+        Async variant of calculate_similarity_llm using the Gemini async client.
+        
+        Args:
+            text1 (str): First text to compare
+            text2 (str): Second text to compare
             
+        Returns:
+            float: Similarity score (0-1)
+        """
+        response = await self.governor.acall(
+            self.LLM_MODEL_NAME,
+            self.gemini_model.generate_content_async,
+            self._similarity_prompt(text1, text2),
+            priority=UpstreamGovernor.PRIORITY_INTERACTIVE,
+        )
+        return self._parse_similarity(response)
+    
+    async def calculate_similarity_embeddings_batch_async(self, original_text: str, candidates: list) -> list:
+        """
+        Async variant of calculate_similarity_embeddings_batch. The forward
+        pass runs on the embedding executor.
+        """
+        loop = asyncio.get_running_loop()
+        return await metrics.run_in_executor(
+            loop,
+            self._embedding_executor,
+            self.calculate_similarity_embeddings_batch,
+            original_text,
+            candidates,
+        )
+    
+    def _similarity_prompt(self, text1: str, text2: str) -> str:
         # Create prompt for Gemini
-        prompt = f"""
+        return f"""
         Compare the semantic similarity between these two texts and return a single float value 
         between 0 and 1, where 0 means completely different and 1 means identical in meaning.
         
@@ -76,10 +321,9 @@ class TextSimilarity:
         
         Return only a single float number between 0 and 1 without any explanation. Do not include any other text in your response.
         """
-        
-        # Get response from Gemini
-        response = self.gemini_model.generate_content(prompt)
-        
+    
+    @staticmethod
+    def _parse_similarity(response) -> float:
         try:
             # Extract the float value from the response
             similarity_score = float(response.text.strip())
@@ -106,6 +350,171 @@ class TextSimilarity:
         embedding_score = self.calculate_similarity_embeddings(text1, text2)
         llm_score = self.calculate_similarity_llm(text1, text2)
         
+        return self.combine_scores(embedding_score, llm_score)
+    
+    def resolve_policy(self, policy=None) -> str:
+        """
+        Return the scoring policy to use, falling back to the configured
+        default when none is given.
+        
+        Raises:
+            ValueError: If the policy is unknown
+        """
+        policy = policy or settings.SIMILARITY_POLICY['DEFAULT']
+        if policy not in self.POLICIES:
+            raise ValueError(
+                f"Unknown similarity policy '{policy}', expected one of {', '.join(self.POLICIES)}"
+            )
+        return policy
+    
+    def needs_llm(self, embedding_score: float, policy: str) -> bool:
+        """
+        Whether a score needs the LLM under the given policy. 'balanced' only
+        escalates cosines inside the uncertainty band.
+        """
+        if policy == 'fast':
+            return False
+        if policy == 'full':
+            return True
+        low = settings.SIMILARITY_POLICY['LOW_THRESHOLD']
+        high = settings.SIMILARITY_POLICY['HIGH_THRESHOLD']
+        return low < embedding_score < high
+
+    def same_language(self, target_language) -> bool:
+        """
+        Whether texts in target_language share the embedding model's
+        language. None means unknown and is treated as the same.
+        """
+        if not target_language:
+            return True
+        return target_language.split('-')[0].lower() == self.EMBEDDING_LANGUAGE
+
+    def embedding_reference(self, translated_text: str, source_text=None, target_language=None) -> str:
+        """
+        Text whose embedding is compared with the original's. A cosine
+        across languages says more about the language than the meaning, so
+        when source_text (the EMBEDDING_LANGUAGE text the translation was
+        made from) is given the cosine is taken against it, keeping the
+        embedding score and the policy thresholds same-language.
+        
+        Args:
+            translated_text (str): Translation being scored
+            source_text (str, optional): Text it was translated from
+            target_language (str, optional): Language of translated_text
+            
+        Returns:
+            str: source_text if given, else translated_text
+            
+        Raises:
+            ValueError: If translated_text is in another language and no
+                source_text is given
+        """
+        if source_text is not None:
+            return source_text
+        if not self.same_language(target_language):
+            raise ValueError(
+                f"Scoring a '{target_language}' translation needs the '{self.EMBEDDING_LANGUAGE}' text it was translated from"
+            )
+        return translated_text
+    
+    def scored(self, embedding_score: float, llm_score=None) -> dict:
+        """
+        Build the final score of a pair and record which path produced it.
+        Without an LLM score the embedding score stands in for it, so both
+        paths go through the same calibration.
+        
+        Args:
+            embedding_score (float): Embedding-based similarity
+            llm_score (float, optional): LLM-based similarity
+            
+        Returns:
+            dict: 'similarity_score' and 'similarity_path'
+        """
+        if llm_score is None:
+            return {
+                'similarity_score': self.combine_scores(embedding_score, embedding_score),
+                'similarity_path': self.PATH_EMBEDDING,
+            }
+        return {
+            'similarity_score': self.combine_scores(embedding_score, llm_score),
+            'similarity_path': self.PATH_COMBINED,
+        }
+    
+    def calculate_tiered_similarity(self, text1: str, text2: str, policy=None, target_language=None,
+                                    source_text=None) -> dict:
+        """
+        Calculate similarity with the embedding score first and only ask the
+        LLM when the policy requires it.
+        
+        Args:
+            text1 (str): First text to compare
+            text2 (str): Second text to compare
+            policy (str, optional): 'fast', 'balanced' or 'full'
+            target_language (str, optional): Language of text2
+            source_text (str, optional): Text text2 was translated from,
+                see embedding_reference
+            
+        Returns:
+            dict: 'similarity_score' and 'similarity_path'
+        """
+        policy = self.resolve_policy(policy)
+        reference = self.embedding_reference(text2, source_text, target_language)
+        embedding_score = self.calculate_similarity_embeddings(text1, reference)
+        llm_score = None
+        if self.needs_llm(embedding_score, policy):
+            llm_score = self.calculate_similarity_llm(text1, text2)
+        return self.scored(embedding_score, llm_score)
+    
+    async def calculate_tiered_similarity_batch_async(self, original_text: str, candidates: list, policy=None,
+                                                      target_language=None, sources=None) -> list:
+        """
+        Async tiered scoring of many candidates: one embedding batch, then
+        concurrent LLM calls for the candidates the policy escalates. A
+        failed LLM call is returned in place of that candidate's result.
+        
+        Args:
+            sources (list, optional): Text each candidate was translated
+                from, see embedding_reference
+        
+        Returns:
+            list: Results (or exceptions) in the same order as candidates
+        """
+        policy = self.resolve_policy(policy)
+        sources = sources or [None] * len(candidates)
+        references = [
+            self.embedding_reference(candidate, source, target_language)
+            for candidate, source in zip(candidates, sources)
+        ]
+        embedding_scores = await self.calculate_similarity_embeddings_batch_async(original_text, references)
+        escalated = [
+            index for index, score in enumerate(embedding_scores)
+            if self.needs_llm(score, policy)
+        ]
+        llm_scores = dict(zip(escalated, await asyncio.gather(
+            *[self.calculate_similarity_llm_async(original_text, candidates[index]) for index in escalated],
+            return_exceptions=True,
+        )))
+        results = []
+        for index, embedding_score in enumerate(embedding_scores):
+            llm_score = llm_scores.get(index)
+            if isinstance(llm_score, Exception):
+                results.append(llm_score)
+            else:
+                results.append(self.scored(embedding_score, llm_score))
+        return results
+    
+    @staticmethod
+    def combine_scores(embedding_score: float, llm_score: float) -> float:
+        """
+        Combine an embedding score and an LLM score into the final score.
+        
+        Args:
+            embedding_score (float): Embedding-based similarity
+            llm_score (float): LLM-based similarity
+            
+        Returns:
+            float: Combined similarity score (0-1)
+        """
         # Give more weight to LLM-based similarity as it's better at understanding semantic meaning
         # Add a small constant to the LLM score to ensure it's not too low (biased result)
         # Embedding score is more discriminative, so we add bias term
@@ -115,4 +524,3 @@ class TextSimilarity:
         combined_score = 1 / (1 + math.exp(-5 * (raw_combined_score - 0.5)))
         
         return combined_score
-    
@@ -1,13 +1,76 @@
-from google.cloud import translate_v2 as translate
+import asyncio
+
+from . import clients, metrics
+from .response_cache import ResponseCache
+
 
 class TranslateMessage:
+    # Google Translate v2 accepts at most 128 segments per request
+    MAX_BATCH_SIZE = 128
+
+    def __init__(self):
+        self.response_cache = ResponseCache('translate_message')
+
+    def get_client(self):
+        """
+        Return the process-wide Translate client (see clients.py). It keeps
+        its authorized, pooled HTTP session and is shared by all threads,
+        so credentials are only loaded once per process.
+        """
+        return clients.get_translate_client()
+
     def translate_text(self, text, target_language='en'):
-        translate_client = translate.Client()
-        try:
-            result = translate_client.translate(
-                text,
+        return self.translate_batch([text], target_language)[0]
+
+    @metrics.timed('translate_message.translate_batch')
+    def translate_batch(self, texts, target_language='en'):
+        """
+        Translate a list of texts with as few upstream requests as possible.
+        Cached translations are served locally, identical texts are only sent
+        once and the rest go out in chunks of MAX_BATCH_SIZE.
+
+        Args:
+            texts (list): Texts to translate
+            target_language (str): Language code to translate into
+
+        Returns:
+            list: Translated texts in the same order as texts
+
+        Raises:
+            Exception: The Translate client's error if a request fails.
+                Chunks translated before the failure stay cached.
+        """
+        results = [None] * len(texts)
+        keys = [self.response_cache.make_key(text, target_language) for text in texts]
+
+        # Positions waiting on each untranslated text
+        pending = {}
+        for idx, (text, key) in enumerate(zip(texts, keys)):
+            cached = self.response_cache.get(key)
+            if cached is not None:
+                results[idx] = cached
+            else:
+                pending.setdefault(text, []).append(idx)
+
+        missing = list(pending)
+        for start in range(0, len(missing), self.MAX_BATCH_SIZE):
+            chunk = missing[start:start + self.MAX_BATCH_SIZE]
+            translated = self.get_client().translate(
+                chunk,
                 target_language=target_language
             )
-            return result['translatedText']
-        except Exception as e:
-            return f"Translation error: {str(e)}"
\ No newline at end of file
+
+            for text, result in zip(chunk, translated):
+                for idx in pending[text]:
+                    results[idx] = result['translatedText']
+                self.response_cache.set(keys[pending[text][0]], result['translatedText'])
+
+        return results
+
+    async def translate_batch_async(self, texts, target_language='en'):
+        """
+        Async variant of translate_batch. The Translate v2 client is
+        synchronous, so the batch runs in a worker thread to keep the event
+        loop free.
+        """
+        return await asyncio.to_thread(self.translate_batch, texts, target_language)
@@ -0,0 +1,453 @@
+"""
+Shared governor for calls to Gemini.
+
+Every service that calls Gemini goes through one process-wide
+UpstreamGovernor, which per model:
+
+- spaces calls with a token bucket sized to the model's requests-per-minute
+  quota,
+- bounds the calls in flight with an AIMD limit that grows while calls
+  succeed and halves when the API throttles,
+- hands tokens and free slots to the highest priority waiter first,
+- retries throttled and transient failures with jittered exponential backoff.
+
+Both threads and coroutines (on any event loop) can wait on the same limits.
+"""
+import asyncio
+import heapq
+import itertools
+import random
+import threading
+import time
+
+from . import metrics
+
+# HTTP statuses worth retrying, and the subset meaning "slow down"
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+THROTTLE_STATUSES = {429}
+# Exception class names of the Gemini SDKs for the same conditions, matched
+# by name so neither SDK has to be imported here
+RETRYABLE_ERRORS = {
+    'ResourceExhausted', 'TooManyRequests', 'ServiceUnavailable',
+    'InternalServerError', 'DeadlineExceeded', 'GatewayTimeout',
+}
+THROTTLE_ERRORS = {'ResourceExhausted', 'TooManyRequests'}
+
+
+class PartialResponseError(Exception):
+    """
+    A streamed response failed after part of it was delivered. Never
+    retried, as the delivered part cannot be taken back.
+    """
+
+
+def error_status(error):
+    """
+    Return the HTTP status carried by an SDK error, or None.
+    """
+    for attr in ('code', 'status_code'):
+        status = getattr(error, attr, None)
+        if isinstance(status, int):
+            return int(status)
+    return None
+
+
+def is_throttle(error) -> bool:
+    return error_status(error) in THROTTLE_STATUSES or type(error).__name__ in THROTTLE_ERRORS
+
+
+def is_retryable(error) -> bool:
+    if isinstance(error, PartialResponseError):
+        return False
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    return error_status(error) in RETRYABLE_STATUSES or type(error).__name__ in RETRYABLE_ERRORS
+
+
+class _Waiter:
+    __slots__ = ('wake', 'granted')
+
+    def __init__(self, wake):
+        self.wake = wake
+        self.granted = False
+
+
+class TokenBucket:
+    """
+    Token bucket refilled at rate_per_minute, holding at most burst tokens.
+    Tokens go to waiters in priority order (lower value first), FIFO within
+    a priority, so a background caller queued earlier cannot take the next
+    token from an interactive one.
+    """
+
+    def __init__(self, rate_per_minute, burst=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(burst or max(1.0, self.rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+    @property
+    def waiting(self) -> int:
+        with self._lock:
+            return len(self._waiters)
+
+    def acquire(self, priority=0):
+        """
+        Block the calling thread until a token is granted.
+        """
+        event = threading.Event()
+        waiter = _Waiter(event.set)
+        with self._lock:
+            if self._take():
+                return
+            self._enqueue(priority, waiter)
+        while True:
+            # Waiters wake when the next token is due and grant it to
+            # whoever is first in line, possibly another waiter
+            with self._lock:
+                self._grant()
+                if waiter.granted:
+                    return
+                delay = self._next_token_delay()
+            event.wait(delay)
+
+    async def aacquire(self, priority=0):
+        """
+        Wait on the running event loop until a token is granted.
+        """
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(None))
+
+        waiter = _Waiter(wake)
+        with self._lock:
+            if self._take():
+                return
+            self._enqueue(priority, waiter)
+        try:
+            while True:
+                with self._lock:
+                    self._grant()
+                    if waiter.granted:
+                        return
+                    delay = self._next_token_delay()
+                await asyncio.wait([granted], timeout=delay)
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter.granted:
+                    # Hand the unused token to the next waiter
+                    self._tokens += 1
+                    self._grant()
+                else:
+                    self._waiters = [entry for entry in self._waiters if entry[2] is not waiter]
+                    heapq.heapify(self._waiters)
+            raise
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _take(self) -> bool:
+        self._refill()
+        if self._waiters or self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def _enqueue(self, priority, waiter):
+        heapq.heappush(self._waiters, (priority, next(self._sequence), waiter))
+
+    def _grant(self):
+        self._refill()
+        while self._waiters and self._tokens >= 1:
+            _, _, waiter = heapq.heappop(self._waiters)
+            waiter.granted = True
+            self._tokens -= 1
+            waiter.wake()
+
+    def _next_token_delay(self) -> float:
+        return max(0.001, (1 - self._tokens) / self.rate)
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit adjusted by AIMD: +1 per limit's worth of successful
+    calls, halved on throttling (at most once per cooldown). Free slots go
+    to waiters in priority order (lower value first), FIFO within a
+    priority.
+    """
+
+    DECREASE_FACTOR = 0.5
+
+    def __init__(self, initial, minimum=1, maximum=32, cooldown=1.0):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+    @property
+    def waiting(self) -> int:
+        with self._lock:
+            return len(self._waiters)
+
+    def acquire(self, priority=0):
+        """
+        Block the calling thread until a slot is granted.
+        """
+        event = threading.Event()
+        with self._lock:
+            if self._has_free_slot():
+                self.in_flight += 1
+                return
+            self._enqueue(priority, _Waiter(event.set))
+        event.wait()
+
+    async def aacquire(self, priority=0):
+        """
+        Wait on the running event loop until a slot is granted.
+        """
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(None))
+
+        with self._lock:
+            if self._has_free_slot():
+                self.in_flight += 1
+                return
+            waiter = _Waiter(wake)
+            self._enqueue(priority, waiter)
+        try:
+            await granted
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter.granted:
+                    self._release()
+                else:
+                    self._waiters = [entry for entry in self._waiters if entry[2] is not waiter]
+                    heapq.heapify(self._waiters)
+            raise
+
+    def release(self):
+        with self._lock:
+            self._release()
+
+    def on_success(self):
+        with self._lock:
+            self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            self._grant()
+
+    def on_throttle(self):
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_decrease < self.cooldown:
+                return
+            self._last_decrease = now
+            self.limit = max(self.minimum, self.limit * self.DECREASE_FACTOR)
+
+    def _has_free_slot(self) -> bool:
+        return not self._waiters and self.in_flight < int(self.limit)
+
+    def _enqueue(self, priority, waiter):
+        heapq.heappush(self._waiters, (priority, next(self._sequence), waiter))
+
+    def _release(self):
+        self.in_flight -= 1
+        self._grant()
+
+    def _grant(self):
+        while self._waiters and self.in_flight < int(self.limit):
+            _, _, waiter = heapq.heappop(self._waiters)
+            waiter.granted = True
+            self.in_flight += 1
+            waiter.wake()
+
+
+class _ModelState:
+    def __init__(self, bucket, limiter):
+        self.bucket = bucket
+        self.limiter = limiter
+        self.calls = 0
+        self.retries = 0
+        self.throttled = 0
+        self.errors = 0
+
+
+class UpstreamGovernor:
+    """
+    Rate limits, concurrency limits and retries for calls to one upstream
+    API, tracked per model. Use call() from threads and acall() from
+    coroutines.
+    """
+
+    # Lower values are served first
+    PRIORITY_INTERACTIVE = 0
+    PRIORITY_DEFAULT = 5
+    PRIORITY_BACKGROUND = 10
+
+    def __init__(self, models=None, default_rpm=None, initial_concurrency=8, min_concurrency=1,
+                 max_concurrency=32, max_attempts=4, backoff_base=0.5, backoff_max=8.0):
+        self.models = models or {}
+        self.default_rpm = default_rpm
+        self.initial_concurrency = initial_concurrency
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def call(self, model, fn, /, *args, priority=PRIORITY_DEFAULT, **kwargs):
+        """
+        Run fn(*args, **kwargs) as a call to model once the limits allow it,
+        retrying retryable failures.
+
+        Args:
+            model (str): Model name the limits are tracked under
+            fn (callable): Makes the upstream call
+            priority (int): Lower values get tokens and free slots first
+
+        Returns:
+            The result of fn
+
+        Raises:
+            Exception: The last error once retries are exhausted, or the
+                first non-retryable error
+        """
+        state = self._state(model)
+        for attempt in range(1, self.max_attempts + 1):
+            # Wait for the rate limit before taking a concurrency slot, so
+            # slots are never held idle while a token is due
+            if state.bucket:
+                state.bucket.acquire(priority)
+            state.limiter.acquire(priority)
+            try:
+                self._count(state, 'calls')
+                with metrics.span(f"upstream.{model}"):
+                    result = fn(*args, **kwargs)
+            except Exception as e:
+                delay = self._on_error(state, model, e, attempt)
+            else:
+                state.limiter.on_success()
+                return result
+            finally:
+                state.limiter.release()
+            time.sleep(delay)
+
+    async def acall(self, model, fn, /, *args, priority=PRIORITY_DEFAULT, **kwargs):
+        """
+        Async variant of call for coroutine functions.
+        """
+        state = self._state(model)
+        for attempt in range(1, self.max_attempts + 1):
+            if state.bucket:
+                await state.bucket.aacquire(priority)
+            await state.limiter.aacquire(priority)
+            try:
+                self._count(state, 'calls')
+                with metrics.span(f"upstream.{model}"):
+                    result = await fn(*args, **kwargs)
+            except Exception as e:
+                delay = self._on_error(state, model, e, attempt)
+            else:
+                state.limiter.on_success()
+                return result
+            finally:
+                state.limiter.release()
+            await asyncio.sleep(delay)
+
+    def stats(self) -> dict:
+        """
+        Limits and counters per model.
+        """
+        with self._lock:
+            states = dict(self._states)
+        return {
+            model: {
+                'concurrency_limit': round(state.limiter.limit, 2),
+                'in_flight': state.limiter.in_flight,
+                'waiting': state.limiter.waiting,
+                'rate_limited': state.bucket.waiting if state.bucket else 0,
+                'calls': state.calls,
+                'retries': state.retries,
+                'throttled': state.throttled,
+                'errors': state.errors,
+            }
+            for model, state in states.items()
+        }
+
+    def _on_error(self, state, model, error, attempt) -> float:
+        """
+        Account for a failed attempt. Re-raises when the call should not be
+        retried, otherwise returns the backoff delay.
+        """
+        if is_throttle(error):
+            self._count(state, 'throttled')
+            state.limiter.on_throttle()
+        if attempt >= self.max_attempts or not is_retryable(error):
+            self._count(state, 'errors')
+            raise error
+        self._count(state, 'retries')
+        print(f"Retrying {model} call after error (attempt {attempt}): {error}")
+        # Full jitter keeps retrying callers from synchronizing
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+
+    def _count(self, state, counter):
+        with self._lock:
+            setattr(state, counter, getattr(state, counter) + 1)
+
+    def _state(self, model):
+        with self._lock:
+            state = self._states.get(model)
+            if state is None:
+                rpm = self.models.get(model, {}).get('RPM', self.default_rpm)
+                state = _ModelState(
+                    TokenBucket(rpm) if rpm else None,
+                    AdaptiveLimiter(
+                        self.initial_concurrency,
+                        minimum=self.min_concurrency,
+                        maximum=self.max_concurrency,
+                    ),
+                )
+                self._states[model] = state
+            return state
+
+
+_governor = None
+_governor_lock = threading.Lock()
+
+
+def get_governor():
+    """
+    Return the process-wide governor, created from settings.UPSTREAM_GOVERNOR
+    on first use.
+    """
+    global _governor
+    with _governor_lock:
+        if _governor is None:
+            from django.conf import settings
+            config = settings.UPSTREAM_GOVERNOR
+            _governor = UpstreamGovernor(
+                models=config['MODELS'],
+                default_rpm=config['DEFAULT_RPM'],
+                initial_concurrency=config['INITIAL_CONCURRENCY'],
+                min_concurrency=config['MIN_CONCURRENCY'],
+                max_concurrency=config['MAX_CONCURRENCY'],
+                max_attempts=config['MAX_ATTEMPTS'],
+                backoff_base=config['BACKOFF_BASE_SECONDS'],
+                backoff_max=config['BACKOFF_MAX_SECONDS'],
+            )
+        return _governor
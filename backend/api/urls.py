@@ -3,4 +3,13 @@ from . import views
 
 urlpatterns = [
     path('process/', views.process_text, name='process_text'),
+    path('process/batch/', views.process_text_batch, name='process_text_batch'),
+    path('process/async/', views.process_text_async, name='process_text_async'),
+    path('process/stream/', views.process_text_stream, name='process_text_stream'),
+    path('similarity/batch/', views.similarity_batch, name='similarity_batch'),
+    path('images/<str:job_id>/', views.image_job_status, name='image_job_status'),
+    path('ready/', views.readiness, name='readiness'),
+    path('metrics/', views.metrics_view, name='metrics'),
+    path('profiles/', views.profile_list, name='profile_list'),
+    path('profiles/<str:profile_id>/', views.profile_download, name='profile_download'),
 ]
\ No newline at end of file
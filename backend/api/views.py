@@ -1,143 +1,1243 @@
+import time
+
+_import_started = time.perf_counter()
+
 from rest_framework.decorators import api_view
-from django.http import JsonResponse
+from django.http import FileResponse, HttpResponse, JsonResponse
+from .services import metrics, model_registry, profiling
 from .services.text_similarity import TextSimilarity
 from .services.simplify_message import SimplifyMessage
 from .services.translate_message import TranslateMessage
 from .services.photos import PhotoExtractor
+from .services.background_loop import BackgroundLoop
+from .services.browser_pool import BrowserPool
+from .services.image_store import ImageStore
 from .services.rank_photos import PhotoRanker
-import asyncio
+from .services.jobs import JobManager, QueueFull
+from .services.single_flight import SingleFlight
+from .services.segments import SEGMENT_BOUNDARIES, aggregate_similarity, join_segments, split_segments
+from .services.response_cache import ResponseCache, normalize_message
+from .services.upstream import UpstreamGovernor, get_governor
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
 
+from django.http import StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from asgiref.sync import sync_to_async
 import html
 import json
-import os
+import asyncio
+import queue
 
 text_similarity = TextSimilarity()
 simplify_message = SimplifyMessage()
 translate_message = TranslateMessage()
-photo_extractor = PhotoExtractor()
-photo_ranker = PhotoRanker()
+image_store = ImageStore(
+    images_folder=settings.IMAGE_STORE['IMAGES_FOLDER'],
+    metadata_folder=settings.IMAGE_STORE['METADATA_FOLDER'],
+    max_bytes=settings.IMAGE_STORE['MAX_BYTES'],
+    manifest_ttl=settings.IMAGE_STORE['MANIFEST_TTL_SECONDS'],
+    sweep_interval=settings.IMAGE_STORE['SWEEP_INTERVAL_SECONDS'],
+)
+# Event loop shared by the browser pool, image downloads and photo ranking
+image_loop = BackgroundLoop('image-loop')
+photo_extractor = PhotoExtractor(image_store, browser_pool=BrowserPool(
+    max_contexts=settings.BROWSER_POOL['MAX_CONTEXTS'],
+    max_pages=settings.BROWSER_POOL['MAX_PAGES'],
+    max_context_uses=settings.BROWSER_POOL['MAX_CONTEXT_USES'],
+    max_context_age=settings.BROWSER_POOL['MAX_CONTEXT_AGE_SECONDS'],
+    background_loop=image_loop,
+))
+photo_ranker = PhotoRanker(image_store, image_loop, text_similarity=text_similarity)
 
-@api_view(['POST'])
-def process_text(request):
-    # Clear all images starting with 'image_' from assets/images folder
+image_jobs = JobManager(
+    max_workers=settings.IMAGE_JOB_WORKERS,
+    retention_seconds=settings.JOB_RETENTION_SECONDS,
+    name='image-job',
+    max_pending=settings.IMAGE_JOB_MAX_PENDING,
+)
+
+LEVELS = ['easy', 'intermediate', 'advanced']
+
+# Identical process requests in flight at the same time share one pipeline run
+process_flights = SingleFlight('process')
+
+# Processed segments of segmented requests, so re-submitting an edited
+# document only processes the segments that changed
+segment_cache = ResponseCache('segments')
+
+# Shared pool used to fan the simplification levels out concurrently. It is
+# shared across requests so the total number of in-flight level pipelines
+# stays bounded no matter how many requests arrive at once.
+level_executor = ThreadPoolExecutor(
+    max_workers=settings.PROCESS_LEVEL_WORKERS,
+    thread_name_prefix='process-level',
+)
+
+# Pool simplifying the messages of /api/process/batch/ requests
+batch_executor = ThreadPoolExecutor(
+    max_workers=settings.PROCESS_BATCH_WORKERS,
+    thread_name_prefix='process-batch',
+)
+
+# Pool running the LLM scores of /api/similarity/batch/ requests, kept small
+# and apart from level_executor so offline re-scoring never queues ahead of
+# live requests
+similarity_batch_executor = ThreadPoolExecutor(
+    max_workers=settings.SIMILARITY_BATCH_WORKERS,
+    thread_name_prefix='similarity-batch',
+)
+
+
+def warm_up():
+    """
+    Load every lazily created model and client up front so the first
+    request does not pay for it.
+
+    Returns:
+        dict: Startup-time report from the model registry
+    """
+    model_registry.set_warmup_state('warming')
     try:
-        images_folder = "../assets/images"  
+        text_similarity.encode(["warm up"])
+        simplify_message.gemini_model
+        text_similarity.gemini_model
+        translate_message.get_client()
+        photo_ranker.client
+        photo_extractor.browser_pool.run(photo_extractor.browser_pool.start())
+    except Exception:
+        model_registry.set_warmup_state('failed')
+        raise
+    model_registry.set_warmup_state('done')
+    return model_registry.startup_report()
+
+
+@api_view(['GET'])
+def readiness(request):
+    """
+    Report whether the server can take traffic, along with the
+    startup-time report. Returns 503 ('warming') only while warm_up is
+    loading the models; without warm-up (or after it failed) the models
+    load on the first request, so the server reports 'ready' straight away
+    and 'models_loaded' tells whether they have been loaded yet.
+    """
+    warming = model_registry.warmup_state() == 'warming'
+    return JsonResponse({
+        'status': 'warming' if warming else 'ready',
+        'models_loaded': text_similarity.is_loaded(),
+        'startup': model_registry.startup_report(),
+        'coalescing': process_flights.stats(),
+        'upstream': get_governor().stats(),
+        'profiling': profiling.get_profiler().stats(),
+    }, status=503 if warming else 200)
+
+
+def collect_service_metrics():
+    """
+    Metrics the services keep themselves, read when /api/metrics/ is scraped.
+    """
+    caches = [simplify_message.response_cache, translate_message.response_cache, segment_cache]
+    cache_stats = [cache.stats() for cache in caches]
+    description_stats = photo_ranker.description_cache.stats()
+    yield ('api_cache_lookups_total', 'counter', 'Response cache lookups by result.', [
+        *[
+            ({'cache': stats['namespace'], 'result': result}, stats[field])
+            for stats in cache_stats
+            for result, field in (('memory_hit', 'memory_hits'), ('durable_hit', 'durable_hits'), ('miss', 'misses'))
+        ],
+        ({'cache': 'image_descriptions', 'result': 'hit'}, description_stats['hits']),
+        ({'cache': 'image_descriptions', 'result': 'miss'}, description_stats['misses']),
+    ])
+    yield ('api_cache_evictions_total', 'counter', 'Response cache entries evicted, by tier.', [
+        ({'cache': stats['namespace'], 'tier': tier}, stats[f'{tier}_evictions'])
+        for stats in cache_stats
+        for tier in ('memory', 'durable')
+    ])
+    yield ('api_cache_hit_ratio', 'gauge', 'Share of cache lookups that were hits.', [
+        *[({'cache': stats['namespace']}, stats['hit_rate']) for stats in cache_stats],
+        ({'cache': 'image_descriptions'}, description_stats['hit_rate']),
+    ])
+
+    upstream = get_governor().stats()
+    for field, kind, documentation in (
+        ('calls', 'counter', 'Calls made to the upstream model, retries included.'),
+        ('retries', 'counter', 'Upstream calls retried after a retryable error.'),
+        ('throttled', 'counter', 'Upstream calls rejected for exceeding quota.'),
+        ('errors', 'counter', 'Upstream calls that failed after all retries.'),
+        ('in_flight', 'gauge', 'Upstream calls in flight.'),
+        ('waiting', 'gauge', 'Upstream calls waiting for a concurrency slot.'),
+        ('rate_limited', 'gauge', 'Upstream calls waiting for a rate limit token.'),
+        ('concurrency_limit', 'gauge', 'Current adaptive concurrency limit.'),
+    ):
+        suffix = '_total' if kind == 'counter' else ''
+        yield (f'api_upstream_{field}{suffix}', kind, documentation, [
+            ({'model': model}, stats[field]) for model, stats in upstream.items()
+        ])
+
+    flights = process_flights.stats()
+    yield ('api_coalesced_requests_total', 'counter', 'Process requests that joined an identical in-flight request.', [
+        ({}, flights['coalesced']),
+    ])
+    yield ('api_coalescing_in_flight', 'gauge', 'Distinct process requests in flight.', [
+        ({}, flights['in_flight']),
+    ])
+
+    jobs = image_jobs.stats()
+    yield ('api_image_jobs', 'gauge', 'Image jobs by status.', [
+        ({'status': 'pending'}, jobs['pending']),
+        ({'status': 'running'}, jobs['running']),
+    ])
+    yield ('api_image_jobs_deduplicated_total', 'counter', 'Image jobs shared with an earlier request for the same text.', [
+        ({}, jobs['deduplicated']),
+    ])
+    yield ('api_image_jobs_rejected_total', 'counter', 'Image jobs rejected because the queue was full.', [
+        ({}, jobs['rejected']),
+    ])
+
+
+metrics.register_collector(collect_service_metrics)
+
+
+@api_view(['GET'])
+def metrics_view(request):
+    """
+    Expose the service metrics in the Prometheus text format.
+    """
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def profiling_denied(request):
+    """
+    Returns:
+        JsonResponse: 404 unless the request carries the profiling token,
+            so profiles stay hidden from everyone else, None if allowed
+    """
+    if profiling.get_profiler().authorized(request):
+        return None
+    return JsonResponse({
+        'error': 'Not found',
+        'status': 'error'
+    }, status=404)
+
+
+@api_view(['GET'])
+def profile_list(request):
+    """
+    List the stored request profiles, newest first.
+    """
+    denied = profiling_denied(request)
+    if denied is not None:
+        return denied
+    return JsonResponse({
+        'profiles': profiling.get_profiler().list_profiles(),
+        'status': 'success'
+    })
+
+
+@api_view(['GET'])
+def profile_download(request, profile_id):
+    """
+    Download a stored request profile as a pstats file, or with
+    ?output=text as a pstats report (?sort=, ?limit= to adjust it).
+    """
+    denied = profiling_denied(request)
+    if denied is not None:
+        return denied
+    profiler = profiling.get_profiler()
+    if request.GET.get('output') == 'text':
         try:
-            for filename in os.listdir(images_folder):
-                if filename.startswith('image_'):
-                    file_path = os.path.join(images_folder, filename)
-                    os.remove(file_path)
-                    print(f"Removed: {filename}")
-        except Exception as e:
-            print(f"Error clearing images: {e}")
-        
-        data = json.loads(request.body)
-        original_text = data.get('text', '')
-        process_all_levels = data.get('process_all_levels', False)
-        target_language = data.get('language', 'en')
-        is_client_mode = data.get('is_client_mode', False)  # Get client mode flag
-        simplify_message.load_env()
-        
-        # If client mode is enabled, use client_to_doctor transformation instead
-        if is_client_mode:
-            # Use client-to-doctor transformation if available
-            client_text = simplify_message.client_to_doctor(original_text)
-            
-            # Translate to target language
-            os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = './api/hoo-hacks.json'
-            translated_text = translate_message.translate_text(client_text, target_language)
-            translated_text = html.unescape(translated_text)
-            
-            # Calculate similarity
-            similarity_score = text_similarity.calculate_combined_similarity(original_text, translated_text)
-            
-            # Format for client mode - use the same structure as expected by the app
+            limit = int(request.GET.get('limit', 50))
+            report = profiler.report(profile_id, sort=request.GET.get('sort', 'cumulative'), limit=limit)
+        except (KeyError, ValueError) as e:
             return JsonResponse({
-                'original_text': original_text,
-                'translations': [
-                    {
-                        'level': 'client',
-                        'translated_text': translated_text,
-                        'similarity_score': similarity_score,
-                        'target_language': target_language
-                    }
-                ],
-                'status': 'success'
-            })
-        
-        # For non-client mode, continue with existing code
-        # Extract simple idea for image search
+                'error': f"Invalid report options: {e}",
+                'status': 'error'
+            }, status=400)
+        if report is not None:
+            return HttpResponse(report, content_type='text/plain; charset=utf-8')
+    else:
+        path = profiler.profile_path(profile_id)
+        if path is not None:
+            return FileResponse(open(path, 'rb'), as_attachment=True, filename=f"{profile_id}.prof")
+    return JsonResponse({
+        'error': 'Unknown profile',
+        'status': 'error'
+    }, status=404)
+
+
+def scrape_images(original_text, simple_idea=None):
+    """
+    Background job: extract the condition from the text (unless the caller
+    already did), scrape images for it and rank them against the text. Runs
+    on the image job pool, off the request path.
+
+    Returns:
+        dict: Search query, manifest ID and metadata of the ranked images
+    """
+    if simple_idea is None:
         simple_idea = simplify_message.extract_idea(original_text)
+    scraped = photo_extractor.scrape(search_query=simple_idea, timeout_duration=10)
+    images = scraped['images']
+    if images:
+        try:
+            images = photo_ranker.rank(original_text, scraped['manifest_id'])
+        except Exception as e:
+            # Unranked images are still worth returning
+            print(f"Error ranking images: {e}")
+    return {
+        'search_query': simple_idea,
+        'manifest_id': scraped['manifest_id'],
+        'images': images,
+    }
+
+
+def submit_image_job(original_text, simple_idea=None):
+    """
+    Start scrape_images in the background, sharing the job of an earlier
+    request for the same text while it is still known.
+
+    Returns:
+        str: Image job ID, None when the image job queue is full (the
+            response is then sent without images rather than failing)
+    """
+    try:
+        return image_jobs.submit(scrape_images, original_text, simple_idea, job_key=original_text)
+    except QueueFull as e:
+        print(f"Skipping image job: {e}")
+        return None
+
+
+@api_view(['GET'])
+def image_job_status(request, job_id):
+    """
+    Return the status of an image scraping job, and its images once done.
+    """
+    job = image_jobs.get(job_id)
+    if job is None:
+        return JsonResponse({
+            'error': 'Unknown image job',
+            'status': 'error'
+        }, status=404)
+    return JsonResponse({
+        'job_id': job['job_id'],
+        'job_status': job['status'],
+        'result': job['result'],
+        'error': job['error'],
+        'status': 'success'
+    })
+
+
+def simplify_for_level(level, original_text, on_token=None):
+    """
+    Simplify the text with the prompt matching the requested level.
+    Unknown levels fall back to advanced, as the view always did.
+    """
+    if level == 'client':
+        return simplify_message.client_to_doctor(original_text, on_token=on_token)
+    elif level == 'easy':
+        return simplify_message.simplify_message_easy(original_text, on_token=on_token)
+    elif level == 'intermediate':
+        return simplify_message.simplify_message_intermediate(original_text, on_token=on_token)
+    else:  # advanced
+        return simplify_message.simplify_message_advanced(original_text, on_token=on_token)
+
+
+def process_level(level, original_text, target_language, policy=None):
+    """
+    Run the simplify -> translate -> similarity pipeline for a single level.
+
+    Args:
+        level (str): Simplification level ('easy', 'intermediate' or 'advanced')
+        original_text (str): Text sent by the clinician
+        target_language (str): Language code to translate into
+        policy (str, optional): Similarity scoring policy
+
+    Returns:
+        dict: Translation entry for the response
+    """
+    # Step 1: Simplify based on level
+    simplified_text = simplify_for_level(level, original_text)
+
+    # Step 2: Translate
+    translated_text = translate_message.translate_text(simplified_text, target_language)
+    translated_text = html.unescape(translated_text)
+
+    # Step 3: Calculate similarity
+    similarity = text_similarity.calculate_tiered_similarity(
+        original_text, translated_text, policy, target_language, source_text=simplified_text
+    )
+
+    return {
+        'level': level,
+        'translated_text': translated_text,
+        **similarity,
+        'target_language': target_language
+    }
+
+
+def process_levels_concurrently(levels, original_text, target_language, simplified=None, policy=None):
+    """
+    Run the levels through the pipeline at the same time. Simplification
+    and similarity fan out on the shared level pool, while translation of
+    all simplified texts goes upstream as a single batch request. A failure
+    in one level is reported in that level's entry only, the other levels
+    are still returned.
+
+    Args:
+        simplified (dict, optional): Already simplified texts by level
+            (e.g. from simplify_all_levels); only missing levels are simplified
+        policy (str, optional): Similarity scoring policy
+
+    Returns:
+        list: Translation entries in the same order as levels
+    """
+    policy = text_similarity.resolve_policy(policy)
+    errors = {}
+    simplified = {level: text for level, text in (simplified or {}).items() if level in levels}
+
+    # Step 1: Simplify every remaining level concurrently
+    simplify_futures = {
+        level: metrics.submit(level_executor, simplify_for_level, level, original_text)
+        for level in levels
+        if level not in simplified
+    }
+    for level, future in simplify_futures.items():
+        try:
+            simplified[level] = future.result()
+        except Exception as e:
+            errors[level] = e
+
+    # Step 2: Translate all simplified levels in one request
+    translated = {}
+    simplified_levels = [level for level in levels if level in simplified]
+    try:
+        batch = translate_message.translate_batch(
+            [simplified[level] for level in simplified_levels], target_language
+        )
+        for level, translated_text in zip(simplified_levels, batch):
+            translated[level] = html.unescape(translated_text)
+    except Exception as e:
+        for level in simplified_levels:
+            errors[level] = e
+
+    # Step 3: Calculate similarity. Embeddings for all levels are computed in
+    # one batch (against the simplified English, see embedding_reference),
+    # the LLM scores the policy asks for fan out concurrently
+    translated_levels = [level for level in levels if level in translated]
+    embedding_scores = {}
+    try:
+        scores = text_similarity.calculate_similarity_embeddings_batch(
+            original_text,
+            [
+                text_similarity.embedding_reference(translated[level], simplified[level], target_language)
+                for level in translated_levels
+            ],
+        )
+        embedding_scores = dict(zip(translated_levels, scores))
+    except Exception as e:
+        for level in translated_levels:
+            errors[level] = e
+    llm_futures = {
+        level: metrics.submit(
+            level_executor, text_similarity.calculate_similarity_llm, original_text, translated[level]
+        )
+        for level, score in embedding_scores.items()
+        if text_similarity.needs_llm(score, policy)
+    }
+
+    translations = []
+    for level in levels:
+        try:
+            if level in errors:
+                raise errors[level]
+            llm_score = llm_futures[level].result() if level in llm_futures else None
+            translations.append({
+                'level': level,
+                'translated_text': translated[level],
+                **text_similarity.scored(embedding_scores[level], llm_score),
+                'target_language': target_language
+            })
+        except Exception as e:
+            print(f"Error processing level {level}: {e}")
+            translations.append({
+                'level': level,
+                'error': str(e),
+                'status': 'error',
+                'target_language': target_language
+            })
+    return translations
+
+
+def process_request_key(data):
+    """
+    Identity of a process request for coalescing: identical text, language,
+    mode, level, similarity policy and segmenting produce the same response.
+
+    Returns:
+        tuple: (text, language, mode, level, similarity policy, segment unit)
+    """
+    segment_by = data.get('segment_by')
+    if segment_by is not None and segment_by not in SEGMENT_BOUNDARIES:
+        raise ValueError(
+            f"Unknown segment unit '{segment_by}', expected one of {', '.join(SEGMENT_BOUNDARIES)}"
+        )
+    if data.get('is_client_mode', False):
+        mode, level = 'client', 'client'
+    elif data.get('process_all_levels', False):
+        mode, level = 'all', None
+    else:
+        mode, level = 'single', data.get('level', 'easy')
+    return (
+        data.get('text', ''),
+        data.get('language', 'en'),
+        mode,
+        level,
+        text_similarity.resolve_policy(data.get('similarity_policy')),
+        segment_by,
+    )
+
+
+def run_process_text(original_text, target_language, mode, level, similarity_policy, segment_by=None):
+    """
+    Run the pipeline behind process_text and return the response body.
+    Concurrent identical requests share one run (see process_flights).
+
+    With segment_by ('sentence' or 'paragraph') the text is processed
+    segment by segment (see process_segmented) and the response always
+    carries a 'translations' list plus the per-segment 'segments'.
+    """
+    if segment_by:
+        levels = ['client'] if mode == 'client' else LEVELS if mode == 'all' else [level]
+        response = {'original_text': original_text, 'segment_by': segment_by}
+        if mode != 'client':
+            # Start image scraping in the background, clients poll /api/images/<job_id>/
+            response['image_job_id'] = submit_image_job(original_text)
+        response.update(process_segmented(original_text, target_language, levels, similarity_policy, segment_by))
+        response['status'] = 'success'
+        return response
+    
+    # If client mode is enabled, use client_to_doctor transformation instead
+    if mode == 'client':
+        # Use client-to-doctor transformation if available
+        client_text = simplify_message.client_to_doctor(original_text)
         
-        # Start image scraping in the background
-        asyncio.run(photo_extractor.scrape_google_images(search_query=simple_idea, timeout_duration=10))
+        # Translate to target language
+        translated_text = translate_message.translate_text(client_text, target_language)
+        translated_text = html.unescape(translated_text)
         
-        translations = []
+        # Calculate similarity
+        similarity = text_similarity.calculate_tiered_similarity(
+            original_text, translated_text, similarity_policy, target_language, source_text=client_text
+        )
         
-        # Process all levels if requested
-        if process_all_levels:
-            levels = ['easy', 'intermediate', 'advanced']
-            for level in levels:
-                # Step 1: Simplify based on level
-                if level == 'easy':
-                    simplified_text = simplify_message.simplify_message_easy(original_text)
-                elif level == 'intermediate':
-                    simplified_text = simplify_message.simplify_message_intermediate(original_text)
-                else:  # advanced
-                    simplified_text = simplify_message.simplify_message_advanced(original_text)
-                
-                # Step 2: Translate
-                os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = './api/hoo-hacks.json'
-                translated_text = translate_message.translate_text(simplified_text, target_language)
-                translated_text = html.unescape(translated_text)
-                
-                # Step 3: Calculate similarity
-                similarity_score = text_similarity.calculate_combined_similarity(original_text, translated_text)
-                
-                translations.append({
-                    'level': level,
+        # Format for client mode - use the same structure as expected by the app
+        return {
+            'original_text': original_text,
+            'translations': [
+                {
+                    'level': 'client',
                     'translated_text': translated_text,
-                    'similarity_score': similarity_score,
+                    **similarity,
                     'target_language': target_language
-                })
-            
-            return JsonResponse({
-                'original_text': original_text,
-                'translations': translations,
-                'status': 'success'
+                }
+            ],
+            'status': 'success'
+        }
+    
+    # For non-client mode, continue with existing code
+    # Start image scraping in the background, clients poll /api/images/<job_id>/
+    # Process all levels if requested
+    if mode == 'all':
+        simplified = None
+        simple_idea = None
+        if settings.SIMPLIFY_COMBINED_MODE:
+            # One Gemini call for the idea and all three levels
+            simplified = simplify_message.simplify_all_levels(original_text)
+            simple_idea = simplified.get('idea')
+        image_job_id = submit_image_job(original_text, simple_idea)
+        translations = process_levels_concurrently(
+            LEVELS, original_text, target_language,
+            simplified=simplified, policy=similarity_policy
+        )
+        
+        return {
+            'original_text': original_text,
+            'translations': translations,
+            'image_job_id': image_job_id,
+            'status': 'success'
+        }
+    
+    # Handle single level case (backwards compatibility)
+    image_job_id = submit_image_job(original_text)
+    result = process_level(level, original_text, target_language, similarity_policy)
+    
+    return {
+        'original_text': original_text,
+        'translated_text': result['translated_text'],
+        'similarity_score': result['similarity_score'],
+        'similarity_path': result['similarity_path'],
+        'level': level,
+        'target_language': target_language,
+        'image_job_id': image_job_id,
+        'status': 'success'
+    }
+
+
+@api_view(['POST'])
+def process_text(request):
+    try:
+        data = json.loads(request.body)
+        key = process_request_key(data)
+        return JsonResponse(process_flights.do(key, run_process_text, *key))
+    except Exception as e:
+        return JsonResponse({
+            'error': str(e),
+            'status': 'error'
+        }, status=400)
+
+
+def parse_json_object(request):
+    """
+    Parse a request body that must be a JSON object.
+
+    Raises:
+        ValueError: If the body is not valid JSON or not an object
+    """
+    data = json.loads(request.body)
+    if not isinstance(data, dict):
+        raise ValueError("Request body must be a JSON object")
+    return data
+
+
+def simplify_message_levels(message, levels):
+    """
+    Simplify one message for every requested level, with the combined
+    Gemini call when all levels are requested and combined mode is on.
+
+    Returns:
+        dict: Simplified text by level
+    """
+    if settings.SIMPLIFY_COMBINED_MODE and set(LEVELS) <= set(levels):
+        combined = simplify_message.simplify_all_levels(message)
+        simplified = {level: combined[level] for level in LEVELS if level in combined}
+    else:
+        simplified = {}
+    for level in levels:
+        if level not in simplified:
+            simplified[level] = simplify_for_level(level, message)
+    return simplified
+
+
+def process_batch(messages, target_language, levels, similarity_policy):
+    """
+    Run many messages through simplify -> translate -> similarity, one
+    stage at a time across all messages. Identical messages are processed
+    once. Simplification runs on batch_executor, every simplified text is
+    translated in one batch request and every similarity in vectorized
+    chunks. A failure is reported on the item (or level) it belongs to.
+
+    Args:
+        messages (list): Texts to process
+        target_language (str): Language code to translate into
+        levels (list): Levels to produce for every message
+        similarity_policy (str): Similarity scoring policy
+
+    Returns:
+        list: One result per message, in input order
+    """
+    unique = list(dict.fromkeys(messages))
+    errors = {}
+
+    # Step 1: Simplify every unique message, a bounded number at a time
+    futures = {
+        message: metrics.submit(batch_executor, simplify_message_levels, message, levels)
+        for message in unique
+    }
+    simplified = {}
+    for message, future in futures.items():
+        try:
+            simplified[message] = future.result()
+        except Exception as e:
+            print(f"Error simplifying batch message: {e}")
+            errors[message] = e
+
+    # Step 2: Translate every simplified text in one batch request
+    entries = [(message, level) for message in unique if message in simplified for level in levels]
+    translated = {}
+    try:
+        batch = translate_message.translate_batch(
+            [simplified[message][level] for message, level in entries], target_language
+        )
+        for entry, translated_text in zip(entries, batch):
+            translated[entry] = html.unescape(translated_text)
+    except Exception as e:
+        print(f"Error translating batch: {e}")
+        for message, _ in entries:
+            errors[message] = e
+
+    # Step 3: Score every (original, translation) pair in vectorized chunks
+    scored_entries = [entry for entry in entries if entry in translated]
+    scores = {}
+    try:
+        chunks = text_similarity.calculate_similarity_pairs(
+            [
+                (message, translated[(message, level)], simplified[message][level])
+                for message, level in scored_entries
+            ],
+            policy=similarity_policy,
+            llm_executor=batch_executor,
+            priority=UpstreamGovernor.PRIORITY_DEFAULT,
+            target_language=target_language,
+        )
+        results = [result for chunk in chunks for result in chunk]
+        scores = dict(zip(scored_entries, results))
+    except Exception as e:
+        print(f"Error scoring batch: {e}")
+        for message, _ in scored_entries:
+            errors[message] = e
+
+    items = {}
+    for message in unique:
+        if message in errors:
+            items[message] = {'error': str(errors[message]), 'status': 'error'}
+            continue
+        translations = []
+        for level in levels:
+            entry = {'level': level, 'target_language': target_language}
+            score = scores[(message, level)]
+            if 'error' in score:
+                entry.update(score)
+            else:
+                entry.update(translated_text=translated[(message, level)], **score)
+            translations.append(entry)
+        items[message] = {'translations': translations, 'status': 'success'}
+
+    return [
+        {'index': index, 'original_text': message, **items[message]}
+        for index, message in enumerate(messages)
+    ]
+
+
+def process_segmented(original_text, target_language, levels, similarity_policy, unit):
+    """
+    Process a long text segment by segment. The text is split into
+    sentences or paragraphs, segments already processed with the same
+    options are served from segment_cache, and only the remaining ones go
+    through process_batch (in parallel, one translate batch). The segments
+    are then reassembled per level with the original separators.
+
+    Args:
+        unit (str): 'sentence' or 'paragraph'
+
+    Returns:
+        dict: 'translations' (reassembled text and length-weighted
+            similarity per level) and 'segments' (per-segment results)
+    """
+    cores = []
+    layout = []
+    for segment, separator in split_segments(original_text, unit):
+        core = segment.strip()
+        # Whitespace around the segment stays where it was
+        prefix = segment[:len(segment) - len(segment.lstrip())]
+        suffix = segment[len(prefix) + len(core):] if core else ''
+        cores.append(core)
+        layout.append((prefix, suffix + separator))
+
+    def cache_key(core):
+        return segment_cache.make_key(
+            SimplifyMessage.PROMPT_VERSION,
+            normalize_message(core),
+            target_language,
+            levels,
+            similarity_policy,
+        )
+
+    results = {}
+    cached = set()
+    for core in dict.fromkeys(core for core in cores if core):
+        translations = segment_cache.get(cache_key(core))
+        if translations is not None:
+            results[core] = {'translations': translations, 'status': 'success'}
+            cached.add(core)
+
+    # Only new or edited segments are processed
+    missing = list(dict.fromkeys(core for core in cores if core and core not in results))
+    if missing:
+        for item in process_batch(missing, target_language, levels, similarity_policy):
+            core = item['original_text']
+            results[core] = item
+            translations = item.get('translations')
+            if translations and not any('error' in entry for entry in translations):
+                segment_cache.set(cache_key(core), translations)
+
+    segments = []
+    for index, core in enumerate(cores):
+        if not core:
+            continue
+        item = results[core]
+        segment = {'index': index, 'original_text': core, 'cached': core in cached}
+        if 'error' in item:
+            segment.update(error=item['error'], status='error')
+        else:
+            segment['translations'] = item['translations']
+        segments.append(segment)
+
+    translations = []
+    for position, level in enumerate(levels):
+        texts = []
+        scores = []
+        failed = []
+        for index, core in enumerate(cores):
+            prefix, _ = layout[index]
+            if not core:
+                texts.append(prefix)
+                scores.append(None)
+                continue
+            item = results[core]
+            # A segment that failed as a whole has no per-level entries
+            entry = item['translations'][position] if 'translations' in item else {}
+            if 'translated_text' not in entry:
+                failed.append(index)
+                texts.append(prefix + core)
+                scores.append(None)
+                continue
+            texts.append(prefix + entry['translated_text'])
+            scores.append(entry['similarity_score'])
+        if failed:
+            translations.append({
+                'level': level,
+                'error': f"{len(failed)} segment(s) failed",
+                'failed_segments': failed,
+                'status': 'error',
+                'target_language': target_language
             })
+            continue
+        translations.append({
+            'level': level,
+            'translated_text': join_segments(texts, [separator for _, separator in layout]),
+            'similarity_score': aggregate_similarity(cores, scores),
+            'similarity_path': 'segments',
+            'target_language': target_language
+        })
+
+    return {'translations': translations, 'segments': segments}
+
+
+@api_view(['POST'])
+def process_text_batch(request):
+    """
+    Process a list of messages (e.g. the sentences of a discharge summary)
+    in one request. Body: 'messages' plus the options of process_text
+    ('language', 'level', 'process_all_levels', 'is_client_mode',
+    'similarity_policy'). No images are scraped for batches.
+    """
+    try:
+        data = parse_json_object(request)
+        messages = data.get('messages')
+        if not isinstance(messages, list) or not all(isinstance(message, str) for message in messages):
+            raise ValueError("'messages' must be a list of texts")
+        if len(messages) > settings.PROCESS_BATCH_MAX_MESSAGES:
+            raise ValueError(f"At most {settings.PROCESS_BATCH_MAX_MESSAGES} messages per batch")
+        target_language = data.get('language', 'en')
+        similarity_policy = text_similarity.resolve_policy(data.get('similarity_policy'))
+        if data.get('is_client_mode', False):
+            levels = ['client']
+        elif data.get('process_all_levels', False):
+            levels = LEVELS
         else:
-            # Handle single level case (backwards compatibility)
-            level = data.get('level', 'easy')
-            # Step 1: Simplify based on level
-            simplify_message.load_env()
-            if level == 'easy':
-                simplified_text = simplify_message.simplify_message_easy(original_text)
-            elif level == 'intermediate':
-                simplified_text = simplify_message.simplify_message_intermediate(original_text)
-            else:  # advanced
-                simplified_text = simplify_message.simplify_message_advanced(original_text)
-            
-            # Step 2: Translate
-            os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = './api/hoo-hacks.json'
-            translated_text = translate_message.translate_text(simplified_text, target_language)
-            translated_text = html.unescape(translated_text)
-            
-            # Step 3: Calculate similarity
-            similarity_score = text_similarity.calculate_combined_similarity(original_text, translated_text)
-            
-            return JsonResponse({
-                'original_text': original_text,
-                'translated_text': translated_text,
-                'similarity_score': similarity_score,
+            levels = [data.get('level', 'easy')]
+    except ValueError as e:
+        return JsonResponse({
+            'error': str(e),
+            'status': 'error'
+        }, status=400)
+
+    try:
+        results = process_batch(messages, target_language, levels, similarity_policy)
+    except Exception as e:
+        return JsonResponse({
+            'error': str(e),
+            'status': 'error'
+        }, status=500)
+
+    return JsonResponse({
+        'results': results,
+        'unique_messages': len(set(messages)),
+        'status': 'success'
+    })
+
+
+SIMPLIFY_METHODS = {
+    'client': 'client_to_doctor',
+    'easy': 'simplify_message_easy',
+    'intermediate': 'simplify_message_intermediate',
+    'advanced': 'simplify_message_advanced',
+}
+
+
+async def process_levels_async(levels, original_text, target_language, simplified=None, policy=None):
+    """
+    Async version of process_levels_concurrently: simplification and the
+    LLM similarity calls run concurrently on the event loop, translation
+    goes out as one batch and the embedding pass runs on the embedding
+    executor. A failure in one level is reported in that level's entry only.
+
+    Args:
+        simplified (dict, optional): Already simplified texts by level;
+            only missing levels are simplified
+        policy (str, optional): Similarity scoring policy
+
+    Returns:
+        list: Translation entries in the same order as levels
+    """
+    errors = {}
+    simplified = {level: text for level, text in (simplified or {}).items() if level in levels}
+
+    async def simplify(level):
+        # Unknown levels fall back to advanced, as the view always did
+        method = SIMPLIFY_METHODS.get(level, 'simplify_message_advanced')
+        return await simplify_message.generate_async(method, original_text)
+
+    # Step 1: Simplify every remaining level concurrently
+    remaining = [level for level in levels if level not in simplified]
+    results = await asyncio.gather(*[simplify(level) for level in remaining], return_exceptions=True)
+    for level, result in zip(remaining, results):
+        if isinstance(result, Exception):
+            errors[level] = result
+        else:
+            simplified[level] = result
+
+    # Step 2: Translate all simplified levels in one request
+    translated = {}
+    simplified_levels = [level for level in levels if level in simplified]
+    try:
+        batch = await translate_message.translate_batch_async(
+            [simplified[level] for level in simplified_levels], target_language
+        )
+        for level, translated_text in zip(simplified_levels, batch):
+            translated[level] = html.unescape(translated_text)
+    except Exception as e:
+        for level in simplified_levels:
+            errors[level] = e
+
+    # Step 3: Embedding scores in one batch, the LLM scores the policy asks
+    # for concurrently
+    translated_levels = [level for level in levels if level in translated]
+    scores = {}
+    try:
+        results = await text_similarity.calculate_tiered_similarity_batch_async(
+            original_text, [translated[level] for level in translated_levels], policy, target_language,
+            sources=[simplified[level] for level in translated_levels],
+        )
+        scores = dict(zip(translated_levels, results))
+    except Exception as e:
+        for level in translated_levels:
+            errors[level] = e
+
+    translations = []
+    for level in levels:
+        if level not in errors and isinstance(scores[level], Exception):
+            errors[level] = scores[level]
+        if level in errors:
+            print(f"Error processing level {level}: {errors[level]}")
+            translations.append({
                 'level': level,
-                'target_language': target_language,
-                'status': 'success'
+                'error': str(errors[level]),
+                'status': 'error',
+                'target_language': target_language
             })
-            
+            continue
+        translations.append({
+            'level': level,
+            'translated_text': translated[level],
+            **scores[level],
+            'target_language': target_language
+        })
+    return translations
+
+
+async def run_process_text_async(original_text, target_language, mode, level, similarity_policy,
+                                 segment_by=None):
+    """
+    Async counterpart of run_process_text, returning the response body of
+    process_text_async. Concurrent identical requests share one run.
+    """
+    if segment_by:
+        # Segments fan out on the batch pool either way
+        return await sync_to_async(profiling.wrap(run_process_text), thread_sensitive=False)(
+            original_text, target_language, mode, level, similarity_policy, segment_by
+        )
+
+    if mode == 'client':
+        translations = await process_levels_async(
+            ['client'], original_text, target_language, policy=similarity_policy
+        )
+        if 'error' in translations[0]:
+            raise ValueError(translations[0]['error'])
+        return {
+            'original_text': original_text,
+            'translations': translations,
+            'status': 'success'
+        }
+
+    if mode == 'all':
+        simplified = None
+        simple_idea = None
+        if settings.SIMPLIFY_COMBINED_MODE:
+            # One Gemini call for the idea and all three levels
+            simplified = await simplify_message.simplify_all_levels_async(original_text)
+            simple_idea = simplified.get('idea')
+        # Start image scraping in the background, clients poll /api/images/<job_id>/
+        image_job_id = submit_image_job(original_text, simple_idea)
+        translations = await process_levels_async(
+            LEVELS, original_text, target_language,
+            simplified=simplified, policy=similarity_policy
+        )
+        return {
+            'original_text': original_text,
+            'translations': translations,
+            'image_job_id': image_job_id,
+            'status': 'success'
+        }
+
+    # Handle single level case (backwards compatibility)
+    image_job_id = submit_image_job(original_text)
+    result = (await process_levels_async(
+        [level], original_text, target_language, policy=similarity_policy
+    ))[0]
+    if 'error' in result:
+        raise ValueError(result['error'])
+    return {
+        'original_text': original_text,
+        'translated_text': result['translated_text'],
+        'similarity_score': result['similarity_score'],
+        'similarity_path': result['similarity_path'],
+        'level': level,
+        'target_language': target_language,
+        'image_job_id': image_job_id,
+        'status': 'success'
+    }
+
+
+@csrf_exempt
+@require_POST
+async def process_text_async(request):
+    """
+    Native async implementation of process_text for ASGI servers. Takes the
+    same body and returns the same responses, but never blocks a worker
+    thread while waiting on Gemini or Translate. Serve it from an ASGI
+    server (e.g. `uvicorn backend.asgi:application`) so the Gemini async
+    client stays on one long-lived event loop.
+    """
+    try:
+        data = json.loads(request.body)
+        key = process_request_key(data)
+        return JsonResponse(await process_flights.ado(key, run_process_text_async, *key))
     except Exception as e:
         return JsonResponse({
             'error': str(e),
             'status': 'error'
         }, status=400)
-        
+
+
+def stream_process_events(original_text, levels, target_language, stream_tokens=False, with_images=True,
+                          policy=None):
+    """
+    Run every level's pipeline concurrently and yield events as soon as each
+    step finishes, instead of waiting for the whole response.
+
+    Events (one dict each, keyed by 'event'):
+        idea         extracted idea and the image job started for it
+        token        chunk of simplified text (only with stream_tokens)
+        simplified   full simplified text of a level
+        translation  translated text of a level
+        similarity   similarity score of a level and the path that produced it
+        error        failure of one level (or of idea extraction)
+        done         always last
+    """
+    events = queue.Queue()
+    # Marks the end of one task
+    finished = object()
+
+    def emit(event, **payload):
+        events.put({'event': event, **payload})
+
+    def run_idea():
+        simple_idea = simplify_message.extract_idea(original_text)
+        image_job_id = submit_image_job(original_text, simple_idea)
+        emit('idea', idea=simple_idea, image_job_id=image_job_id)
+
+    def run_level(level):
+        def on_token(text):
+            emit('token', level=level, text=text)
+
+        simplified_text = simplify_for_level(
+            level, original_text, on_token=on_token if stream_tokens else None
+        )
+        emit('simplified', level=level, text=simplified_text)
+
+        translated_text = html.unescape(translate_message.translate_text(simplified_text, target_language))
+        emit('translation', level=level, translated_text=translated_text, target_language=target_language)
+
+        similarity = text_similarity.calculate_tiered_similarity(
+            original_text, translated_text, policy, target_language, source_text=simplified_text
+        )
+        emit('similarity', level=level, **similarity)
+
+    def run(task, level=None):
+        try:
+            if level is None:
+                task()
+            else:
+                task(level)
+        except Exception as e:
+            print(f"Error streaming {level or 'idea'}: {e}")
+            emit('error', level=level, error=str(e))
+        finally:
+            events.put(finished)
+
+    tasks = [(run_level, level) for level in levels]
+    if with_images:
+        tasks.insert(0, (run_idea, None))
+    for task, level in tasks:
+        metrics.submit(level_executor, run, task, level)
+
+    remaining = len(tasks)
+    while remaining:
+        event = events.get()
+        if event is finished:
+            remaining -= 1
+            continue
+        yield event
+    yield {'event': 'done'}
+
+
+@api_view(['POST'])
+def process_text_stream(request):
+    """
+    Streaming variant of process_text. Takes the same body plus an optional
+    'stream_tokens' flag and returns newline-delimited JSON events (see
+    stream_process_events) as each step of each level completes.
+    """
+    try:
+        data = parse_json_object(request)
+    except ValueError as e:
+        return JsonResponse({
+            'error': str(e),
+            'status': 'error'
+        }, status=400)
+
+    original_text = data.get('text', '')
+    target_language = data.get('language', 'en')
+    is_client_mode = data.get('is_client_mode', False)
+    try:
+        similarity_policy = text_similarity.resolve_policy(data.get('similarity_policy'))
+    except ValueError as e:
+        return JsonResponse({
+            'error': str(e),
+            'status': 'error'
+        }, status=400)
+
+    if is_client_mode:
+        levels = ['client']
+    elif data.get('process_all_levels', False):
+        levels = LEVELS
+    else:
+        levels = [data.get('level', 'easy')]
+
+    events = stream_process_events(
+        original_text,
+        levels,
+        target_language,
+        stream_tokens=data.get('stream_tokens', False),
+        with_images=not is_client_mode,
+        policy=similarity_policy,
+    )
+    response = StreamingHttpResponse(
+        (json.dumps(event) + "\n" for event in events),
+        content_type='application/x-ndjson',
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Stop proxies such as nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def parse_similarity_pairs(pairs, target_language=None):
+    """
+    Validate the 'pairs' of a batch similarity request. Each pair is either
+    [original, translated, source] or {'original': ..., 'translated': ...,
+    'source': ...}, where source is the English text the translation was
+    made from. It may only be left out when the translations are in English
+    (see TextSimilarity.embedding_reference).
+
+    Raises:
+        ValueError: If a pair is malformed or lacks a source it needs
+    """
+    if not isinstance(pairs, list):
+        raise ValueError("'pairs' must be a list")
+    needs_source = not text_similarity.same_language(target_language)
+    parsed = []
+    for position, pair in enumerate(pairs):
+        if isinstance(pair, dict):
+            pair = [pair.get('original'), pair.get('translated'), pair.get('source')]
+            if pair[-1] is None:
+                pair.pop()
+        if not isinstance(pair, (list, tuple)) or len(pair) not in (2, 3) or not all(isinstance(text, str) for text in pair):
+            raise ValueError(f"Pair {position} must hold an original and a translated text, and optionally a source")
+        if needs_source and len(pair) == 2:
+            raise ValueError(f"Pair {position} needs the source text its '{target_language}' translation was made from")
+        parsed.append(tuple(pair))
+    return parsed
+
+
+@api_view(['POST'])
+def similarity_batch(request):
+    """
+    Score many (original, translated) pairs without simplifying or
+    translating them again. Body: 'pairs', optional 'similarity_policy'
+    (defaults to 'fast', embeddings only), 'language' of the translated
+    texts (pairs need a source unless it is English) and 'chunk_size'
+    (capped at SIMILARITY_BATCH_MAX_CHUNK_SIZE). Results stream
+    back as newline-delimited JSON, one line per pair in input order, as
+    each chunk is scored.
+    """
+    try:
+        data = parse_json_object(request)
+        target_language = data.get('language')
+        pairs = parse_similarity_pairs(data.get('pairs'), target_language)
+        policy = text_similarity.resolve_policy(data.get('similarity_policy', 'fast'))
+        chunk_size = int(data.get('chunk_size') or TextSimilarity.PAIRS_CHUNK_SIZE)
+        if chunk_size < 1:
+            raise ValueError("'chunk_size' must be positive")
+        chunk_size = min(chunk_size, settings.SIMILARITY_BATCH_MAX_CHUNK_SIZE)
+    except (ValueError, TypeError) as e:
+        return JsonResponse({
+            'error': str(e),
+            'status': 'error'
+        }, status=400)
+
+    def lines():
+        index = 0
+        chunks = text_similarity.calculate_similarity_pairs(
+            pairs, policy=policy, chunk_size=chunk_size, llm_executor=similarity_batch_executor,
+            target_language=target_language,
+        )
+        try:
+            for results in chunks:
+                for result in results:
+                    yield json.dumps({'index': index, **result}) + "\n"
+                    index += 1
+        except Exception as e:
+            print(f"Error scoring similarity batch: {e}")
+            yield json.dumps({'event': 'error', 'error': str(e)}) + "\n"
+        yield json.dumps({'event': 'done', 'count': index}) + "\n"
+
+    response = StreamingHttpResponse(lines(), content_type='application/x-ndjson')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+model_registry.record_timing('import:api.views', time.perf_counter() - _import_started)
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -44,6 +45,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.timing_middleware',
+    'api.middleware.profiling_middleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -83,6 +86,12 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Cache writers from the worker pools wait for the write lock
+            # (taken up front) instead of failing with "database is locked"
+            'timeout': 20,
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 }
 
@@ -127,3 +136,132 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Number of worker threads used to run simplification levels concurrently
+# when a request asks for all levels (shared across requests)
+PROCESS_LEVEL_WORKERS = 9
+
+# Response cache for LLM calls: in-process LRU in front of the CacheEntry table
+RESPONSE_CACHE = {
+    'ENABLED': True,
+    'MEMORY_ENTRIES': 1024,
+    'TTL_SECONDS': 7 * 24 * 60 * 60,
+    'MAX_BYTES': 50 * 1024 * 1024,
+}
+
+# Service account used by the Google Translate client
+GOOGLE_APPLICATION_CREDENTIALS = str(BASE_DIR / 'api' / 'hoo-hacks.json')
+
+# Load models and SDK clients in a background thread when the app starts
+# (see also `manage.py warmup`). /api/ready/ returns 503 while warming up;
+# with this off it is ready at once and the first request loads the models
+WARMUP_ON_STARTUP = False
+
+# Embedding backend used by TextSimilarity: 'torch' (fp32), 'int8' (dynamic
+# int8 quantization, CPU) or 'onnx' (ONNX Runtime). Check drift against fp32
+# with `manage.py embedding_parity --backend int8`.
+EMBEDDING_BACKEND = 'torch'
+# Optional ONNX file inside the model repo, e.g. 'onnx/model_qint8_avx512_vnni.onnx'
+EMBEDDING_ONNX_FILE = None
+
+# Background image scraping jobs: worker threads and how long finished jobs
+# stay available at /api/images/<job_id>/
+IMAGE_JOB_WORKERS = 2
+JOB_RETENTION_SECONDS = 60 * 60
+# Image jobs allowed to wait for a worker; requests beyond that are answered
+# without an image job
+IMAGE_JOB_MAX_PENDING = 50
+
+# Shared headless Chromium used for image scraping
+BROWSER_POOL = {
+    'MAX_CONTEXTS': 4,
+    'MAX_PAGES': 4,
+    'MAX_CONTEXT_USES': 50,
+    'MAX_CONTEXT_AGE_SECONDS': 10 * 60,
+}
+
+# Content-addressed store for scraped images. Paths are relative to the
+# backend folder, as the Flutter app loads the images from ../assets.
+IMAGE_STORE = {
+    'IMAGES_FOLDER': '../assets/images',
+    'METADATA_FOLDER': '../assets/metadata',
+    'MAX_BYTES': 200 * 1024 * 1024,
+    'MANIFEST_TTL_SECONDS': 24 * 60 * 60,
+    'SWEEP_INTERVAL_SECONDS': 5 * 60,
+}
+
+# Threads running embedding forward passes for async views
+EMBEDDING_WORKERS = 2
+
+# Ask Gemini for the extracted idea and all three levels in one structured
+# call when all levels are requested (per-level calls fill invalid fields)
+SIMPLIFY_COMBINED_MODE = True
+
+# How similarity scores are produced. 'fast' uses embeddings only, 'full'
+# always adds a Gemini score, 'balanced' asks Gemini only when the embedding
+# cosine falls between the two thresholds. Requests may pick a policy with
+# 'similarity_policy'. The cosine is always between two English texts (the
+# original and the simplified text a translation was made from), so the
+# thresholds hold for every target language.
+SIMILARITY_POLICY = {
+    'DEFAULT': 'balanced',
+    'LOW_THRESHOLD': 0.35,
+    'HIGH_THRESHOLD': 0.85,
+}
+
+# Shared limits for every Gemini call (see api/services/upstream.py). Set
+# each model's RPM to the project's quota; models not listed use DEFAULT_RPM
+# (None means no rate limit, only the adaptive concurrency limit).
+UPSTREAM_GOVERNOR = {
+    'MODELS': {
+        'gemini-2.0-flash': {'RPM': 2000},
+        'gemini-2.0-flash-exp-image-generation': {'RPM': 10},
+    },
+    'DEFAULT_RPM': None,
+    'INITIAL_CONCURRENCY': 8,
+    'MIN_CONCURRENCY': 1,
+    'MAX_CONCURRENCY': 32,
+    'MAX_ATTEMPTS': 4,
+    'BACKOFF_BASE_SECONDS': 0.5,
+    'BACKOFF_MAX_SECONDS': 8,
+}
+
+# /api/process/batch/: most messages per request, and threads simplifying
+# messages at once (kept apart from PROCESS_LEVEL_WORKERS so a large
+# document does not starve single requests)
+PROCESS_BATCH_MAX_MESSAGES = 200
+PROCESS_BATCH_WORKERS = 4
+
+# /api/similarity/batch/: largest chunk scored at once (bounds the memory of
+# a chunk and the LLM calls it queues), and threads running its LLM scores
+SIMILARITY_BATCH_MAX_CHUNK_SIZE = 512
+SIMILARITY_BATCH_WORKERS = 2
+
+# Per-request timing lines from api.middleware.timing_middleware
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'api.timing': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
+# On-demand request profiling (api/services/profiling.py). Requests sending
+# TOKEN in HEADER are profiled, as is a SAMPLE_RATE fraction of all requests;
+# the pstats files are listed and downloaded from /api/profiles/ with the
+# same header. Without a token, profiles can only be sampled.
+REQUEST_PROFILING = {
+    'TOKEN': os.getenv('PROFILING_TOKEN'),
+    'HEADER': 'X-Profile-Token',
+    'SAMPLE_RATE': float(os.getenv('PROFILING_SAMPLE_RATE', '0')),
+    'DIRECTORY': BASE_DIR / 'profiles',
+    'MAX_PROFILES': 50,
+}
+
+# Connections kept alive per host by the shared Translate client's HTTP
+# session (api/services/clients.py); at least the number of threads that
+# translate at once
+UPSTREAM_HTTP_POOL_SIZE = 32
@@ -1,16 +1,18 @@
 import 'package:flutter/material.dart';
 import 'dart:async';
-import 'dart:convert';
-import 'package:flutter/services.dart';
+import '../services/text_processing_service.dart';
 
 class FiguresSection extends StatefulWidget {
   final bool hasTranslation;
   final bool isProcessing;
+  // Image job started by the last processing request
+  final String? imageJobId;
   
   const FiguresSection({
     super.key,
     this.hasTranslation = false,
     this.isProcessing = false,
+    this.imageJobId,
   });
 
   @override
@@ -19,6 +21,7 @@ class FiguresSection extends StatefulWidget {
 
 class _FiguresSectionState extends State<FiguresSection> {
   final ScrollController _scrollController = ScrollController();
+  final TextProcessingService _textService = TextProcessingService();
   List<Map<String, dynamic>> figures = [];
   Timer? _checkImagesTimer;
 
@@ -30,10 +33,14 @@ class _FiguresSectionState extends State<FiguresSection> {
   @override
   void didUpdateWidget(FiguresSection oldWidget) {
     super.didUpdateWidget(oldWidget);
-    // Start or stop checking for images based on hasTranslation
-    if (widget.hasTranslation && !oldWidget.hasTranslation) {
+    // Poll the image job of each new translation, stop when there is none
+    if (widget.imageJobId != oldWidget.imageJobId) {
+      _stopCheckingImages();
+      figures = [];
+    }
+    if (widget.hasTranslation && widget.imageJobId != null && _checkImagesTimer == null) {
       _startCheckingImages();
-    } else if (!widget.hasTranslation && oldWidget.hasTranslation) {
+    } else if (!widget.hasTranslation) {
       _stopCheckingImages();
     }
   }
@@ -47,6 +54,7 @@ class _FiguresSectionState extends State<FiguresSection> {
 
   void _stopCheckingImages() {
     _checkImagesTimer?.cancel();
+    _checkImagesTimer = null;
   }
 
   @override
@@ -57,23 +65,33 @@ class _FiguresSectionState extends State<FiguresSection> {
   }
 
   Future<void> checkForImages() async {
+    final jobId = widget.imageJobId;
+    if (jobId == null) return;
     try {
-      // Load the metadata file
-      final String jsonString = await rootBundle.loadString('assets/metadata/google_images_data.json');
-      final List<dynamic> imageData = json.decode(jsonString);
-      
+      final job = await _textService.fetchImageJob(jobId);
+      // The widget moved on to another job while this one was fetched
+      if (!mounted || jobId != widget.imageJobId) return;
+      if (job == null || job['job_status'] == 'error') {
+        _stopCheckingImages();
+        return;
+      }
+      if (job['job_status'] != 'done') return;
+      _stopCheckingImages();
+
+      final List<dynamic> imageData = job['result']?['images'] ?? [];
       // Convert the data to our figures format - removing caption and similarity score
-      List<Map<String, dynamic>> newFigures = imageData.map((data) => {
-        'id': data['image_file'].split('_')[1].split('.')[0],
-        'src': data['image_file'],
+      List<Map<String, dynamic>> newFigures = imageData.map((data) {
+        // Stored as <images folder>/image_<sha256>.jpg, bundled under assets/images
+        final String name = data['image_file'].split('/').last;
+        return {
+          'id': name.split('_')[1].split('.')[0],
+          'src': 'assets/images/$name',
+        };
       }).toList();
 
-      // Update state if we have new figures
-      if (newFigures.isNotEmpty) {
-        setState(() {
-          figures = newFigures;
-        });
-      }
+      setState(() {
+        figures = newFigures;
+      });
     } catch (e) {
       print('Error loading images: $e');
     }
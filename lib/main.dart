@@ -53,6 +53,7 @@ class _MyHomePageState extends State<MyHomePage> {
   bool _isListening = false;
   String _text = 'Press the button and start speaking';
   List<Map<String, dynamic>> _translations = [];
+  String? _imageJobId;
   bool _speechEnabled = false;
   bool _isProcessing = false;
   String _selectedLanguageCode = 'en';
@@ -77,31 +78,64 @@ class _MyHomePageState extends State<MyHomePage> {
     setState(() {});
   }
 
+  // Order of the translation cards, whatever order the levels finish in
+  static const List<String> _levelOrder = ['easy', 'intermediate', 'advanced'];
+
   Future<void> _processText(String text) async {
+    // Filled in as levels finish; a new list per request so a newer request
+    // can tell this one apart and earlier results stay in the history
+    final translations = <Map<String, dynamic>>[];
+    final pending = <String, Map<String, dynamic>>{};
     setState(() {
       _isProcessing = true;
       _text = text;
+      _translations = translations;
+      _imageJobId = null;
     });
 
     try {
-      final result = await _textService.processText(
+      await for (final event in _textService.processTextStream(
         text,
         languageCode: _selectedLanguageCode,
-      );
-      
-      setState(() {
-        _isProcessing = false;
-        if (result['status'] == 'success') {
-          _translations = List<Map<String, dynamic>>.from(result['translations']);
-        } else {
-          _translations = [];
+      )) {
+        // A newer request replaced this one, stop listening to it
+        if (!identical(translations, _translations)) return;
+        switch (event['event']) {
+          case 'idea':
+            setState(() {
+              _imageJobId = event['image_job_id'];
+            });
+            break;
+          case 'translation':
+            pending[event['level']] = {
+              'level': event['level'],
+              'translated_text': event['translated_text'],
+              'target_language': event['target_language'],
+            };
+            break;
+          case 'similarity':
+            final translation = pending.remove(event['level']);
+            if (translation == null) break;
+            translation['similarity_score'] = event['similarity_score'];
+            setState(() {
+              // Show each level as soon as it is scored
+              translations.add(translation);
+              translations.sort((a, b) =>
+                  _levelOrder.indexOf(a['level']).compareTo(_levelOrder.indexOf(b['level'])));
+              _isProcessing = false;
+            });
+            break;
+          case 'error':
+            print('Error processing text: ${event['error']}');
+            break;
         }
-      });
+      }
     } catch (e) {
       print('Error processing text: $e');
+    }
+    if (identical(translations, _translations)) {
       setState(() {
         _isProcessing = false;
-        _translations = [];
       });
     }
   }
@@ -207,6 +241,7 @@ class _MyHomePageState extends State<MyHomePage> {
                 key: _figuresKey,
                 hasTranslation: _translations.isNotEmpty,
                 isProcessing: _isProcessing,
+                imageJobId: _imageJobId,
               ),
               AboutSection(
                 key: _aboutKey,
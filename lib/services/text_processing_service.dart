@@ -46,6 +46,7 @@ class TextProcessingService {
           return {
             'status': 'success',
             'translations': data['translations'] ?? [],
+            'image_job_id': data['image_job_id'],
           };
         }
       } else {
@@ -64,4 +65,74 @@ class TextProcessingService {
       };
     }
   }
-}
\ No newline at end of file
+
+  /// Fetches the image scraping job started by a processing request.
+  ///
+  /// Returns the `/api/images/<job_id>/` body: `job_status` is `pending`,
+  /// `running`, `done` or `error`, and `result['images']` holds the ranked
+  /// images once done. Returns null when the job is unknown or expired.
+  Future<Map<String, dynamic>?> fetchImageJob(String jobId) async {
+    try {
+      final response = await http.get(Uri.parse('$baseUrl/api/images/$jobId/'));
+      if (response.statusCode != 200) {
+        print('API Error - Status Code: ${response.statusCode}');
+        return null;
+      }
+      return jsonDecode(response.body) as Map<String, dynamic>;
+    } catch (e) {
+      print('Error fetching images: $e');
+      return null;
+    }
+  }
+
+  /// Streams processing events from `/api/process/stream/` as they are
+  /// produced, so each level can be shown as soon as it is ready.
+  ///
+  /// Every event is a map with an `event` key: `idea`, `token`, `simplified`,
+  /// `translation`, `similarity`, `error` or `done`.
+  Stream<Map<String, dynamic>> processTextStream(
+    String text, {
+    String languageCode = 'en',
+    bool isClientMode = false,
+    bool streamTokens = false,
+  }) async* {
+    final client = http.Client();
+    try {
+      final request = http.Request('POST', Uri.parse('$baseUrl/api/process/stream/'))
+        ..headers['Content-Type'] = 'application/json'
+        ..body = jsonEncode({
+          'text': text,
+          'process_all_levels': !isClientMode,
+          'language': languageCode,
+          'is_client_mode': isClientMode,
+          'stream_tokens': streamTokens,
+        });
+
+      final response = await client.send(request);
+      if (response.statusCode != 200) {
+        print('API Error - Status Code: ${response.statusCode}');
+        yield {
+          'event': 'error',
+          'error': 'Failed to process text',
+        };
+        return;
+      }
+
+      final lines = response.stream
+          .transform(utf8.decoder)
+          .transform(const LineSplitter());
+      await for (final line in lines) {
+        if (line.trim().isEmpty) continue;
+        yield jsonDecode(line) as Map<String, dynamic>;
+      }
+    } catch (e) {
+      print('Error streaming text: $e');
+      yield {
+        'event': 'error',
+        'error': e.toString(),
+      };
+    } finally {
+      client.close();
+    }
+  }
+}